@@ -0,0 +1,130 @@
+import time
+import asyncio
+import secrets
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+from config import (
+    ADMISSION_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_HOLD_SECONDS
+)
+from metrics import get_recorder
+
+# ----------------------------
+# 매장별 체크인 입장 제어 (동시 처리 제한 + FIFO 대기열)
+# ----------------------------
+# 매장마다 동시에 처리되는 체크인 수를 ADMISSION_CONCURRENCY로 제한한다.
+# 자리가 없으면 대기표(ticket)를 발급하고 FIFO 순서로 자리를 배정한다.
+# 요청은 최대 ADMISSION_HOLD_SECONDS 동안 기다리다가, 그래도 차례가 오지 않으면
+# 대기 순번과 함께 돌려보내고 클라이언트는 같은 대기표로 다시 요청한다.
+# 대기열이 ADMISSION_MAX_QUEUE를 넘으면 새 요청은 바로 거절(load shedding)한다.
+
+TICKET_TTL_SECONDS = 15   # 대기 중 이 시간 동안 재요청이 없으면 대기열에서 제거
+GRANT_TTL_SECONDS = 10    # 자리를 배정받고 이 시간 안에 재요청이 없으면 자리 반납
+
+class StoreAdmission:
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.reserved: Dict[str, float] = {}
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.service_ms = 0.0  # 처리 시간 이동 평균 (예상 대기 시간 계산용)
+
+    def _prune(self, now: float):
+        stale = [t for t, e in self.waiting.items() if now - e["seen"] > TICKET_TTL_SECONDS]
+        for t in stale:
+            del self.waiting[t]
+
+        expired = [t for t, ts in self.reserved.items() if now - ts > GRANT_TTL_SECONDS]
+        for t in expired:
+            del self.reserved[t]
+            self.active -= 1
+
+    def _dispatch(self):
+        now = time.monotonic()
+        self._prune(now)
+        while self.active < self.limit and self.waiting:
+            ticket, entry = self.waiting.popitem(last=False)
+            self.active += 1
+            self.reserved[ticket] = now
+            entry["event"].set()
+
+    def position(self, ticket: str) -> int:
+        for i, t in enumerate(self.waiting):
+            if t == ticket:
+                return i + 1
+        return 0
+
+    def eta_seconds(self, position: int) -> int:
+        per_slot = (self.service_ms or 500.0) / 1000
+        return max(1, int(per_slot * position / max(1, self.limit)) + 1)
+
+    async def acquire(self, ticket: Optional[str]) -> Tuple[str, Optional[str], int]:
+        """("admitted" | "queued" | "shed", ticket, 대기 순번)"""
+        now = time.monotonic()
+        self._dispatch()
+
+        # 이미 자리를 배정받은 대기표
+        if ticket and ticket in self.reserved:
+            del self.reserved[ticket]
+            self.admitted += 1
+            return "admitted", ticket, 0
+
+        entry = self.waiting.get(ticket) if ticket else None
+        if entry:
+            entry["seen"] = now
+        else:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                get_recorder("admission_wait").record(0)
+                return "admitted", None, 0
+
+            if len(self.waiting) >= self.max_queue:
+                self.shed += 1
+                return "shed", None, 0
+
+            ticket = secrets.token_urlsafe(8)
+            entry = {"seen": now, "enqueued": now, "event": asyncio.Event()}
+            self.waiting[ticket] = entry
+            self.queued += 1
+
+        try:
+            await asyncio.wait_for(entry["event"].wait(), timeout=ADMISSION_HOLD_SECONDS)
+        except asyncio.TimeoutError:
+            return "queued", ticket, self.position(ticket)
+
+        if self.reserved.pop(ticket, None) is None:
+            # 같은 대기표의 다른 요청이 이미 자리를 가져감
+            return "queued", ticket, 0
+        self.admitted += 1
+        get_recorder("admission_wait").record((time.monotonic() - entry["enqueued"]) * 1000)
+        return "admitted", ticket, 0
+
+    def release(self, elapsed_ms: float):
+        self.active -= 1
+        self.service_ms = elapsed_ms if not self.service_ms else self.service_ms * 0.9 + elapsed_ms * 0.1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": len(self.waiting),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "avg_service_ms": round(self.service_ms, 1),
+        }
+
+_controllers: Dict[str, StoreAdmission] = {}
+
+def get_controller(store_code: str) -> StoreAdmission:
+    if store_code not in _controllers:
+        _controllers[store_code] = StoreAdmission(ADMISSION_CONCURRENCY, ADMISSION_MAX_QUEUE)
+    return _controllers[store_code]
+
+def get_admission_stats() -> Dict[str, Any]:
+    return {code: c.stats() for code, c in _controllers.items()}
@@ -0,0 +1,345 @@
+import sys
+import time
+from datetime import date, timedelta
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from database import load_visits, _guild_file, _file_mtime, _export_gids, _today_kst
+
+# ----------------------------
+# 시간대 분석 (요일 × 시간 히트맵, 피크 시간, 기간 비교)
+# ----------------------------
+# 서버별 방문 기록을 열(column) 배열로 한 번 바꿔 두고 NumPy로 계산한다.
+#   day   : 방문 날짜 (1970-01-01부터 일수, int32)
+#   sec   : 하루 중 초 (0~86399, int32)
+#   store : 매장 번호 (codes 목록 위치, int32)
+#   user  : 유저 ID (int64)
+# 배열은 (day, sec) 순으로 정렬해 기간은 searchsorted로 자르고, 집계는 bincount로 한다.
+# 열 배열은 visits.json mtime이 바뀔 때만 다시 만든다.
+WEEKDAYS = ["월", "화", "수", "목", "금", "토", "일"]
+DEFAULT_HEATMAP_DAYS = 28   # 요일마다 4번씩
+DEFAULT_COMPARE_DAYS = 7
+PEAK_TOP_HOURS = 3
+PEAK_WINDOW_HOURS = 3
+MAX_PERIOD_DAYS = 366       # 한 번에 분석하는 최대 기간 (히트맵 계산 배열 = 일수 × 24)
+
+class PeriodError(ValueError):
+    """분석 기간이 잘못됨 (메시지는 그대로 API 오류로 보여줌)"""
+
+_columns: Dict[str, tuple] = {}   # 서버 ID → (visits mtime, 열 배열)
+
+def _empty_columns() -> Dict[str, Any]:
+    return {
+        "codes": [],
+        "day": np.zeros(0, np.int32),
+        "sec": np.zeros(0, np.int32),
+        "store": np.zeros(0, np.int32),
+        "user": np.zeros(0, np.int64),
+    }
+
+def _parse_stamps(stamps: List[str]) -> np.ndarray:
+    """'YYYY-MM-DDTHH:MM:SS' 목록 → 초 단위 datetime64 (형식이 틀린 값은 NaT)"""
+    try:
+        return np.array(stamps, dtype="datetime64[s]")
+    except ValueError:
+        result = np.empty(len(stamps), dtype="datetime64[s]")
+        for i, stamp in enumerate(stamps):
+            try:
+                result[i] = np.datetime64(stamp, "s")
+            except ValueError:
+                result[i] = np.datetime64("NaT")
+        return result
+
+def build_columns(visits: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """{매장 코드: [방문]} → 열 배열 (날짜/시각은 저장된 KST visit_date, visit_time 기준)"""
+    codes = [code for code, rows in visits.items() if rows]
+    if not codes:
+        return _empty_columns()
+
+    stamps = []
+    users = []
+    for code in codes:
+        rows = visits[code]
+        stamps.extend(f"{v.get('visit_date', '')}T{v.get('visit_time') or '00:00:00'}" for v in rows)
+        users.extend(int(v.get("user_id") or 0) for v in rows)
+
+    seconds = _parse_stamps(stamps).astype(np.int64)
+    store = np.repeat(np.arange(len(codes), dtype=np.int32), [len(visits[code]) for code in codes])
+    user = np.array(users, dtype=np.int64)
+
+    valid = seconds != np.iinfo(np.int64).min   # NaT 제외
+    if not valid.all():
+        seconds, store, user = seconds[valid], store[valid], user[valid]
+
+    order = np.argsort(seconds, kind="stable")
+    seconds = seconds[order]
+    return {
+        "codes": codes,
+        "day": (seconds // 86400).astype(np.int32),
+        "sec": (seconds % 86400).astype(np.int32),
+        "store": store[order],
+        "user": user[order],
+    }
+
+def visit_columns(gid: str) -> Dict[str, Any]:
+    """서버의 열 배열 (visits.json이 바뀌었으면 다시 만듦)"""
+    mtime = _file_mtime(_guild_file(gid, "visits.json"))
+    cached = _columns.get(gid)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    columns = build_columns(load_visits(gid))
+    _columns[gid] = (mtime, columns)
+    return columns
+
+def day_number(value: date) -> int:
+    return (value - date(1970, 1, 1)).days
+
+def day_date(number: int) -> date:
+    return date(1970, 1, 1) + timedelta(days=int(number))
+
+def select(columns: Dict[str, Any], start_day: int, end_day: int, store_code: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """기간(양 끝 포함)과 매장으로 자른 day/sec/user 배열"""
+    # 찾는 값을 같은 dtype으로 넘겨야 배열 전체 형변환이 없음
+    lo, hi = np.searchsorted(columns["day"], np.array([start_day, end_day + 1], dtype=columns["day"].dtype))
+    day = columns["day"][lo:hi]
+    sec = columns["sec"][lo:hi]
+    user = columns["user"][lo:hi]
+    if store_code is not None:
+        if store_code not in columns["codes"]:
+            return {"day": day[:0], "sec": sec[:0], "user": user[:0]}
+        mask = columns["store"][lo:hi] == columns["codes"].index(store_code)
+        day, sec, user = day[mask], sec[mask], user[mask]
+    return {"day": day, "sec": sec, "user": user}
+
+def _selection(guild_id, store_code: Optional[str], start_day: int, end_day: int) -> Dict[str, np.ndarray]:
+    parts = [select(visit_columns(gid), start_day, end_day, store_code) for gid in _export_gids(guild_id, store_code)]
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([p[name] for p in parts]) for name in ("day", "sec", "user")}
+
+def _period(start_date: Optional[str], end_date: Optional[str], default_days: int, compare: bool = False) -> tuple:
+    """(시작 일수, 끝 일수). 끝 기본값은 오늘, 시작 기본값은 끝에서 default_days일.
+    MAX_PERIOD_DAYS보다 길거나 (compare면) 앞 기간이 날짜 범위를 벗어나면 PeriodError"""
+    end = date.fromisoformat(end_date) if end_date else _today_kst()
+    if start_date:
+        start = min(date.fromisoformat(start_date), end)
+    else:
+        start = end - timedelta(days=min(default_days - 1, (end - date.min).days))
+    length = (end - start).days + 1
+    if length > MAX_PERIOD_DAYS:
+        raise PeriodError(f"기간은 최대 {MAX_PERIOD_DAYS}일까지 조회할 수 있습니다.")
+    if compare and (start - date.min).days < length:
+        raise PeriodError("비교할 이전 기간이 날짜 범위를 벗어납니다.")
+    return day_number(start), day_number(end)
+
+def _weekday(day: np.ndarray) -> np.ndarray:
+    """월요일 0 ~ 일요일 6 (1970-01-01은 목요일)"""
+    return (day + 3) % 7
+
+# ----------------------------
+# 계산 (선택된 배열 기준)
+# ----------------------------
+def heatmap_counts(day: np.ndarray, sec: np.ndarray, start_day: int, end_day: int) -> np.ndarray:
+    """7 × 24 방문 수 (요일 × 시간). 날짜 × 시간으로 센 뒤 요일로 접어 큰 배열의 나머지 연산을 피함"""
+    matrix = np.zeros((7, 24), np.int64)
+    if not day.size:
+        return matrix
+    span = end_day - start_day + 1
+    per_day = np.bincount((day - start_day) * 24 + sec // 3600, minlength=span * 24).reshape(span, 24)
+    np.add.at(matrix, _weekday(np.arange(start_day, end_day + 1)), per_day)
+    return matrix
+
+def weekday_occurrences(start_day: int, end_day: int) -> np.ndarray:
+    """기간 안의 요일별 날짜 수"""
+    if end_day < start_day:
+        return np.zeros(7, np.int64)
+    return np.bincount(_weekday(np.arange(start_day, end_day + 1)), minlength=7)
+
+def heatmap_result(sel: Dict[str, np.ndarray], start_day: int, end_day: int) -> Dict[str, Any]:
+    matrix = heatmap_counts(sel["day"], sel["sec"], start_day, end_day)
+    totals = matrix.sum(axis=1)
+    days = weekday_occurrences(start_day, end_day)
+    averages = np.divide(totals, days, out=np.zeros(7), where=days > 0)
+    return {
+        "start_date": day_date(start_day).isoformat(),
+        "end_date": day_date(end_day).isoformat(),
+        "total": int(totals.sum()),
+        "weekdays": WEEKDAYS,
+        "matrix": matrix.tolist(),
+        "weekday_totals": totals.tolist(),
+        "weekday_days": days.tolist(),
+        "weekday_averages": np.round(averages, 2).tolist(),
+    }
+
+def peaks_result(sel: Dict[str, np.ndarray], start_day: int, end_day: int, top: int = PEAK_TOP_HOURS) -> Dict[str, Any]:
+    matrix = heatmap_counts(sel["day"], sel["sec"], start_day, end_day)
+    hourly = matrix.sum(axis=0)
+    total = int(hourly.sum())
+
+    # 방문 수 내림차순, 같으면 이른 시간 먼저
+    order = np.lexsort((np.arange(24), -hourly))[:top]
+    peaks = [
+        {"hour": int(h), "count": int(hourly[h]), "share": round(float(hourly[h]) / total, 4) if total else 0.0}
+        for h in order if hourly[h] > 0
+    ]
+
+    # 연속 PEAK_WINDOW_HOURS시간 합이 가장 큰 구간 (자정을 넘는 구간 포함)
+    window = np.convolve(np.concatenate([hourly, hourly[:PEAK_WINDOW_HOURS - 1]]), np.ones(PEAK_WINDOW_HOURS, np.int64), "valid")
+    start_hour = int(np.argmax(window))
+
+    by_weekday = [
+        {"weekday": WEEKDAYS[d], "hour": int(np.argmax(matrix[d])), "count": int(matrix[d].max())}
+        for d in range(7) if matrix[d].any()
+    ]
+    return {
+        "start_date": day_date(start_day).isoformat(),
+        "end_date": day_date(end_day).isoformat(),
+        "total": total,
+        "hourly": hourly.tolist(),
+        "peaks": peaks,
+        "peak_window": {
+            "start_hour": start_hour,
+            "end_hour": (start_hour + PEAK_WINDOW_HOURS) % 24,
+            "count": int(window[start_hour]),
+        } if total else None,
+        "by_weekday": by_weekday,
+    }
+
+def _period_summary(sel: Dict[str, np.ndarray], start_day: int, end_day: int) -> Dict[str, Any]:
+    visits = int(sel["day"].size)
+    days = end_day - start_day + 1
+    return {
+        "start_date": day_date(start_day).isoformat(),
+        "end_date": day_date(end_day).isoformat(),
+        "visits": visits,
+        "unique_visitors": count_unique(sel["user"]),
+        "daily_average": round(visits / days, 2),
+        "hourly": np.bincount(sel["sec"] // 3600, minlength=24).tolist(),
+    }
+
+def count_unique(values: np.ndarray) -> int:
+    """서로 다른 값 개수 (정렬 후 경계 세기, np.unique보다 빠름)"""
+    if not values.size:
+        return 0
+    ordered = np.sort(values)
+    return int(np.count_nonzero(ordered[1:] != ordered[:-1])) + 1
+
+def _change(current: int, previous: int) -> Optional[float]:
+    """증감률 % (이전 값이 0이면 None)"""
+    return round((current - previous) * 100 / previous, 1) if previous else None
+
+def compare_result(current_sel: Dict[str, np.ndarray], previous_sel: Dict[str, np.ndarray],
+                   start_day: int, end_day: int) -> Dict[str, Any]:
+    length = end_day - start_day + 1
+    current = _period_summary(current_sel, start_day, end_day)
+    previous = _period_summary(previous_sel, start_day - length, start_day - 1)
+    return {
+        "current": current,
+        "previous": previous,
+        "change": {
+            "visits": current["visits"] - previous["visits"],
+            "visits_pct": _change(current["visits"], previous["visits"]),
+            "unique_visitors": current["unique_visitors"] - previous["unique_visitors"],
+            "unique_visitors_pct": _change(current["unique_visitors"], previous["unique_visitors"]),
+            "hourly": (np.array(current["hourly"]) - np.array(previous["hourly"])).tolist(),
+        },
+    }
+
+# ----------------------------
+# 조회 (대시보드 API)
+# ----------------------------
+def get_hourly_heatmap(guild_id=None, store_code: str = None, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
+    """요일 × 시간 방문 수와 요일별 평균 (기본 최근 28일)"""
+    start_day, end_day = _period(start_date, end_date, DEFAULT_HEATMAP_DAYS)
+    return heatmap_result(_selection(guild_id, store_code, start_day, end_day), start_day, end_day)
+
+def get_peak_hours(guild_id=None, store_code: str = None, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
+    """시간대별 방문 수, 상위 시간, 가장 붐비는 연속 구간, 요일별 피크 (기본 최근 28일)"""
+    start_day, end_day = _period(start_date, end_date, DEFAULT_HEATMAP_DAYS)
+    return peaks_result(_selection(guild_id, store_code, start_day, end_day), start_day, end_day)
+
+def get_period_comparison(guild_id=None, store_code: str = None, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
+    """기간과 바로 앞 같은 길이 기간 비교 (기본 최근 7일 vs 그 전 7일)"""
+    start_day, end_day = _period(start_date, end_date, DEFAULT_COMPARE_DAYS, compare=True)
+    length = end_day - start_day + 1
+    current = _selection(guild_id, store_code, start_day, end_day)
+    previous = _selection(guild_id, store_code, start_day - length, start_day - 1)
+    return compare_result(current, previous, start_day, end_day)
+
+# ----------------------------
+# 벤치마크: python analytics.py [방문 수]
+# ----------------------------
+def _synthetic_columns(visits: int, stores: int, days: int, seed: int = 7) -> Dict[str, Any]:
+    """저녁/주말에 몰리는 합성 방문 열 배열 (정렬됨)"""
+    rng = np.random.default_rng(seed)
+    end_day = day_number(date(2026, 1, 1))
+    day = end_day - rng.integers(0, days, visits)
+    weekend = _weekday(day) >= 5
+    hour = np.where(weekend, rng.normal(15, 3, visits), rng.normal(19, 2.5, visits))
+    sec = (np.clip(hour, 0, 23.99) * 3600).astype(np.int64)
+    order = np.lexsort((sec, day))
+    return {
+        "codes": [f"{i:04d}" for i in range(stores)],
+        "day": day[order].astype(np.int32),
+        "sec": sec[order].astype(np.int32),
+        "store": rng.integers(0, stores, visits).astype(np.int32),
+        "user": rng.integers(10**17, 10**17 + visits // 5, visits).astype(np.int64),
+    }
+
+def _timed(label: str, fn, repeat: int = 5):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    print(f"{label:<34} {(time.perf_counter() - started) / repeat * 1000:9.1f} ms")
+    return result
+
+def _python_heatmap(visits: Dict[str, List[Dict[str, Any]]]) -> List[List[int]]:
+    """비교용: 방문 dict를 하나씩 도는 방식"""
+    matrix = [[0] * 24 for _ in range(7)]
+    for rows in visits.values():
+        for v in rows:
+            d = date.fromisoformat(v["visit_date"])
+            matrix[d.weekday()][int(v["visit_time"][:2])] += 1
+    return matrix
+
+def benchmark(visits: int = 5_000_000, stores: int = 200, days: int = 365, dict_visits: int = 200_000):
+    started = time.perf_counter()
+    columns = _synthetic_columns(visits, stores, days)
+    print(f"합성 방문 {visits:,}건 / 매장 {stores}개 / {days}일 ({time.perf_counter() - started:.2f}s)")
+
+    end_day = int(columns["day"][-1])
+    ranges = {"최근 28일": (end_day - 27, end_day), "전체 기간": (int(columns["day"][0]), end_day)}
+    for name, (start_day, stop_day) in ranges.items():
+        print(f"\n[{name}]")
+        whole = _timed("선택 (전체 매장)", lambda: select(columns, start_day, stop_day))
+        store = _timed("선택 (매장 1개)", lambda: select(columns, start_day, stop_day, "0000"))
+        _timed("히트맵 (전체 매장)", lambda: heatmap_result(whole, start_day, stop_day))
+        _timed("피크 시간 (전체 매장)", lambda: peaks_result(whole, start_day, stop_day))
+        _timed("히트맵 (매장 1개)", lambda: heatmap_result(store, start_day, stop_day))
+        length = stop_day - start_day + 1
+        previous = select(columns, start_day - length, start_day - 1)
+        _timed("기간 비교 (전체 매장)", lambda: compare_result(whole, previous, start_day, stop_day), repeat=2)
+
+    # 열 배열 만들기 비용과 dict 순회 방식 비교 (visits.json을 읽은 직후 상태)
+    sample = slice(0, dict_visits)
+    per_store: Dict[str, List[Dict[str, Any]]] = {}
+    for day, sec, store, user in zip(columns["day"][sample].tolist(), columns["sec"][sample].tolist(),
+                                     columns["store"][sample].tolist(), columns["user"][sample].tolist()):
+        per_store.setdefault(columns["codes"][store], []).append({
+            "user_id": user,
+            "visit_date": day_date(day).isoformat(),
+            "visit_time": f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}",
+        })
+    print(f"\n[방문 dict {dict_visits:,}건]")
+    built = _timed("열 배열 만들기", lambda: build_columns(per_store), repeat=2)
+    first, last = int(built["day"][0]), int(built["day"][-1])
+    sel = select(built, first, last)
+    numpy_matrix = _timed("히트맵 (NumPy)", lambda: heatmap_counts(sel["day"], sel["sec"], first, last).tolist())
+    python_matrix = _timed("히트맵 (dict 순회)", lambda: _python_heatmap(per_store), repeat=2)
+    print("결과 일치" if numpy_matrix == python_matrix else "결과 불일치!")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000)
@@ -1,23 +1,31 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import random
 import os
+import re
+import json
+import time
+import resource
+import asyncio
+import hashlib
 from datetime import datetime
 from io import BytesIO
-import qrcode
 
 from config import (
-    DISCORD_TOKEN, DISCORD_GUILD_ID,
-    ALLOWED_ROLE_IDS, ADMIN_ROLE_IDS, DEVELOPER_USER_ID, KST
+    DISCORD_TOKEN, DEVELOPER_USER_ID, KST,
+    COMMAND_SYNC_FILE, MEMBER_CHUNKING, BOT_AUTO_SHARD
 )
 from database import (
     get_stores, get_store, create_store, update_store, delete_store,
     get_store_visits, get_user_all_visits, get_user_visit_count,
     reset_today_checkin, delete_user_visits, get_store_stats,
     get_all_visits_for_export, add_visit, save_stores, _now_kst,
-    create_dashboard_token
+    create_dashboard_token, load_json, save_json, allocate_store_code,
+    store_guild_id, get_guild_config, update_guild_config, get_store_summary
 )
+from qr import render_qr_png
+from metrics import SpanTrace, get_recorder, get_summary
+from qr_sheet import build_store_qr_sheet, filter_stores, parse_codes
 
 # ----------------------------
 # 봇 설정
@@ -27,25 +35,42 @@ intents.message_content = True
 intents.members = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# lazy 모드: 시작 시 멤버 청킹을 하지 않고 멤버 캐시도 두지 않는다.
+# 버튼/명령어 인터랙션에는 누른 멤버와 역할 ID가 함께 오므로 역할 검증(role >= min_role)과
+# 역할 부여는 캐시 없이 동작한다. (역할 객체는 GUILD_CREATE로 항상 캐시됨)
+LAZY_MEMBERS = MEMBER_CHUNKING == "lazy"
+_process_started = time.perf_counter()
+
+# 서버가 많아지면 BOT_AUTO_SHARD=true로 Discord 권장 샤드 수만큼 나눠 접속
+bot_class = commands.AutoShardedBot if BOT_AUTO_SHARD else commands.Bot
+
+bot = bot_class(
+    command_prefix="!",
+    intents=intents,
+    chunk_guilds_at_startup=not LAZY_MEMBERS,
+    member_cache_flags=discord.MemberCacheFlags.none() if LAZY_MEMBERS else discord.MemberCacheFlags.from_intents(intents)
+)
 
 # ----------------------------
 # 권한 확인 함수
 # ----------------------------
+# 역할 ID 목록은 서버별 설정(/서버설정)을 따른다. 기본 서버는 .env 값이 기본값.
 def has_allowed_role(interaction: discord.Interaction) -> bool:
     """매장 관리 권한 확인"""
-    if not ALLOWED_ROLE_IDS:
+    allowed_role_ids = get_guild_config(interaction.guild_id)["allowed_role_ids"]
+    if not allowed_role_ids:
         return True
     user_role_ids = [role.id for role in interaction.user.roles]
-    return any(rid in user_role_ids for rid in ALLOWED_ROLE_IDS)
+    return any(rid in user_role_ids for rid in allowed_role_ids)
 
 def is_admin_or_developer(interaction: discord.Interaction) -> bool:
     """관리자 또는 개발자 권한 확인"""
     if interaction.user.id == DEVELOPER_USER_ID:
         return True
-    if ADMIN_ROLE_IDS:
+    admin_role_ids = get_guild_config(interaction.guild_id)["admin_role_ids"]
+    if admin_role_ids:
         user_role_ids = [role.id for role in interaction.user.roles]
-        if any(rid in user_role_ids for rid in ADMIN_ROLE_IDS):
+        if any(rid in user_role_ids for rid in admin_role_ids):
             return True
     if interaction.user.guild_permissions.administrator:
         return True
@@ -57,19 +82,167 @@ def is_admin_or_helper(interaction: discord.Interaction) -> bool:
         return True
     return has_allowed_role(interaction)
 
+def get_guild_store(interaction: discord.Interaction, store_code: str):
+    """현재 서버의 매장만 반환 (다른 서버의 매장 코드는 없는 것으로 처리)"""
+    store = get_store(store_code)
+    if store and store_guild_id(store) != interaction.guild_id:
+        return None
+    return store
+
 # ----------------------------
 # QR 코드 생성 함수
 # ----------------------------
 def generate_qr_image(url: str) -> BytesIO:
-    """QR 코드 이미지 생성"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
-    qr.add_data(url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return buf
+    """QR 코드 이미지 생성 (렌더링 캐시 사용)"""
+    png, _ = render_qr_png(url)
+    return BytesIO(png)
+
+# ----------------------------
+# 체크인 메시지 Embed
+# ----------------------------
+CHECKIN_FOOTER = "체크인은 하루 1회만 가능합니다."
+
+def build_checkin_embed(store_code: str, store: dict, guild) -> discord.Embed:
+    """채널에 게시되는 체크인 버튼 메시지의 Embed"""
+    embed = discord.Embed(
+        title=f"🏪 {store['store_name']}",
+        description="아래 버튼을 눌러 체크인하세요!",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="매장 코드", value=f"`{store_code}`", inline=True)
+
+    min_role_id = store.get("min_role_id")
+    if min_role_id:
+        min_role = guild.get_role(min_role_id) if guild else None
+        embed.add_field(name="최소 역할", value=min_role.mention if min_role else "삭제된 역할", inline=True)
+
+    embed.add_field(name="암구호", value="✅ 필요" if store.get("passphrase") else "❌ 불필요", inline=True)
+    embed.set_footer(text=CHECKIN_FOOTER)
+    return embed
+
+def embed_hash(embed: discord.Embed) -> str:
+    """렌더링된 Embed 내용의 해시 (변경 여부 비교용)"""
+    raw = json.dumps(embed.to_dict(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+# ----------------------------
+# 입장이력 로그 발행 (배치 전송)
+# ----------------------------
+# 체크인마다 로그 채널에 바로 보내면 채널 rate limit(5건/5초) 때문에 체크인 응답이 늦어진다.
+# 로그는 큐에 쌓고 LOG_FLUSH_SECONDS마다 한 메시지에 최대 10개 embed로 묶어 보낸다.
+# 밀린 건수가 LOG_SUMMARY_THRESHOLD를 넘으면 한 줄 요약 embed로 보낸다.
+LOG_FLUSH_SECONDS = 2.0
+LOG_EMBEDS_PER_MESSAGE = 10
+LOG_MESSAGE_CHAR_LIMIT = 5500   # Discord 메시지당 embed 합계 6000자 제한
+LOG_SUMMARY_THRESHOLD = 30
+LOG_QUEUE_MAX = 5000
+
+_log_queue: asyncio.Queue = asyncio.Queue(maxsize=LOG_QUEUE_MAX)
+_log_task = None
+
+def publish_checkin_log(channel_id: int, embed: discord.Embed, summary_line: str):
+    """체크인 로그를 발행 큐에 추가 (기다리지 않음)"""
+    if not channel_id:
+        return
+    try:
+        _log_queue.put_nowait((channel_id, embed, summary_line))
+    except asyncio.QueueFull:
+        print("Log queue full: 체크인 로그 1건 누락")
+
+def _pack_embeds(embeds: list) -> list:
+    """embed 목록을 메시지 단위(최대 10개, 글자수 제한)로 나누기"""
+    messages = []
+    current, size = [], 0
+    for embed in embeds:
+        n = len(embed)
+        if current and (len(current) >= LOG_EMBEDS_PER_MESSAGE or size + n > LOG_MESSAGE_CHAR_LIMIT):
+            messages.append(current)
+            current, size = [], 0
+        current.append(embed)
+        size += n
+    if current:
+        messages.append(current)
+    return messages
+
+def _summary_embeds(lines: list) -> list:
+    """많은 건수를 한 줄 요약 embed로 변환"""
+    embeds = []
+    chunk = []
+    for line in lines:
+        if chunk and len("\n".join(chunk + [line])) > 3500:
+            embeds.append(chunk)
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        embeds.append(chunk)
+
+    result = []
+    for i, chunk in enumerate(embeds):
+        embed = discord.Embed(
+            title=f"✅ [입장 요약] 체크인 {len(lines)}건" + (f" ({i + 1}/{len(embeds)})" if len(embeds) > 1 else ""),
+            description="\n".join(chunk),
+            color=discord.Color.green()
+        )
+        result.append(embed)
+    return result
+
+async def _log_publisher_loop():
+    while True:
+        batch = [await _log_queue.get()]
+
+        # 잠깐 모아서 한 번에 전송
+        await asyncio.sleep(LOG_FLUSH_SECONDS)
+        while not _log_queue.empty():
+            batch.append(_log_queue.get_nowait())
+
+        # 서버마다 로그 채널이 다르므로 채널별로 묶어서 전송
+        by_channel = {}
+        for channel_id, embed, line in batch:
+            by_channel.setdefault(channel_id, []).append((embed, line))
+
+        for channel_id, entries in by_channel.items():
+            channel = bot.get_channel(channel_id)
+            if not channel:
+                continue
+
+            if len(entries) > LOG_SUMMARY_THRESHOLD:
+                embeds = _summary_embeds([line for _, line in entries])
+            else:
+                embeds = [embed for embed, _ in entries]
+
+            for chunk in _pack_embeds(embeds):
+                try:
+                    await channel.send(embeds=chunk, allowed_mentions=discord.AllowedMentions.none())
+                except (discord.HTTPException, discord.Forbidden, discord.NotFound) as e:
+                    print(f"Discord API error: {e}")
+                except Exception as e:
+                    print(f"Unexpected error: {e}")
+
+def start_log_publisher():
+    global _log_task
+    if _log_task is None or _log_task.done():
+        _log_task = asyncio.create_task(_log_publisher_loop())
+
+# ----------------------------
+# 체크인 인터랙션 구간 측정
+# ----------------------------
+# 수신 → 매장 조회 → defer/modal(응답) → add_visit → 역할 부여 → followup
+# Discord는 3초 안에 응답(defer/modal)하지 않으면 "상호작용 실패"로 처리하므로
+# 응답까지 걸린 시간(pre_ack)이 SLOW_ACK_MS를 넘으면 구간별 내역을 로그로 남긴다.
+SLOW_ACK_MS = 1000
+
+def record_ack(trace: SpanTrace, interaction: discord.Interaction):
+    """defer/send_modal 직후 호출"""
+    pre_ack = trace.elapsed_ms()
+    get_recorder(f"{trace.name}.pre_ack").record(pre_ack)
+
+    # Discord가 인터랙션을 만든 시각 기준 (게이트웨이 지연 포함, 서버 시계 오차 있음)
+    since_created = (discord.utils.utcnow() - interaction.created_at).total_seconds() * 1000
+    if since_created > SLOW_ACK_MS or pre_ack > SLOW_ACK_MS:
+        print(
+            f"⚠️ 느린 응답 [{trace.name}] user={interaction.user.id} "
+            f"pre_ack={pre_ack:.0f}ms (생성 후 {since_created:.0f}ms) {trace.breakdown()}"
+        )
 
 # ----------------------------
 # 체크인 Modal (암구호 입력)
@@ -88,7 +261,16 @@ class CheckinModal(discord.ui.Modal, title="체크인"):
         self.store = store
 
     async def on_submit(self, interaction: discord.Interaction):
+        trace = SpanTrace("checkin_modal")
+        try:
+            await self._submit(interaction, trace)
+        finally:
+            trace.finish()
+
+    async def _submit(self, interaction: discord.Interaction, trace: SpanTrace):
         await interaction.response.defer(ephemeral=True)
+        trace.mark("ack")
+        record_ack(trace, interaction)
 
         member = interaction.user
         guild = interaction.guild
@@ -110,19 +292,21 @@ class CheckinModal(discord.ui.Modal, title="체크인"):
             return
 
         # 체크인 처리
-        await process_checkin_deferred(interaction, self.store_code, self.store)
+        await process_checkin_deferred(interaction, self.store_code, self.store, trace)
 
 
 # ----------------------------
 # 체크인 처리 함수 (deferred용 - followup 사용)
 # ----------------------------
-async def process_checkin_deferred(interaction: discord.Interaction, store_code: str, store: dict):
+async def process_checkin_deferred(interaction: discord.Interaction, store_code: str, store: dict, trace: SpanTrace):
     """체크인 처리 (defer 후 호출)"""
     member = interaction.user
     guild = interaction.guild
 
     # 방문 기록 추가 (중복 체크)
+    trace.mark("role_check")
     is_new_visit = add_visit(store_code, member.id, member.name, member.display_name)
+    trace.mark("add_visit")
 
     if not is_new_visit:
         # 이미 체크인했어도 역할이 없으면 부여
@@ -132,13 +316,17 @@ async def process_checkin_deferred(interaction: discord.Interaction, store_code:
             if grant_role and grant_role not in member.roles:
                 try:
                     await member.add_roles(grant_role)
+                    trace.mark("role_grant")
                     await interaction.followup.send("✅ 이미 오늘 체크인했습니다. (하루 1회)\n🎖️ 역할이 부여되었습니다!", ephemeral=True)
+                    trace.mark("followup")
                     return
                 except (discord.HTTPException, discord.Forbidden, discord.NotFound) as e:
                     print(f"Discord API error: {e}")
                 except Exception as e:
                     print(f"Unexpected error: {e}")
+                trace.mark("role_grant")
         await interaction.followup.send("✅ 이미 오늘 체크인했습니다. (하루 1회)", ephemeral=True)
+        trace.mark("followup")
         return
 
     # 방문 횟수
@@ -157,36 +345,31 @@ async def process_checkin_deferred(interaction: discord.Interaction, store_code:
                 print(f"Discord API error: {e}")
             except Exception as e:
                 print(f"Unexpected error: {e}")
+            trace.mark("role_grant")
 
     # 역할 목록
     role_names = [r.name for r in member.roles if r.name != "@everyone"]
 
-    # 입장이력 채널에 알림 (성공)
+    # 입장이력 채널에 알림 (성공) - 발행 큐에 넣고 바로 응답
     if guild:
-        try:
-            channel = guild.get_channel(LOG_CHANNEL_ID)
-            if channel:
-                now = _now_kst()
-                label = "오늘 첫 방문" if visit_count == 1 else f"누적 {visit_count}회차"
+        now = _now_kst()
+        label = "오늘 첫 방문" if visit_count == 1 else f"누적 {visit_count}회차"
 
-                embed = discord.Embed(
-                    title=f"✅ [입장 성공] {member.display_name}님이 체크인! ({label})",
-                    color=discord.Color.green()
-                )
-                embed.add_field(name="장소", value=store["store_name"], inline=True)
-                embed.add_field(name="방문자", value=f"<@{member.id}>", inline=True)
-                embed.add_field(name="방문 시간", value=now.strftime('%H:%M') + " (KST)", inline=True)
-                embed.add_field(name="방문 횟수", value=f"{visit_count}번째 방문", inline=True)
-                embed.add_field(name="역할", value=", ".join(role_names) if role_names else "(없음)", inline=False)
+        embed = discord.Embed(
+            title=f"✅ [입장 성공] {member.display_name}님이 체크인! ({label})",
+            color=discord.Color.green()
+        )
+        embed.add_field(name="장소", value=store["store_name"], inline=True)
+        embed.add_field(name="방문자", value=f"<@{member.id}>", inline=True)
+        embed.add_field(name="방문 시간", value=now.strftime('%H:%M') + " (KST)", inline=True)
+        embed.add_field(name="방문 횟수", value=f"{visit_count}번째 방문", inline=True)
+        embed.add_field(name="역할", value=", ".join(role_names) if role_names else "(없음)", inline=False)
 
-                if role_granted:
-                    embed.add_field(name="역할 부여", value="✅ 부여됨", inline=True)
+        if role_granted:
+            embed.add_field(name="역할 부여", value="✅ 부여됨", inline=True)
 
-                await channel.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
-        except (discord.HTTPException, discord.Forbidden, discord.NotFound) as e:
-            print(f"Discord API error: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
+        summary_line = f"`{now.strftime('%H:%M')}` **{store['store_name']}** · <@{member.id}> ({label})"
+        publish_checkin_log(get_guild_config(guild.id)["log_channel_id"], embed, summary_line)
 
     # 성공 메시지
     msg = f"✅ **{store['store_name']}** 체크인 완료!\n누적 **{visit_count}번째** 방문입니다!"
@@ -194,6 +377,7 @@ async def process_checkin_deferred(interaction: discord.Interaction, store_code:
         msg += "\n🎖️ 역할이 부여되었습니다!"
 
     await interaction.followup.send(msg, ephemeral=True)
+    trace.mark("followup")
 
 # ----------------------------
 # Persistent View 등록
@@ -204,9 +388,16 @@ class PersistentCheckinView(discord.ui.View):
 
     @discord.ui.button(label="체크인", style=discord.ButtonStyle.green, emoji="✅", custom_id="persistent_checkin")
     async def checkin_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        trace = SpanTrace("checkin_button")
+        try:
+            await self._checkin(interaction, trace)
+        finally:
+            trace.finish()
+
+    async def _checkin(self, interaction: discord.Interaction, trace: SpanTrace):
         # 메시지 ID로 매장 찾기 (같은 채널에 여러 매장 가능)
         message_id = interaction.message.id
-        stores = get_stores()
+        stores = get_stores(interaction.guild_id)
 
         store_code = None
         store = None
@@ -215,19 +406,26 @@ class PersistentCheckinView(discord.ui.View):
                 store_code = code
                 store = s
                 break
+        trace.mark("store_lookup")
 
         if not store:
             await interaction.response.send_message("❌ 등록되지 않은 매장입니다.", ephemeral=True)
+            trace.mark("ack")
+            record_ack(trace, interaction)
             return
 
         # 암구호가 설정된 경우 Modal 표시 (먼저 처리)
         if store.get("passphrase"):
             modal = CheckinModal(store_code, store)
             await interaction.response.send_modal(modal)
+            trace.mark("modal")
+            record_ack(trace, interaction)
             return
 
         # 암구호 없으면 바로 체크인 처리
         await interaction.response.defer(ephemeral=True)
+        trace.mark("ack")
+        record_ack(trace, interaction)
 
         member = interaction.user
         guild = interaction.guild
@@ -242,37 +440,91 @@ class PersistentCheckinView(discord.ui.View):
                     await interaction.followup.send("❌ 입장 권한이 없습니다.", ephemeral=True)
                     return
 
-        await process_checkin_deferred(interaction, store_code, store)
+        await process_checkin_deferred(interaction, store_code, store, trace)
 
 # ----------------------------
-# 봇 이벤트
+# 슬래시 명령어 동기화 (변경시에만)
 # ----------------------------
-@bot.event
-async def on_ready():
-    # Persistent View 등록
-    bot.add_view(PersistentCheckinView())
-
-    guild = discord.Object(id=DISCORD_GUILD_ID)
-
-    # 디버그: sync 전 명령어 수
-    global_commands = bot.tree.get_commands()  # 글로벌 명령어
-    print(f'[DEBUG] 글로벌 명령어 수: {len(global_commands)}')
-    for cmd in global_commands:
-        print(f'  - {cmd.name}')
+# 명령어 트리 해시를 저장해 두고, 달라졌을 때만 tree.sync를 호출한다.
+# (재접속마다 sync하면 시작이 느려지고 sync rate limit을 소모함)
+FORCE_SYNC = False
+_ready_once = False
+
+def command_tree_hash(guild_id: int) -> str:
+    """글로벌 명령어 정의 + 대상 길드로 만든 해시"""
+    payload = [cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands()]
+    raw = json.dumps({"guild_id": guild_id, "commands": payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def sync_commands_if_changed(guild_id: int, force: bool = False) -> bool:
+    """명령어가 바뀌었으면 길드에 sync. sync했으면 True"""
+    guild = discord.Object(id=guild_id)
+    tree_hash = command_tree_hash(guild_id)
+    synced_guilds = load_json(COMMAND_SYNC_FILE)
+    last = synced_guilds.get(str(guild_id)) or {}
+
+    if not force and last.get("hash") == tree_hash:
+        return False
 
     try:
         # 글로벌 명령어를 Guild에 복사
         bot.tree.copy_global_to(guild=guild)
         synced = await bot.tree.sync(guild=guild)
-        print(f'[DEBUG] Sync 완료! {len(synced)}개 명령어 동기화됨')
-        for cmd in synced:
-            print(f'  - /{cmd.name}')
+        print(f'Sync 완료! [{guild_id}] {len(synced)}개 명령어 동기화됨')
     except Exception as e:
-        print(f'[ERROR] Sync 실패: {e}')
+        print(f'[ERROR] Sync 실패 [{guild_id}]: {e}')
+        return False
+
+    synced_guilds = load_json(COMMAND_SYNC_FILE)
+    synced_guilds[str(guild_id)] = {
+        "hash": tree_hash,
+        "synced_at": _now_kst().isoformat()
+    }
+    save_json(COMMAND_SYNC_FILE, synced_guilds)
+    return True
+
+async def sync_all_guilds(force: bool = False):
+    """봇이 들어가 있는 모든 서버에 (변경된 경우만) sync"""
+    synced = 0
+    for guild in bot.guilds:
+        if await sync_commands_if_changed(guild.id, force=force):
+            synced += 1
+    if not synced:
+        print(f'명령어 변경 없음 - sync 생략 ({len(bot.tree.get_commands())}개, 서버 {len(bot.guilds)}개)')
+
+# ----------------------------
+# 봇 이벤트
+# ----------------------------
+@bot.event
+async def on_ready():
+    global _ready_once
+    started = time.perf_counter()
+
+    # 재접속시에도 on_ready가 다시 호출되므로 1회만 수행할 작업 분리
+    if not _ready_once:
+        # Persistent View 등록
+        bot.add_view(PersistentCheckinView())
+
+        # 입장이력 로그 발행 시작
+        start_log_publisher()
 
-    print(f'✅ {bot.user} 봇이 준비되었습니다!')
+        await sync_all_guilds(force=FORCE_SYNC)
+        _ready_once = True
+
+    print(f'✅ {bot.user} 봇이 준비되었습니다! (on_ready {(time.perf_counter() - started) * 1000:.0f}ms)')
     print(f'서버 수: {len(bot.guilds)}')
     print(f'로드된 매장 수: {len(get_stores())}')
+    print(
+        f'멤버 캐시: {MEMBER_CHUNKING} 모드, {sum(len(g.members) for g in bot.guilds)}명 캐시됨 / '
+        f'시작 후 {time.perf_counter() - _process_started:.1f}초, '
+        f'최대 메모리 {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB'
+    )
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    """새 서버에 초대되면 그 서버에 명령어 등록"""
+    print(f'서버 추가: {guild.name} ({guild.id})')
+    await sync_commands_if_changed(guild.id)
 
 # ----------------------------
 # 매장 등록 (현재 채널에 체크인 버튼 생성)
@@ -302,30 +554,19 @@ async def cmd_create_store(
     guild = interaction.guild
     channel = 체크인채널 or interaction.channel  # 지정된 채널 또는 현재 채널
 
-    # 매장 코드 생성 (숫자 2자리)
-    stores = get_stores()
-    while True:
-        store_code = f"{random.randint(10, 99)}"
-        if store_code not in stores:
-            break
+    # 매장 코드 발급
+    try:
+        store_code = allocate_store_code()
+    except RuntimeError as e:
+        await interaction.followup.send(f"❌ {e}", ephemeral=True)
+        return
 
     # 체크인 Embed 생성
-    embed = discord.Embed(
-        title=f"🏪 {매장명}",
-        description="아래 버튼을 눌러 체크인하세요!",
-        color=discord.Color.blue()
-    )
-    embed.add_field(name="매장 코드", value=f"`{store_code}`", inline=True)
-
-    if 최소역할:
-        embed.add_field(name="최소 역할", value=최소역할.mention, inline=True)
-
-    if 암구호:
-        embed.add_field(name="암구호", value="✅ 필요", inline=True)
-    else:
-        embed.add_field(name="암구호", value="❌ 불필요", inline=True)
-
-    embed.set_footer(text="체크인은 하루 1회만 가능합니다.")
+    embed = build_checkin_embed(store_code, {
+        "store_name": 매장명,
+        "min_role_id": 최소역할.id if 최소역할 else None,
+        "passphrase": 암구호
+    }, guild)
 
     # 체크인 버튼과 함께 메시지 전송 (멘션 알림 없이)
     view = PersistentCheckinView()
@@ -337,7 +578,7 @@ async def cmd_create_store(
 
     # QR 코드 생성 (Discord 채널 URL)
     channel_url = f"https://discord.com/channels/{guild.id}/{channel.id}"
-    qr_buf = generate_qr_image(channel_url)
+    qr_buf = await asyncio.to_thread(generate_qr_image, channel_url)
     qr_file = discord.File(qr_buf, filename=f"qr_{store_code}.png")
 
     # 매장 저장
@@ -350,6 +591,7 @@ async def cmd_create_store(
         "guild_id": guild.id,
         "channel_id": channel.id,
         "message_id": checkin_msg.id,
+        "embed_hash": embed_hash(embed),
         "created_at": _now_kst().isoformat()
     })
 
@@ -397,7 +639,7 @@ async def cmd_update_store(
         await interaction.response.send_message("❌ 권한이 없습니다.", ephemeral=True)
         return
 
-    store = get_store(매장코드)
+    store = get_guild_store(interaction, 매장코드)
     if not store:
         await interaction.response.send_message("❌ 존재하지 않는 매장 코드입니다.", ephemeral=True)
         return
@@ -445,29 +687,11 @@ async def cmd_update_store(
         try:
             channel = guild.get_channel(channel_id)
             if channel:
-                msg = await channel.fetch_message(message_id)
                 updated_store = get_store(매장코드)
+                embed = build_checkin_embed(매장코드, updated_store, guild)
 
-                embed = discord.Embed(
-                    title=f"🏪 {updated_store['store_name']}",
-                    description="아래 버튼을 눌러 체크인하세요!",
-                    color=discord.Color.blue()
-                )
-                embed.add_field(name="매장 코드", value=f"`{매장코드}`", inline=True)
-
-                min_role_id = updated_store.get("min_role_id")
-                if min_role_id:
-                    min_role = guild.get_role(min_role_id)
-                    embed.add_field(name="최소 역할", value=min_role.mention if min_role else "삭제된 역할", inline=True)
-
-                if updated_store.get("passphrase"):
-                    embed.add_field(name="암구호", value="✅ 필요", inline=True)
-                else:
-                    embed.add_field(name="암구호", value="❌ 불필요", inline=True)
-
-                embed.set_footer(text="체크인은 하루 1회만 가능합니다.")
-
-                await msg.edit(embed=embed)
+                await channel.get_partial_message(message_id).edit(embed=embed)
+                update_store(매장코드, {"embed_hash": embed_hash(embed)})
         except (discord.HTTPException, discord.Forbidden, discord.NotFound) as e:
             print(f"Discord API error: {e}")
         except Exception as e:
@@ -492,7 +716,7 @@ async def cmd_delete_store(interaction: discord.Interaction, 매장코드: str):
         await interaction.response.send_message("❌ 권한이 없습니다.", ephemeral=True)
         return
 
-    store = get_store(매장코드)
+    store = get_guild_store(interaction, 매장코드)
     if not store:
         await interaction.response.send_message("❌ 존재하지 않는 매장 코드입니다.", ephemeral=True)
         return
@@ -532,7 +756,7 @@ async def cmd_list_stores(interaction: discord.Interaction):
         await interaction.response.send_message("❌ 권한이 없습니다.", ephemeral=True)
         return
 
-    stores = get_stores()
+    stores = get_stores(interaction.guild_id)
     my_stores = {k: v for k, v in stores.items() if v['owner_id'] == interaction.user.id}
 
     if not my_stores:
@@ -555,6 +779,47 @@ async def cmd_list_stores(interaction: discord.Interaction):
 
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+# ----------------------------
+# 매장 통계 (집계 기반)
+# ----------------------------
+@bot.tree.command(name="매장통계", description="매장 방문 통계 (오늘/7일/30일, 순방문자, 최다 방문자)")
+@app_commands.describe(매장코드="통계를 볼 매장 코드")
+async def cmd_store_stats(interaction: discord.Interaction, 매장코드: str):
+    if not has_allowed_role(interaction):
+        await interaction.response.send_message("❌ 권한이 없습니다.", ephemeral=True)
+        return
+
+    store = get_guild_store(interaction, 매장코드)
+    if not store:
+        await interaction.response.send_message("❌ 존재하지 않는 매장 코드입니다.", ephemeral=True)
+        return
+
+    if store['owner_id'] != interaction.user.id and not is_admin_or_developer(interaction):
+        await interaction.response.send_message("❌ 본인이 생성한 매장만 볼 수 있습니다.", ephemeral=True)
+        return
+
+    summary = get_store_summary(매장코드)
+
+    embed = discord.Embed(
+        title=f"📊 {store['store_name']} 방문 통계",
+        description=f"매장 코드 `{매장코드}` · {_now_kst().strftime('%Y-%m-%d %H:%M')} (KST) 기준",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="오늘", value=f"{summary['today']}명", inline=True)
+    embed.add_field(name="최근 7일", value=f"{summary['last_7_days']}회", inline=True)
+    embed.add_field(name="최근 30일", value=f"{summary['last_30_days']}회", inline=True)
+    embed.add_field(name="누적 방문", value=f"{summary['total']}회", inline=True)
+    embed.add_field(name="순방문자", value=f"{summary['unique_visitors']}명", inline=True)
+
+    if summary["top_visitors"]:
+        lines = [
+            f"{i}. <@{v['user_id']}> {v['count']}회 (최근 {v['last_visit']})"
+            for i, v in enumerate(summary["top_visitors"], 1)
+        ]
+        embed.add_field(name="최다 방문자", value="\n".join(lines), inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True, allowed_mentions=discord.AllowedMentions.none())
+
 # ----------------------------
 # QR 코드 재발급 (체크인 버튼도 재생성)
 # ----------------------------
@@ -568,7 +833,7 @@ async def cmd_regenerate_qr(interaction: discord.Interaction, 매장코드: str,
         await interaction.response.send_message("❌ 권한이 없습니다.", ephemeral=True)
         return
 
-    store = get_store(매장코드)
+    store = get_guild_store(interaction, 매장코드)
     if not store:
         await interaction.response.send_message("❌ 존재하지 않는 매장 코드입니다.", ephemeral=True)
         return
@@ -606,18 +871,7 @@ async def cmd_regenerate_qr(interaction: discord.Interaction, 매장코드: str,
             print(f"Unexpected error: {e}")  # 이미 삭제됨
 
     # 새 체크인 버튼 메시지 생성
-    min_role = guild.get_role(store.get("min_role_id")) if store.get("min_role_id") else None
-
-    checkin_embed = discord.Embed(
-        title=f"🏪 {store['store_name']}",
-        description="아래 버튼을 눌러 체크인하세요!",
-        color=discord.Color.blue()
-    )
-    checkin_embed.add_field(name="매장 코드", value=f"`{매장코드}`", inline=True)
-    if min_role:
-        checkin_embed.add_field(name="최소 역할", value=min_role.mention, inline=True)
-    checkin_embed.add_field(name="암구호", value="✅ 필요" if store.get("passphrase") else "❌ 불필요", inline=True)
-    checkin_embed.set_footer(text="체크인은 하루 1회만 가능합니다.")
+    checkin_embed = build_checkin_embed(매장코드, store, guild)
 
     view = PersistentCheckinView()
     checkin_msg = await channel.send(embed=checkin_embed, view=view, allowed_mentions=discord.AllowedMentions.none())
@@ -625,12 +879,13 @@ async def cmd_regenerate_qr(interaction: discord.Interaction, 매장코드: str,
     # 매장 정보 업데이트
     update_store(매장코드, {
         "channel_id": channel.id,
-        "message_id": checkin_msg.id
+        "message_id": checkin_msg.id,
+        "embed_hash": embed_hash(checkin_embed)
     })
 
     # QR 코드 생성
     channel_url = f"https://discord.com/channels/{guild.id}/{channel.id}"
-    qr_buf = generate_qr_image(channel_url)
+    qr_buf = await asyncio.to_thread(generate_qr_image, channel_url)
     qr_file = discord.File(qr_buf, filename=f"qr_{매장코드}.png")
 
     result_embed = discord.Embed(
@@ -644,11 +899,154 @@ async def cmd_regenerate_qr(interaction: discord.Interaction, 매장코드: str,
 
     await interaction.followup.send(embed=result_embed, file=qr_file, ephemeral=True)
 
+# ----------------------------
+# QR 코드 일괄 출력
+# ----------------------------
+@bot.tree.command(name="매장qr일괄", description="여러 매장의 QR 코드를 인쇄용 PDF 또는 ZIP으로 받기")
+@app_commands.describe(
+    형식="PDF(인쇄용 시트) 또는 ZIP(PNG 묶음)",
+    매장코드="특정 매장만 (쉼표 구분, 미지정시 전체)"
+)
+@app_commands.choices(형식=[
+    app_commands.Choice(name="PDF", value="pdf"),
+    app_commands.Choice(name="ZIP", value="zip"),
+])
+async def cmd_bulk_qr(interaction: discord.Interaction, 형식: app_commands.Choice[str] = None, 매장코드: str = None):
+    if not has_allowed_role(interaction):
+        await interaction.response.send_message("❌ 권한이 없습니다.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    fmt = 형식.value if 형식 else "pdf"
+
+    # 관리자는 전체 매장, 그 외에는 본인 매장만
+    owner_id = None if is_admin_or_developer(interaction) else interaction.user.id
+    items = filter_stores(get_stores(interaction.guild_id), parse_codes(매장코드), owner_id)
+
+    if not items:
+        await interaction.followup.send("❌ 출력할 매장이 없습니다.", ephemeral=True)
+        return
+
+    data = await build_store_qr_sheet(items, fmt)
+    filename = f"store_qr_{_now_kst().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+    await interaction.followup.send(
+        f"✅ 매장 {len(items)}곳의 QR 코드입니다.",
+        file=discord.File(BytesIO(data), filename=filename),
+        ephemeral=True
+    )
+
+# ----------------------------
+# 체크인 메시지 일괄 갱신
+# ----------------------------
+# Embed 문구/역할 이름 등이 바뀌었을 때 모든 매장의 체크인 메시지를 다시 그린다.
+# 채널 단위로는 순서대로, 채널끼리는 REFRESH_CONCURRENCY개씩 동시에 수정한다.
+# (메시지 수정 rate limit은 채널 단위라 같은 채널을 동시에 두드려도 빨라지지 않음)
+# 저장된 embed_hash와 같으면 수정하지 않는다.
+REFRESH_CONCURRENCY = 4
+REFRESH_PROGRESS_SECONDS = 2
+
+async def refresh_checkin_messages(guild, force: bool = False, progress=None) -> dict:
+    """모든 매장 체크인 메시지 재렌더링. {"updated", "skipped", "failed": [(코드, 사유)]}"""
+    stores = get_stores(guild.id)
+    by_channel = {}
+    result = {"total": 0, "updated": 0, "skipped": 0, "failed": []}
+
+    for code, store in stores.items():
+        result["total"] += 1
+        if not store.get("channel_id") or not store.get("message_id"):
+            result["failed"].append((code, "메시지 정보 없음"))
+            continue
+        by_channel.setdefault(store["channel_id"], []).append((code, store))
+
+    semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+    hashes = {}
+
+    async def refresh_channel(channel_id: int, items: list):
+        async with semaphore:
+            channel = guild.get_channel(channel_id)
+            for code, store in items:
+                if not channel:
+                    result["failed"].append((code, "채널 없음"))
+                    continue
+
+                embed = build_checkin_embed(code, store, guild)
+                new_hash = embed_hash(embed)
+                if not force and store.get("embed_hash") == new_hash:
+                    result["skipped"] += 1
+                    continue
+
+                try:
+                    await channel.get_partial_message(store["message_id"]).edit(embed=embed)
+                    hashes[code] = new_hash
+                    result["updated"] += 1
+                except discord.NotFound:
+                    result["failed"].append((code, "메시지 없음"))
+                except discord.Forbidden:
+                    result["failed"].append((code, "권한 없음"))
+                except discord.HTTPException as e:
+                    result["failed"].append((code, f"HTTP {e.status}"))
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(REFRESH_PROGRESS_SECONDS)
+            await progress(result)
+
+    reporter = asyncio.create_task(report_progress()) if progress else None
+    try:
+        await asyncio.gather(*(refresh_channel(cid, items) for cid, items in by_channel.items()))
+    finally:
+        if reporter:
+            reporter.cancel()
+
+    # 해시는 마지막에 한 번에 저장 (매장마다 stores.json 쓰기 방지)
+    if hashes:
+        all_stores = get_stores(guild.id)
+        for code, value in hashes.items():
+            if code in all_stores:
+                all_stores[code]["embed_hash"] = value
+        save_stores(guild.id)
+
+    return result
+
+@bot.tree.command(name="매장메시지갱신", description="모든 매장의 체크인 메시지를 현재 정보로 다시 그리기")
+@app_commands.describe(강제="변경 없는 메시지도 모두 수정")
+async def cmd_refresh_messages(interaction: discord.Interaction, 강제: bool = False):
+    if not is_admin_or_developer(interaction):
+        await interaction.response.send_message("❌ 관리자 또는 개발자만 사용 가능합니다.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    started = time.monotonic()
+
+    async def progress(result: dict):
+        done = result["updated"] + result["skipped"] + len(result["failed"])
+        try:
+            await interaction.edit_original_response(
+                content=f"⏳ 체크인 메시지 갱신 중... {done}/{result['total']}"
+            )
+        except discord.HTTPException:
+            pass
+
+    result = await refresh_checkin_messages(interaction.guild, force=강제, progress=progress)
+    elapsed = time.monotonic() - started
+
+    lines = [
+        f"✅ 체크인 메시지 갱신 완료 ({elapsed:.1f}초)",
+        f"수정 {result['updated']}건 · 변경 없음 {result['skipped']}건 · 실패 {len(result['failed'])}건",
+    ]
+    for code, reason in result["failed"][:20]:
+        lines.append(f"- `{code}`: {reason}")
+    if len(result["failed"]) > 20:
+        lines.append(f"- 외 {len(result['failed']) - 20}건")
+
+    await interaction.edit_original_response(content="\n".join(lines))
+
 # ----------------------------
 # 매장 기록 (웹 대시보드)
 # ----------------------------
 DASHBOARD_URL = os.environ.get("DASHBOARD_URL", "https://entry.citadelcertify.org")
-LOG_CHANNEL_ID = 1450071295265079416  # ┆✅ㅣ비트코인하우스오리진∶입장이력
 
 @bot.tree.command(name="매장기록", description="웹 대시보드에서 방문 기록 조회")
 async def cmd_dashboard(interaction: discord.Interaction):
@@ -660,6 +1058,7 @@ async def cmd_dashboard(interaction: discord.Interaction):
     token = create_dashboard_token(
         user_id=interaction.user.id,
         username=interaction.user.display_name,
+        guild_id=interaction.guild_id,
         expires_hours=1
     )
 
@@ -689,7 +1088,7 @@ async def cmd_reset_checkin(interaction: discord.Interaction, 유저: discord.Me
         await interaction.response.send_message("❌ 관리자 또는 개발자만 사용 가능합니다.", ephemeral=True)
         return
 
-    store = get_store(매장코드)
+    store = get_guild_store(interaction, 매장코드)
     if not store:
         await interaction.response.send_message("❌ 존재하지 않는 매장 코드입니다.", ephemeral=True)
         return
@@ -715,7 +1114,7 @@ async def cmd_delete_visits(interaction: discord.Interaction, 유저: discord.Me
         await interaction.response.send_message("❌ 관리자 또는 개발자만 사용 가능합니다.", ephemeral=True)
         return
 
-    store = get_store(매장코드)
+    store = get_guild_store(interaction, 매장코드)
     if not store:
         await interaction.response.send_message("❌ 존재하지 않는 매장 코드입니다.", ephemeral=True)
         return
@@ -730,13 +1129,118 @@ async def cmd_delete_visits(interaction: discord.Interaction, 유저: discord.Me
     else:
         await interaction.response.send_message("❌ 삭제할 기록이 없습니다.", ephemeral=True)
 
+# ----------------------------
+# 서버 설정 (로그 채널, 권한 역할)
+# ----------------------------
+def parse_role_ids(raw: str) -> list:
+    """역할 멘션/ID 목록 문자열 → ID 리스트 ("없음"이면 빈 리스트)"""
+    return [int(x) for x in re.findall(r"\d{15,}", raw or "")]
+
+@bot.tree.command(name="서버설정", description="이 서버의 입장이력 로그 채널과 권한 역할 설정")
+@app_commands.describe(
+    로그채널="체크인 로그를 보낼 채널",
+    관리자역할="관리자 권한 역할 (멘션 또는 ID 여러 개, '없음'이면 해제)",
+    허용역할="매장 관리 허용 역할 (멘션 또는 ID 여러 개, '없음'이면 모두 허용)"
+)
+async def cmd_guild_settings(
+    interaction: discord.Interaction,
+    로그채널: discord.TextChannel = None,
+    관리자역할: str = None,
+    허용역할: str = None
+):
+    if not is_admin_or_developer(interaction):
+        await interaction.response.send_message("❌ 관리자 또는 개발자만 사용 가능합니다.", ephemeral=True)
+        return
+
+    updates = {}
+    if 로그채널:
+        updates["log_channel_id"] = 로그채널.id
+    if 관리자역할 is not None:
+        updates["admin_role_ids"] = parse_role_ids(관리자역할)
+    if 허용역할 is not None:
+        updates["allowed_role_ids"] = parse_role_ids(허용역할)
+    if updates:
+        update_guild_config(interaction.guild_id, updates)
+
+    config = get_guild_config(interaction.guild_id)
+    guild = interaction.guild
+
+    def role_list(ids: list) -> str:
+        names = [guild.get_role(rid).mention if guild.get_role(rid) else f"`{rid}`" for rid in ids]
+        return ", ".join(names) if names else "없음"
+
+    log_channel = guild.get_channel(config["log_channel_id"]) if config.get("log_channel_id") else None
+
+    embed = discord.Embed(
+        title="⚙️ 서버 설정" + (" (변경됨)" if updates else ""),
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="로그 채널", value=log_channel.mention if log_channel else "없음", inline=False)
+    embed.add_field(name="관리자 역할", value=role_list(config["admin_role_ids"]), inline=False)
+    embed.add_field(name="허용 역할", value=role_list(config["allowed_role_ids"]) if config["allowed_role_ids"] else "모두 허용", inline=False)
+    embed.add_field(name="매장 수", value=f"{len(get_stores(interaction.guild_id))}개", inline=True)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True, allowed_mentions=discord.AllowedMentions.none())
+
+# ----------------------------
+# 봇 응답 시간 통계
+# ----------------------------
+TRACE_NAMES = {"checkin_button": "체크인 버튼", "checkin_modal": "암구호 Modal"}
+TRACE_STAGES = ["pre_ack", "store_lookup", "ack", "modal", "role_check", "add_visit", "role_grant", "followup", "total"]
+
+@bot.tree.command(name="봇통계", description="체크인 인터랙션 구간별 응답 시간 통계")
+async def cmd_bot_stats(interaction: discord.Interaction):
+    if not is_admin_or_developer(interaction):
+        await interaction.response.send_message("❌ 관리자 또는 개발자만 사용 가능합니다.", ephemeral=True)
+        return
+
+    embed = discord.Embed(
+        title="📈 체크인 응답 시간",
+        description=f"최근 측정값 기준 p50 / p90 / p99 / 최대 (ms) · 느린 응답 기준 {SLOW_ACK_MS}ms",
+        color=discord.Color.blue()
+    )
+
+    for name, label in TRACE_NAMES.items():
+        summary = get_summary(prefix=f"{name}.")
+        if not summary:
+            continue
+
+        lines = []
+        for stage in TRACE_STAGES:
+            stat = summary.get(f"{name}.{stage}")
+            if stat:
+                lines.append(
+                    f"`{stage:<12}` {stat['p50_ms']:.0f} / {stat['p90_ms']:.0f} / "
+                    f"{stat['p99_ms']:.0f} / {stat['max_ms']:.0f} ({stat['count']}건)"
+                )
+        embed.add_field(name=label, value="\n".join(lines), inline=False)
+
+        histogram = get_recorder(f"{name}.pre_ack").histogram()
+        embed.add_field(
+            name=f"{label} 응답까지 분포",
+            value=" · ".join(f"{bucket} {count}" for bucket, count in histogram if count) or "(없음)",
+            inline=False
+        )
+
+    if not embed.fields:
+        embed.add_field(name="기록 없음", value="아직 측정된 체크인이 없습니다.", inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 # ----------------------------
 # 봇 실행
 # ----------------------------
 if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Entry Bot")
+    parser.add_argument("--force-sync", action="store_true", help="명령어 변경 여부와 관계없이 슬래시 명령어 sync")
+    args = parser.parse_args()
+    FORCE_SYNC = args.force_sync
+
     if not DISCORD_TOKEN:
         print("❌ .env 파일에 DISCORD_TOKEN을 설정해주세요!")
-        import sys
         sys.exit(1)
 
     bot.run(DISCORD_TOKEN)
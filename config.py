@@ -14,6 +14,23 @@ KST = timezone(timedelta(hours=9))
 # ----------------------------
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN", "")
 DISCORD_GUILD_ID = int(os.getenv("DISCORD_GUILD_ID", "0") or 0)
+DISCORD_CLIENT_ID = os.getenv("DISCORD_CLIENT_ID", "")
+DISCORD_CLIENT_SECRET = os.getenv("DISCORD_CLIENT_SECRET", "")
+
+# 기본 서버의 입장이력 로그 채널 (다른 서버는 /서버설정으로 지정)
+LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", "1450071295265079416") or 0)
+
+# 서버가 많을 때 자동 샤딩 (AutoShardedBot)
+BOT_AUTO_SHARD = os.getenv("BOT_AUTO_SHARD", "false").lower() in ("1", "true", "yes")
+
+# ----------------------------
+# OAuth / 웹 설정
+# ----------------------------
+OAUTH_REDIRECT_URI = os.getenv("OAUTH_REDIRECT_URI", "")
+BASE_URL = os.getenv("BASE_URL", "").rstrip("/")
+SESSION_SECRET = os.getenv("SESSION_SECRET", "change-me")
+HTTPS_ONLY = os.getenv("HTTPS_ONLY", "false").lower() in ("1", "true", "yes")
+WEB_SESSION_TTL_SECONDS = int(os.getenv("WEB_SESSION_TTL_SECONDS", "180") or 180)
 
 # ----------------------------
 # 권한 설정
@@ -40,5 +57,60 @@ DEVELOPER_USER_ID = int(os.getenv("DEVELOPER_USER_ID", "0") or 0)
 # 데이터 저장 경로
 # ----------------------------
 DATA_DIR = "data"
-STORES_FILE = os.path.join(DATA_DIR, "stores.json")
+STORES_FILE = os.path.join(DATA_DIR, "stores.json")   # 단일 서버 시절 파일 (서버별 분할로 이전됨)
 VISITS_FILE = os.path.join(DATA_DIR, "visits.json")
+GUILDS_DIR = os.path.join(DATA_DIR, "guilds")          # guilds/<서버 ID>/stores.json, visits.json, config.json
+STORE_INDEX_FILE = os.path.join(DATA_DIR, "store_index.json")  # 매장 코드 → 서버 ID
+JOBS_FILE = os.path.join(DATA_DIR, "jobs.json")
+STORE_CODES_FILE = os.path.join(DATA_DIR, "store_codes.json")
+COMMAND_SYNC_FILE = os.path.join(DATA_DIR, "command_sync.json")
+QR_CACHE_DIR = os.path.join(DATA_DIR, "qr_cache")
+QR_CACHE_MAX_ENTRIES = int(os.getenv("QR_CACHE_MAX_ENTRIES", "512") or 512)   # 메모리/디스크 각각 최대 개수
+
+# ----------------------------
+# 백그라운드 작업 큐
+# ----------------------------
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5") or 5)
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2") or 2)
+
+# ----------------------------
+# PDF 보고서 내보내기
+# ----------------------------
+# 한글 TTF 글꼴 경로 (PDF에 임베드). 기본값은 저장소에 포함된 나눔고딕, 파일이 없으면 PDF 보고서는 실패
+PDF_FONT_PATH = os.getenv("PDF_FONT_PATH", os.path.join("fonts", "NanumGothic.ttf"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500") or 500)   # 이보다 길면 기간을 줄이거나 CSV/XLSX 사용
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2") or 2)           # PDF 렌더링 프로세스 수
+
+# ----------------------------
+# 내보내기 작업 (백그라운드 생성 + 결과 파일 캐시)
+# ----------------------------
+EXPORT_CACHE_DIR = os.path.join(DATA_DIR, "export_cache")
+EXPORT_CACHE_MAX_FILES = int(os.getenv("EXPORT_CACHE_MAX_FILES", "100") or 100)
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2") or 2)     # 동시에 만드는 내보내기 파일 수
+
+# ----------------------------
+# 대시보드 실시간 갱신 (SSE)
+# ----------------------------
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "1000") or 1000)
+STREAM_CLIENT_BUFFER = int(os.getenv("STREAM_CLIENT_BUFFER", "100") or 100)   # 접속자별 대기 이벤트 수 (넘치면 다시 불러오기)
+STREAM_POLL_SECONDS = float(os.getenv("STREAM_POLL_SECONDS", "0.5") or 0.5)   # 변경 기록 확인 간격
+
+# ----------------------------
+# 체크인 입장 제어 (매장별)
+# ----------------------------
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "4") or 4)
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "500") or 500)
+ADMISSION_HOLD_SECONDS = float(os.getenv("ADMISSION_HOLD_SECONDS", "3") or 3)
+
+# ----------------------------
+# 매장 코드
+# ----------------------------
+# 새로 발급하는 매장 코드 자릿수 (기존 2자리 코드는 계속 사용 가능)
+STORE_CODE_DIGITS = max(2, int(os.getenv("STORE_CODE_DIGITS", "4") or 4))
+
+# ----------------------------
+# 멤버 캐시 (봇)
+# ----------------------------
+# startup: 시작할 때 길드 전체 멤버 목록을 받아 캐시 (기본값)
+# lazy: 시작 시 멤버 목록을 받지 않고, 체크인한 멤버는 인터랙션에 포함된 정보로 처리
+MEMBER_CHUNKING = os.getenv("MEMBER_CHUNKING", "startup").lower()
@@ -1,9 +1,14 @@
 import os
 import json
+import heapq
+import bisect
 import hashlib
-from datetime import datetime, date
-from typing import Optional, Dict, List, Any
-from config import DATA_DIR, STORES_FILE, VISITS_FILE, KST
+from datetime import datetime, date, timedelta
+from typing import Optional, Dict, List, Any, Iterator
+from config import (
+    DATA_DIR, STORES_FILE, VISITS_FILE, STORE_CODES_FILE, STORE_CODE_DIGITS, KST,
+    GUILDS_DIR, STORE_INDEX_FILE, DISCORD_GUILD_ID, LOG_CHANNEL_ID, ALLOWED_ROLE_IDS, ADMIN_ROLE_IDS
+)
 
 # 디렉토리 생성
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -63,103 +68,309 @@ def save_json(filepath: str, data: dict):
             os.unlink(tmp_path)
         raise
 
+def save_derived_json(filepath: str, data: dict):
+    """다시 만들 수 있는 파일(집계 등)용: rename 교체만 하고 fsync/백업은 생략"""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+# ----------------------------
+# 서버(길드)별 데이터 분할
+# ----------------------------
+# 매장/방문 기록은 서버마다 data/guilds/<서버 ID>/ 아래 따로 저장한다.
+# 매장 코드는 QR 주소에 들어가므로 전체 서버에서 유일하고, 코드 → 서버 ID는
+# store_index.json에 둔다. 매장 하나를 조회할 때는 그 서버의 파일만 읽는다.
+def _gid(guild_id) -> str:
+    return str(int(guild_id or DISCORD_GUILD_ID or 0))
+
+def _guild_file(guild_id, name: str) -> str:
+    return os.path.join(GUILDS_DIR, _gid(guild_id), name)
+
+def list_guild_ids() -> List[int]:
+    """데이터가 있는 서버 ID 목록"""
+    if not os.path.isdir(GUILDS_DIR):
+        return []
+    return sorted(int(d) for d in os.listdir(GUILDS_DIR) if d.isdigit())
+
+def store_guild_id(store: dict) -> int:
+    """매장이 속한 서버 ID (guild_id가 없는 예전 매장은 기본 서버)"""
+    return int(store.get("guild_id") or DISCORD_GUILD_ID or 0)
+
+_store_index: Dict[str, str] = {}
+
+def load_store_index() -> Dict[str, str]:
+    global _store_index
+    _store_index = load_json(STORE_INDEX_FILE)
+    return _store_index
+
+def save_store_index():
+    save_json(STORE_INDEX_FILE, _store_index)
+
+def get_store_guild(store_code: str) -> Optional[str]:
+    """매장 코드가 속한 서버 ID. 없으면 None"""
+    gid = _store_index.get(store_code)
+    if gid is None:
+        # 다른 프로세스(봇/웹)가 새로 만든 매장일 수 있음
+        gid = load_store_index().get(store_code)
+    return gid
+
+def _migrate_single_guild_files():
+    """예전 단일 stores.json / visits.json을 서버별 파일로 이전 (1회)"""
+    import fcntl
+
+    if not os.path.exists(STORES_FILE) or os.path.exists(STORE_INDEX_FILE):
+        return
+
+    with open(STORE_INDEX_FILE + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(STORE_INDEX_FILE):
+                return
+
+            stores = load_json(STORES_FILE)
+            visits = load_json(VISITS_FILE)
+            index = {code: _gid(store_guild_id(store)) for code, store in stores.items()}
+
+            by_guild: Dict[str, Dict[str, Any]] = {}
+            for code, store in stores.items():
+                by_guild.setdefault(index[code], {"stores": {}, "visits": {}})["stores"][code] = store
+            for code, visits_list in visits.items():
+                gid = index.get(code, _gid(None))
+                by_guild.setdefault(gid, {"stores": {}, "visits": {}})["visits"][code] = visits_list
+
+            for gid, data in by_guild.items():
+                save_json(_guild_file(gid, "stores.json"), data["stores"])
+                save_json(_guild_file(gid, "visits.json"), data["visits"])
+            save_json(STORE_INDEX_FILE, index)
+
+            os.replace(STORES_FILE, STORES_FILE + ".migrated")
+            if os.path.exists(VISITS_FILE):
+                os.replace(VISITS_FILE, VISITS_FILE + ".migrated")
+            print(f"데이터 이전 완료: 매장 {len(stores)}개 → 서버 {len(by_guild)}개")
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# ----------------------------
+# 서버별 설정 (로그 채널, 권한 역할)
+# ----------------------------
+def get_guild_config(guild_id) -> Dict[str, Any]:
+    """서버 설정. 기본 서버는 .env 값을 기본값으로 사용"""
+    is_default = _gid(guild_id) == _gid(None)
+    config = {
+        "log_channel_id": LOG_CHANNEL_ID if is_default else None,
+        "allowed_role_ids": list(ALLOWED_ROLE_IDS) if is_default else [],
+        "admin_role_ids": list(ADMIN_ROLE_IDS) if is_default else [],
+    }
+    config.update(load_json(_guild_file(guild_id, "config.json")))
+    return config
+
+def update_guild_config(guild_id, data: dict):
+    path = _guild_file(guild_id, "config.json")
+    config = load_json(path)
+    config.update(data)
+    save_json(path, config)
+
 # ----------------------------
 # 매장 데이터
 # ----------------------------
-_stores: Dict[str, Any] = {}
+_stores: Dict[str, Dict[str, Any]] = {}   # 서버 ID → {매장 코드: 매장}
+
+def load_stores(guild_id) -> Dict[str, Any]:
+    gid = _gid(guild_id)
+    _stores[gid] = load_json(_guild_file(gid, "stores.json"))
+    return _stores[gid]
 
-def load_stores() -> Dict[str, Any]:
-    global _stores
-    _stores = load_json(STORES_FILE)
-    return _stores
+def save_stores(guild_id, store_code: str = None):
+    """매장 저장 + 데이터 버전 올리기 (store_code가 없으면 모든 매장이 바뀐 것으로 봄)"""
+    gid = _gid(guild_id)
+    save_json(_guild_file(gid, "stores.json"), _stores.get(gid, {}))
+    bump_version(gid, store_code)
 
-def save_stores():
-    save_json(STORES_FILE, _stores)
+def get_stores(guild_id=None) -> Dict[str, Any]:
+    """서버의 매장 목록 (최신 데이터 로드). guild_id가 없으면 전체 서버 (읽기 전용 사본)"""
+    if guild_id is not None:
+        return load_stores(guild_id)
 
-def get_stores() -> Dict[str, Any]:
-    load_stores()  # 최신 데이터 로드
-    return _stores
+    result = {}
+    for gid in list_guild_ids():
+        result.update(load_stores(gid))
+    return result
 
 def get_store(store_code: str) -> Optional[Dict[str, Any]]:
-    load_stores()  # 최신 데이터 로드
-    return _stores.get(store_code)
+    gid = get_store_guild(store_code)
+    if gid is None:
+        return None
+    return load_stores(gid).get(store_code)  # 최신 데이터 로드
+
+# ----------------------------
+# 매장 코드 발급
+# ----------------------------
+# 코드 공간: STORE_CODE_DIGITS 자리 숫자 (기본 4자리 → 1000~9999, 9000개)
+# 카운터 n을 (n * STRIDE) mod 공간크기로 섞어서 순서대로 보이지 않게 발급한다.
+# STRIDE가 공간 크기와 서로소이므로 공간을 다 쓰기 전까지 중복이 없다 → O(1) 발급.
+# 기존 2자리 코드(10~99)는 새 코드 공간과 겹치지 않으므로 그대로 사용 가능.
+STORE_CODE_STRIDE = 7919
+
+def _code_space(digits: int) -> tuple:
+    low = 10 ** (digits - 1)
+    return low, 9 * low
+
+def _gcd(a: int, b: int) -> int:
+    while b:
+        a, b = b, a % b
+    return a
+
+def allocate_store_code() -> str:
+    """새 매장 코드 발급 (파일 잠금으로 동시 등록에도 중복 없음)"""
+    import fcntl
+
+    low, size = _code_space(STORE_CODE_DIGITS)
+    stride = STORE_CODE_STRIDE
+    while _gcd(stride, size) != 1:
+        stride += 1
+
+    with open(STORE_CODES_FILE + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            state = load_json(STORE_CODES_FILE)
+            n = state.get("next", 0) if state.get("digits") == STORE_CODE_DIGITS else 0
+            existing = load_json(STORE_INDEX_FILE)
+
+            while True:
+                if n >= size:
+                    raise RuntimeError(f"매장 코드가 모두 사용되었습니다. STORE_CODE_DIGITS({STORE_CODE_DIGITS})를 늘려주세요.")
+                code = str(low + (n * stride) % size)
+                n += 1
+                # 수동으로 만든 코드 등과 겹치면 건너뜀
+                if code not in existing:
+                    break
+
+            save_json(STORE_CODES_FILE, {"digits": STORE_CODE_DIGITS, "next": n})
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return code
 
 def create_store(store_code: str, data: dict):
-    _stores[store_code] = data
-    save_stores()
+    gid = _gid(store_guild_id(data))
+    load_stores(gid)[store_code] = data
+    save_stores(gid, store_code)
+
+    load_store_index()[store_code] = gid
+    save_store_index()
 
 def update_store(store_code: str, data: dict):
-    if store_code in _stores:
-        _stores[store_code].update(data)
-        save_stores()
+    gid = get_store_guild(store_code)
+    if gid is None:
+        return
+    stores = _stores.get(gid)
+    if stores is None:
+        stores = load_stores(gid)
+    if store_code in stores:
+        stores[store_code].update(data)
+        save_stores(gid, store_code)
 
 def delete_store(store_code: str):
-    if store_code in _stores:
-        del _stores[store_code]
-        save_stores()
+    gid = get_store_guild(store_code)
+    if gid is None:
+        return
+    stores = load_stores(gid)
+    if store_code in stores:
+        del stores[store_code]
+        save_stores(gid, store_code)
+
+    load_store_index().pop(store_code, None)
+    save_store_index()
 
 # ----------------------------
 # 방문 기록 데이터
 # ----------------------------
-_visits: Dict[str, List[Dict[str, Any]]] = {}
-
-def load_visits() -> Dict[str, List[Dict[str, Any]]]:
-    global _visits
-    _visits = load_json(VISITS_FILE)
-    return _visits
-
-def save_visits():
-    save_json(VISITS_FILE, _visits)
-
-def get_visits() -> Dict[str, List[Dict[str, Any]]]:
-    load_visits()  # 최신 데이터 로드
-    return _visits
+_visits: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}   # 서버 ID → {매장 코드: [방문]}
+
+def load_visits(guild_id) -> Dict[str, List[Dict[str, Any]]]:
+    gid = _gid(guild_id)
+    _visits[gid] = load_json(_guild_file(gid, "visits.json"))
+    return _visits[gid]
+
+def save_visits(guild_id, store_code: str = None):
+    """방문 기록 저장 + 데이터 버전 올리기 (store_code가 없으면 모든 매장이 바뀐 것으로 봄)"""
+    gid = _gid(guild_id)
+    save_json(_guild_file(gid, "visits.json"), _visits.get(gid, {}))
+    bump_version(gid, store_code)
+
+def get_visits(guild_id=None) -> Dict[str, List[Dict[str, Any]]]:
+    """서버의 방문 기록 (최신 데이터 로드). guild_id가 없으면 전체 서버"""
+    if guild_id is not None:
+        return load_visits(guild_id)
+
+    result = {}
+    for gid in list_guild_ids():
+        result.update(load_visits(gid))
+    return result
+
+def _store_visits_partition(store_code: str) -> tuple:
+    """(서버 ID, 그 서버의 방문 기록) - 매장이 없으면 기본 서버"""
+    gid = get_store_guild(store_code) or _gid(None)
+    return gid, load_visits(gid)  # 파일에서 최신 데이터 로드 (수동 수정 반영)
 
 def get_store_visits(store_code: str) -> List[Dict[str, Any]]:
-    load_visits()  # 최신 데이터 로드
-    return _visits.get(store_code, [])
+    _, visits = _store_visits_partition(store_code)
+    return visits.get(store_code, [])
 
 def add_visit(store_code: str, user_id: int, username: str, nickname: str) -> bool:
     """방문 기록 추가. 오늘 이미 방문했으면 False 반환"""
-    load_visits()  # 파일에서 최신 데이터 로드 (수동 수정 반영)
-    if store_code not in _visits:
-        _visits[store_code] = []
-    
+    gid, visits = _store_visits_partition(store_code)
+    if store_code not in visits:
+        visits[store_code] = []
+
     today = _today_str()
-    
+
     # 오늘 이미 방문했는지 확인
-    for visit in _visits[store_code]:
+    for visit in visits[store_code]:
         if visit["user_id"] == user_id and visit["visit_date"] == today:
             return False
-    
+
     # 새 방문 기록 추가
-    _visits[store_code].append({
+    visit = {
         "user_id": user_id,
         "username": username,
         "nickname": nickname,
         "visit_date": today,
         "visit_time": _now_kst().strftime("%H:%M:%S"),
         "created_at": _now_kst().isoformat()
-    })
-    save_visits()
+    }
+    visits[store_code].append(visit)
+
+    prev_mtime = _file_mtime(_guild_file(gid, "visits.json"))
+    save_visits(gid, store_code)
+    _update_aggregates(gid, store_code, visits, prev_mtime, added=[visit])
+    _record_change(gid, {"type": "visit", "store_code": store_code, "visit": visit})
     return True
 
 def get_user_visit_count(store_code: str, user_id: int) -> int:
     """특정 유저의 특정 매장 방문 횟수"""
-    load_visits()  # 파일에서 최신 데이터 로드
     count = 0
-    for visit in _visits.get(store_code, []):
+    for visit in get_store_visits(store_code):
         if visit["user_id"] == user_id:
             count += 1
     return count
 
-def get_user_all_visits(user_id: int) -> List[Dict[str, Any]]:
-    """특정 유저의 모든 매장 방문 기록"""
+def get_user_all_visits(user_id: int, guild_id=None) -> List[Dict[str, Any]]:
+    """특정 유저의 모든 매장 방문 기록 (guild_id가 있으면 그 서버만)"""
+    stores = get_stores(guild_id)
     result = []
-    for store_code, visits_list in _visits.items():
-        store = get_store(store_code)
+    for store_code, visits_list in get_visits(guild_id).items():
+        store = stores.get(store_code)
         store_name = store["store_name"] if store else store_code
-        
+
         user_visits = [v for v in visits_list if v["user_id"] == user_id]
         if user_visits:
             last_visit = max(v["visit_date"] for v in user_visits)
@@ -169,78 +380,69 @@ def get_user_all_visits(user_id: int) -> List[Dict[str, Any]]:
                 "visit_count": len(user_visits),
                 "last_visit": last_visit
             })
-    
+
     return sorted(result, key=lambda x: x["last_visit"], reverse=True)
 
 def reset_today_checkin(store_code: str, user_id: int) -> bool:
     """오늘 체크인 기록 초기화"""
-    if store_code not in _visits:
+    gid, visits = _store_visits_partition(store_code)
+    if store_code not in visits:
         return False
-    
+
     today = _today_str()
-    original_len = len(_visits[store_code])
-    _visits[store_code] = [
-        v for v in _visits[store_code]
+    removed = [v for v in visits[store_code] if v["user_id"] == user_id and v["visit_date"] == today]
+    visits[store_code] = [
+        v for v in visits[store_code]
         if not (v["user_id"] == user_id and v["visit_date"] == today)
     ]
-    
-    if len(_visits[store_code]) < original_len:
-        save_visits()
+
+    if removed:
+        prev_mtime = _file_mtime(_guild_file(gid, "visits.json"))
+        save_visits(gid, store_code)
+        _update_aggregates(gid, store_code, visits, prev_mtime, removed=removed)
+        _record_change(gid, {"type": "remove", "store_code": store_code, "user_id": user_id, "count": len(removed)})
         return True
     return False
 
 def delete_user_visits(store_code: str, user_id: int) -> int:
     """특정 유저의 특정 매장 전체 방문 기록 삭제"""
-    if store_code not in _visits:
+    gid, visits = _store_visits_partition(store_code)
+    if store_code not in visits:
         return 0
-    
-    original_len = len(_visits[store_code])
-    _visits[store_code] = [
-        v for v in _visits[store_code]
+
+    removed = [v for v in visits[store_code] if v["user_id"] == user_id]
+    visits[store_code] = [
+        v for v in visits[store_code]
         if v["user_id"] != user_id
     ]
-    
-    deleted = original_len - len(_visits[store_code])
-    if deleted > 0:
-        save_visits()
-    return deleted
 
-def get_all_visits_for_export() -> List[Dict[str, Any]]:
-    """전체 방문 기록 (내보내기용)"""
-    result = []
-    for store_code, visits_list in _visits.items():
-        store = get_store(store_code)
-        store_name = store["store_name"] if store else store_code
+    if removed:
+        prev_mtime = _file_mtime(_guild_file(gid, "visits.json"))
+        save_visits(gid, store_code)
+        _update_aggregates(gid, store_code, visits, prev_mtime, removed=removed)
+        _record_change(gid, {"type": "remove", "store_code": store_code, "user_id": user_id, "count": len(removed)})
+    return len(removed)
 
-        for visit in visits_list:
-            visit_date = visit.get("visit_date", "")
-            visit_time = visit.get("visit_time", "")
-            result.append({
-                "store_name": store_name,
-                "nickname": visit.get("nickname", ""),
-                "user_id": visit.get("user_id", ""),
-                "visit_datetime": f"{visit_date} {visit_time}".strip(),
-                "visit_date": visit_date,
-                "visit_time": visit_time,
-            })
-
-    return sorted(result, key=lambda x: x["visit_datetime"], reverse=True)
+def get_all_visits_for_export(guild_id=None) -> List[Dict[str, Any]]:
+    """전체 방문 기록 (내보내기용, guild_id가 있으면 그 서버만)"""
+    return list(iter_export_visits(guild_id))
 
 def get_store_stats(store_code: str, start_date: str = None, end_date: str = None) -> List[Dict[str, Any]]:
     """매장 통계 (방문자별 횟수)"""
-    if store_code not in _visits:
+    _, visits = _store_visits_partition(store_code)
+    if store_code not in visits:
         return []
-    
+
     user_stats = {}
-    for visit in _visits[store_code]:
+    for visit in visits[store_code]:
         visit_date = visit["visit_date"]
-        
+
         # 날짜 필터링
         if start_date and visit_date < start_date:
             continue
         if end_date and visit_date > end_date:
             continue
-        
+
         user_id = visit["user_id"]
         if user_id not in user_stats:
             user_stats[user_id] = {
@@ -250,9 +452,455 @@ def get_store_stats(store_code: str, start_date: str = None, end_date: str = Non
                 "count": 0
             }
         user_stats[user_id]["count"] += 1
-    
+
     return sorted(user_stats.values(), key=lambda x: x["count"], reverse=True)
 
+# ----------------------------
+# 방문 기록 페이지 조회 (커서)
+# ----------------------------
+# (created_at, 매장 코드, 유저 ID) 순으로 정렬된 키 목록을 인덱스로 두고 bisect로 페이지를 찾는다.
+# 인덱스는 visits.json mtime이 바뀔 때만 다시 만든다. 매장별 방문은 추가 순서(시간순)로
+# 저장되므로 정렬은 거의 선형이고, 전체 매장은 heapq.merge로 합친다.
+_visit_indexes: Dict[tuple, tuple] = {}   # (서버 ID, 매장 코드 또는 "") → (visits mtime, 키 목록, 행 목록)
+
+def visit_sort_key(store_code: str, visit: Dict[str, Any]) -> tuple:
+    created_at = visit.get("created_at") or f"{visit.get('visit_date', '')}T{visit.get('visit_time', '')}"
+    return (created_at, store_code, int(visit.get("user_id") or 0))
+
+def _visit_index(gid: str, store_code: Optional[str]) -> tuple:
+    """(키 목록, (매장 코드, 방문) 목록) - 오름차순"""
+    cache_key = (gid, store_code or "")
+    mtime = _file_mtime(_guild_file(gid, "visits.json"))
+    cached = _visit_indexes.get(cache_key)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    visits = load_visits(gid)
+    codes = [store_code] if store_code else list(visits.keys())
+    per_store = [
+        sorted(((visit_sort_key(code, v), code, v) for v in visits.get(code, [])), key=lambda e: e[0])
+        for code in codes
+    ]
+    merged = list(heapq.merge(*per_store, key=lambda e: e[0]))
+    keys = [e[0] for e in merged]
+    rows = [(e[1], e[2]) for e in merged]
+
+    _visit_indexes[cache_key] = (mtime, keys, rows)
+    return keys, rows
+
+def _index_page(keys: list, rows: list, after: Optional[tuple], limit: int, descending: bool) -> list:
+    """after 키 다음부터 limit개 [(키, 매장 코드, 방문)]"""
+    if descending:
+        end = bisect.bisect_left(keys, after) if after else len(keys)
+        start = max(0, end - limit)
+        return [(keys[i],) + rows[i] for i in range(end - 1, start - 1, -1)]
+
+    start = bisect.bisect_right(keys, after) if after else 0
+    return [(keys[i],) + rows[i] for i in range(start, min(len(keys), start + limit))]
+
+def get_visits_page(guild_id=None, store_code: str = None, after: Optional[tuple] = None,
+                    limit: int = 50, descending: bool = True) -> Dict[str, Any]:
+    """방문 기록 한 페이지. {"visits", "next": 다음 페이지 커서 키 또는 None, "total"}
+
+    guild_id가 없으면 전체 서버, store_code가 있으면 그 매장만."""
+    if store_code:
+        gids = [get_store_guild(store_code) or _gid(None)]
+    elif guild_id is not None:
+        gids = [_gid(guild_id)]
+    else:
+        gids = [_gid(g) for g in list_guild_ids()]
+
+    # 서버마다 limit+1개씩 가져와 합친 뒤 limit개만 사용 (다음 페이지 여부 확인용 1개)
+    candidates = []
+    total = 0
+    names = {}
+    for gid in gids:
+        keys, rows = _visit_index(gid, store_code)
+        total += len(keys)
+        candidates.append(_index_page(keys, rows, after, limit + 1, descending))
+        names.update({code: s.get("store_name", code) for code, s in load_stores(gid).items()})
+
+    merged = list(heapq.merge(*candidates, key=lambda e: e[0], reverse=descending))[:limit + 1]
+    page = merged[:limit]
+
+    result = []
+    for _, code, v in page:
+        result.append({
+            "store_code": code,
+            "store_name": names.get(code, code),
+            "user_id": v.get("user_id", ""),
+            "username": v.get("username", ""),
+            "nickname": v.get("nickname", ""),
+            "visit_date": v.get("visit_date", ""),
+            "visit_time": v.get("visit_time", ""),
+            "created_at": v.get("created_at", ""),
+        })
+
+    return {
+        "visits": result,
+        "next": page[-1][0] if len(merged) > limit else None,
+        "total": total,
+    }
+
+def _export_gids(guild_id, store_code: Optional[str]) -> List[str]:
+    if store_code:
+        return [get_store_guild(store_code) or _gid(None)]
+    if guild_id is not None:
+        return [_gid(guild_id)]
+    return [_gid(g) for g in list_guild_ids()]
+
+def _index_range(keys: list, start_date: Optional[str], end_date: Optional[str]) -> tuple:
+    """기간(YYYY-MM-DD, 양 끝 포함)에 해당하는 인덱스 범위 [lo, hi)"""
+    lo = bisect.bisect_left(keys, (start_date,)) if start_date else 0
+    hi = bisect.bisect_left(keys, (end_date + "\uffff",)) if end_date else len(keys)
+    return lo, max(lo, hi)
+
+def _iter_index(keys: list, rows: list, lo: int, hi: int, descending: bool):
+    indexes = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+    for i in indexes:
+        yield (keys[i],) + rows[i]
+
+def count_export_visits(guild_id=None, store_code: str = None,
+                        start_date: str = None, end_date: str = None) -> int:
+    """내보내기 대상 방문 수 (인덱스 범위만 계산)"""
+    total = 0
+    for gid in _export_gids(guild_id, store_code):
+        keys, _ = _visit_index(gid, store_code)
+        lo, hi = _index_range(keys, start_date, end_date)
+        total += hi - lo
+    return total
+
+def count_export_visits_by_store(guild_id=None, store_code: str = None,
+                                 start_date: str = None, end_date: str = None) -> Dict[str, int]:
+    """매장별 내보내기 대상 방문 수 {매장 코드: 수} (전체 인덱스의 기간 범위를 한 번 훑음)"""
+    counts: Dict[str, int] = {}
+    for gid in _export_gids(guild_id, store_code):
+        keys, _ = _visit_index(gid, store_code)
+        lo, hi = _index_range(keys, start_date, end_date)
+        for key in keys[lo:hi]:
+            counts[key[1]] = counts.get(key[1], 0) + 1
+    return counts
+
+def iter_export_visits(guild_id=None, store_code: str = None, start_date: str = None,
+                       end_date: str = None, descending: bool = True) -> Iterator[Dict[str, Any]]:
+    """내보내기용 방문 기록을 시간순(기본 최신순)으로 하나씩 반환
+
+    정렬된 방문 인덱스의 기간 범위를 그대로 따라가므로 결과 목록을 따로 만들지 않는다.
+    인덱스는 호출 시점의 스냅샷이라 도중에 방문이 추가되어도 순서가 흔들리지 않는다."""
+    sources = []
+    names = {}
+    for gid in _export_gids(guild_id, store_code):
+        keys, rows = _visit_index(gid, store_code)
+        lo, hi = _index_range(keys, start_date, end_date)
+        sources.append(_iter_index(keys, rows, lo, hi, descending))
+        names.update({code: s.get("store_name", code) for code, s in load_stores(gid).items()})
+
+    for _, code, visit in heapq.merge(*sources, key=lambda e: e[0], reverse=descending):
+        visit_date = visit.get("visit_date", "")
+        visit_time = visit.get("visit_time", "")
+        yield {
+            "store_code": code,
+            "store_name": names.get(code, code),
+            "nickname": visit.get("nickname", ""),
+            "username": visit.get("username", ""),
+            "user_id": visit.get("user_id", ""),
+            "visit_datetime": f"{visit_date} {visit_time}".strip(),
+            "visit_date": visit_date,
+            "visit_time": visit_time,
+        }
+
+# ----------------------------
+# 데이터 버전 (대시보드 API ETag, 응답 캐시, 내보내기 캐시)
+# ----------------------------
+# 서버마다 versions.json에 전체 버전(global)과 매장별 버전을 둔다. 매장/방문을 저장할 때마다
+# global을 1 올리고 바뀐 매장의 버전을 그 값으로 맞춘다. 어느 매장인지 모르면 all을 올려
+# 모든 매장이 바뀐 것으로 본다. 버전을 올리지 않은 저장(파일 직접 수정 등)은 기록해 둔
+# 파일 mtime과 비교해 알아채고 all을 올린다. 봇/체크인 서버/대시보드가 함께 쓰므로 파일 잠금 안에서 갱신한다.
+# 캐시 무효화용 숫자라 fsync/백업 없이 저장하고, 파일이 없어지면 데이터 mtime(ms)부터 다시 센다
+# (예전 버전 번호와 겹쳐 오래된 ETag가 맞아 버리는 일이 없도록).
+_versions: Dict[str, tuple] = {}   # 서버 ID → (versions.json mtime, 내용)
+
+def _data_mtimes(gid: str) -> list:
+    return [_file_mtime(_guild_file(gid, "stores.json")), _file_mtime(_guild_file(gid, "visits.json"))]
+
+def _read_versions(gid: str) -> Dict[str, Any]:
+    path = _guild_file(gid, "versions.json")
+    mtime = _file_mtime(path)
+    cached = _versions.get(gid)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    data = load_json(path)
+    _versions[gid] = (mtime, data)
+    return data
+
+def bump_version(guild_id, store_code: str = None) -> Dict[str, Any]:
+    """데이터 버전 올리기 (store_code가 없으면 모든 매장)"""
+    import fcntl
+
+    gid = _gid(guild_id)
+    path = _guild_file(gid, "versions.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            data = load_json(path)
+            mtimes = _data_mtimes(gid)
+            data["global"] = (data.get("global") or int(max(mtimes) * 1000)) + 1
+            if store_code:
+                data.setdefault("stores", {})[store_code] = data["global"]
+            else:
+                data["all"] = data["global"]
+            data["mtimes"] = mtimes
+            save_derived_json(path, data)
+            _versions[gid] = (_file_mtime(path), data)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return data
+
+def _current_versions(gid: str) -> Dict[str, Any]:
+    data = _read_versions(gid)
+    if data.get("mtimes") != _data_mtimes(gid):
+        data = bump_version(gid)
+    return data
+
+def get_data_version(guild_id=None, store_code: str = None) -> str:
+    """서버(또는 매장) 데이터 버전 문자열. 매장/방문이 바뀔 때마다 커진다"""
+    parts = []
+    for gid in _export_gids(guild_id, store_code):
+        data = _current_versions(gid)
+        if store_code:
+            version = max(data.get("stores", {}).get(store_code, 0), data.get("all", 0))
+            parts.append(f"{gid}.{store_code}.{version}")
+        else:
+            parts.append(f"{gid}.{data['global']}")
+    return "-".join(parts)
+
+# ----------------------------
+# 변경 기록 (대시보드 실시간 갱신용)
+# ----------------------------
+# 방문 추가/삭제를 서버별 changes.log에 한 줄(JSON)씩 덧붙인다. 방문은 봇/체크인 서버가 쓰고
+# 대시보드는 다른 프로세스이므로, 대시보드가 이 파일 끝을 따라 읽어 접속자에게 전달한다.
+# 파일이 CHANGE_LOG_MAX_BYTES를 넘으면 changes.log.1로 넘기고 새로 시작한다.
+CHANGE_LOG_MAX_BYTES = 256 * 1024
+
+def change_log_path(guild_id) -> str:
+    return _guild_file(_gid(guild_id), "changes.log")
+
+def _record_change(gid: str, event: Dict[str, Any]):
+    path = change_log_path(gid)
+    line = json.dumps(event, ensure_ascii=False) + "\n"
+    try:
+        if _file_mtime(path) and os.path.getsize(path) > CHANGE_LOG_MAX_BYTES:
+            os.replace(path, path + ".1")
+        # 한 번의 append 쓰기로 기록 (여러 프로세스가 동시에 덧붙여도 줄이 섞이지 않음)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        print(f"Change log write error: {e}")
+
+# ----------------------------
+# 방문 집계 (매장 통계용)
+# ----------------------------
+# 통계를 볼 때마다 방문 기록을 훑지 않도록 매장별 집계와 서버 전체 집계를 방문 추가/삭제 때 함께 갱신한다.
+#   total: 전체 방문 수 / daily: {날짜: 방문 수} / visitors: {유저 ID: {count, nickname, last}}
+#   last_at: 마지막 방문 시각 (created_at)
+# 집계 파일에는 기준이 된 visits.json의 mtime을 같이 적어 두고, 어긋나면
+# (수동 수정, 다른 프로세스가 방문만 저장한 직후 등) 방문 기록에서 다시 계산한다.
+_aggregates: Dict[str, tuple] = {}   # 서버 ID → (집계 파일 mtime, 집계 파일 내용)
+
+def _file_mtime(path: str) -> float:
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+AGGREGATES_FORMAT = 3   # 집계 항목이 바뀌면 올려서 기존 집계 파일을 다시 계산
+
+def _empty_aggregate() -> Dict[str, Any]:
+    return {"total": 0, "daily": {}, "visitors": {}, "last_at": ""}
+
+def _visit_time(visit: Dict[str, Any]) -> str:
+    return visit.get("created_at") or f"{visit.get('visit_date', '')}T{visit.get('visit_time', '')}"
+
+def _apply_visit(agg: Dict[str, Any], visit: Dict[str, Any], sign: int = 1):
+    """집계에 방문 1건 더하기 (sign=-1이면 빼기)"""
+    visit_date = visit.get("visit_date", "")
+    agg["total"] += sign
+
+    daily = agg["daily"]
+    daily[visit_date] = daily.get(visit_date, 0) + sign
+    if daily[visit_date] <= 0:
+        del daily[visit_date]
+
+    uid = str(visit["user_id"])
+    visitor = agg["visitors"].setdefault(uid, {"count": 0, "nickname": "", "username": "", "last": ""})
+    visitor["count"] += sign
+    if sign > 0:
+        visitor["nickname"] = visit.get("nickname") or visitor["nickname"]
+        visitor["username"] = visit.get("username") or visitor["username"]
+        visitor["last"] = max(visitor["last"], visit_date)
+        agg["last_at"] = max(agg["last_at"], _visit_time(visit))
+    if visitor["count"] <= 0:
+        del agg["visitors"][uid]
+
+def _build_aggregates(visits: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    data = {"format": AGGREGATES_FORMAT, "stores": {}, "guild": _empty_aggregate()}
+    for store_code, visits_list in visits.items():
+        agg = data["stores"][store_code] = _empty_aggregate()
+        for visit in visits_list:
+            _apply_visit(agg, visit)
+            _apply_visit(data["guild"], visit)
+    return data
+
+def _read_aggregates(gid: str) -> Dict[str, Any]:
+    path = _guild_file(gid, "aggregates.json")
+    mtime = _file_mtime(path)
+    cached = _aggregates.get(gid)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    data = load_json(path)
+    _aggregates[gid] = (mtime, data)
+    return data
+
+def _save_aggregates(gid: str, data: Dict[str, Any]):
+    path = _guild_file(gid, "aggregates.json")
+    data["visits_mtime"] = _file_mtime(_guild_file(gid, "visits.json"))
+    # visits.json mtime과 다르면 다시 계산하는 파생 데이터라 fsync/백업 없이 저장
+    save_derived_json(path, data)
+    _aggregates[gid] = (_file_mtime(path), data)
+
+def _valid_aggregates(data: Dict[str, Any], visits_mtime: float) -> bool:
+    return data.get("format") == AGGREGATES_FORMAT and data.get("visits_mtime") == visits_mtime
+
+def _current_aggregates(gid: str) -> Dict[str, Any]:
+    data = _read_aggregates(gid)
+    if _valid_aggregates(data, _file_mtime(_guild_file(gid, "visits.json"))):
+        return data
+
+    data = _build_aggregates(load_visits(gid))
+    _save_aggregates(gid, data)
+    return data
+
+def load_aggregates(guild_id) -> Dict[str, Any]:
+    """서버의 매장별 집계 {매장 코드: 집계}"""
+    return _current_aggregates(_gid(guild_id))["stores"]
+
+def load_guild_aggregate(guild_id) -> Dict[str, Any]:
+    """서버 전체 집계 (모든 매장 합계, 순방문자는 서버 기준)"""
+    return _current_aggregates(_gid(guild_id))["guild"]
+
+def _update_aggregates(gid: str, store_code: str, visits: Dict[str, list], prev_visits_mtime: float,
+                       added: List[dict] = (), removed: List[dict] = ()):
+    """save_visits 직후 호출. 집계가 변경 전 visits.json 기준이면 증분 반영, 아니면 다시 계산"""
+    data = _read_aggregates(gid)
+    if _valid_aggregates(data, prev_visits_mtime):
+        agg = data["stores"].setdefault(store_code, _empty_aggregate())
+        for visit in added:
+            _apply_visit(agg, visit)
+            _apply_visit(data["guild"], visit)
+        for visit in removed:
+            _apply_visit(agg, visit, -1)
+            _apply_visit(data["guild"], visit, -1)
+        if removed:
+            # 마지막 방문이 지워졌을 수 있으므로 이 매장 기록에서 다시 구함 (삭제는 드문 관리 작업)
+            agg["last_at"] = max((_visit_time(v) for v in visits.get(store_code, [])), default="")
+            data["guild"]["last_at"] = max((a["last_at"] for a in data["stores"].values()), default="")
+    else:
+        data = _build_aggregates(visits)
+    _save_aggregates(gid, data)
+
+def get_store_summary(store_code: str, top_n: int = 5) -> Dict[str, Any]:
+    """매장 통계 요약 (오늘/7일/30일 방문 수, 순방문자 수, 최다 방문자)"""
+    gid = get_store_guild(store_code) or _gid(None)
+    agg = load_aggregates(gid).get(store_code) or _empty_aggregate()
+    today = _today_kst()
+
+    def recent(days: int) -> int:
+        return sum(agg["daily"].get((today - timedelta(days=i)).isoformat(), 0) for i in range(days))
+
+    top = heapq.nlargest(top_n, agg["visitors"].items(), key=lambda item: item[1]["count"])
+    return {
+        "total": agg["total"],
+        "today": recent(1),
+        "last_7_days": recent(7),
+        "last_30_days": recent(30),
+        "unique_visitors": len(agg["visitors"]),
+        "top_visitors": [
+            {"user_id": int(uid), "nickname": v["nickname"], "count": v["count"], "last_visit": v["last"]}
+            for uid, v in top
+        ],
+    }
+
+def get_visitor_stats(guild_id=None, store_code: str = None) -> List[Dict[str, Any]]:
+    """방문자별 방문 횟수 (집계 기반, 방문 기록 파일을 매장마다 다시 읽지 않음). 이름은 최근 방문 기준"""
+    if store_code:
+        aggs = [load_aggregates(get_store_guild(store_code) or _gid(None)).get(store_code) or _empty_aggregate()]
+    else:
+        gids = [_gid(guild_id)] if guild_id is not None else [_gid(g) for g in list_guild_ids()]
+        aggs = [load_guild_aggregate(gid) for gid in gids]
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for agg in aggs:
+        for uid, visitor in agg["visitors"].items():
+            if uid not in stats:
+                stats[uid] = {
+                    "user_id": int(uid),
+                    "username": visitor.get("username", ""),
+                    "nickname": visitor["nickname"],
+                    "count": 0,
+                }
+            stats[uid]["count"] += visitor["count"]
+    return sorted(stats.values(), key=lambda x: x["count"], reverse=True)
+
+def get_store_overview(guild_id=None) -> List[Dict[str, Any]]:
+    """매장 목록 + 방문 수, 오늘 방문, 순방문자, 마지막 방문 시각 (집계 기반, 매장 수에 비례)"""
+    today = _today_str()
+    gids = [_gid(guild_id)] if guild_id is not None else [_gid(g) for g in list_guild_ids()]
+    result = []
+    for gid in gids:
+        aggregates = load_aggregates(gid)
+        for code, store in load_stores(gid).items():
+            agg = aggregates.get(code) or _empty_aggregate()
+            result.append({
+                "code": code,
+                "name": store.get("store_name", ""),
+                "visit_count": agg["total"],
+                "today_count": agg["daily"].get(today, 0),
+                "unique_visitors": len(agg["visitors"]),
+                "last_visit_at": agg["last_at"] or None,
+            })
+    return result
+
+def get_dashboard_summary(guild_id=None, store_code: str = None) -> Dict[str, Any]:
+    """대시보드 상단 숫자 (전체 방문, 오늘 방문(KST), 순방문자, 오늘 방문이 있는 매장, 매장 수)"""
+    today = _today_str()
+
+    if store_code:
+        agg = load_aggregates(get_store_guild(store_code) or _gid(None)).get(store_code) or _empty_aggregate()
+        visited_today = agg["daily"].get(today, 0)
+        return {
+            "total_visits": agg["total"],
+            "today_visits": visited_today,
+            "unique_visitors": len(agg["visitors"]),
+            "active_stores": 1 if visited_today else 0,
+            "store_count": 1,
+            "date": today,
+        }
+
+    gids = [_gid(guild_id)] if guild_id is not None else [_gid(g) for g in list_guild_ids()]
+    summary = {"total_visits": 0, "today_visits": 0, "unique_visitors": 0, "active_stores": 0, "store_count": 0, "date": today}
+    visitors = set()
+    for gid in gids:
+        data = _current_aggregates(gid)
+        summary["total_visits"] += data["guild"]["total"]
+        summary["today_visits"] += data["guild"]["daily"].get(today, 0)
+        summary["active_stores"] += sum(1 for agg in data["stores"].values() if agg["daily"].get(today))
+        summary["store_count"] += len(load_stores(gid))
+        if len(gids) == 1:
+            summary["unique_visitors"] = len(data["guild"]["visitors"])
+        else:
+            visitors.update(data["guild"]["visitors"])
+    if len(gids) > 1:
+        summary["unique_visitors"] = len(visitors)
+    return summary
+
 # ----------------------------
 # 대시보드 토큰 관리
 # ----------------------------
@@ -267,7 +915,7 @@ def load_tokens() -> Dict[str, Any]:
 def save_tokens():
     save_json(TOKENS_FILE, _tokens)
 
-def create_dashboard_token(user_id: int, username: str, expires_hours: int = 1) -> str:
+def create_dashboard_token(user_id: int, username: str, guild_id: int = None, expires_hours: int = 1) -> str:
     """대시보드 접근 토큰 생성 (해시 저장)"""
     import secrets
     token = secrets.token_urlsafe(24)
@@ -280,6 +928,7 @@ def create_dashboard_token(user_id: int, username: str, expires_hours: int = 1)
     _tokens[token_hash] = {
         "user_id": user_id,
         "username": username,
+        "guild_id": guild_id,
         "created_at": now.isoformat(),
         "expires_at": expires_at.isoformat()
     }
@@ -332,31 +981,24 @@ def cleanup_expired_tokens():
     
     return len(expired)
 
-def get_daily_stats(store_code: str = None, days: int = 30) -> List[Dict[str, Any]]:
-    """일별 방문 통계"""
-    from datetime import timedelta
-
+def get_daily_stats(store_code: str = None, days: int = 30, guild_id=None) -> List[Dict[str, Any]]:
+    """일별 방문 통계 (집계 기반)"""
     today = _today_kst()
     start_date = today - timedelta(days=days)
 
-    daily = {}
+    if store_code:
+        dailies = [(load_aggregates(get_store_guild(store_code) or _gid(None)).get(store_code) or _empty_aggregate())["daily"]]
+    else:
+        gids = [guild_id] if guild_id is not None else list_guild_ids()
+        dailies = [load_guild_aggregate(gid)["daily"] for gid in gids]
+
+    result = []
     for i in range(days + 1):
         d = (start_date + timedelta(days=i)).isoformat()
-        daily[d] = 0
-
-    visits_to_check = _visits.get(store_code, []) if store_code else []
-    if not store_code:
-        for visits_list in _visits.values():
-            visits_to_check.extend(visits_list)
-
-    for visit in visits_to_check:
-        vd = visit.get("visit_date", "")
-        if vd in daily:
-            daily[vd] += 1
-
-    return [{"date": d, "count": c} for d, c in sorted(daily.items())]
+        result.append({"date": d, "count": sum(daily.get(d, 0) for daily in dailies)})
+    return result
 
 # 초기 로드
-load_stores()
-load_visits()
+_migrate_single_guild_files()
+load_store_index()
 load_tokens()
@@ -1,3 +1,5 @@
+import time
+import asyncio
 import httpx
 from typing import Optional, List, Dict, Any
 from config import DISCORD_TOKEN, DISCORD_CLIENT_ID, DISCORD_CLIENT_SECRET, DISCORD_GUILD_ID, OAUTH_REDIRECT_URI
@@ -28,17 +30,109 @@ async def discord_api(
         r = await client.request(method, url, headers=headers, json=json_body)
     return r
 
+# ----------------------------
+# 멤버/역할 캐시 (OAuth 콜백에서 미리 가져오기)
+# ----------------------------
+# 체크인 POST 전에 OAuth 콜백에서 멤버/역할 조회를 미리 시작해 둔다.
+# 체크인 경로에서만 use_cache=True로 사용하고, 역할 부여 후 알림 등은 항상 새로 조회한다.
+# 미리 가져온 멤버는 체크인에서 한 번 쓰면 지우고, 체크인하지 않은 페이지의 것은 TTL이 지나면 지운다.
+# 모든 캐시는 서버(길드)별로 나뉜다. guild_id가 없으면 기본 서버(DISCORD_GUILD_ID).
+MEMBER_CACHE_TTL_SECONDS = 120
+ROLES_CACHE_TTL_SECONDS = 300
+PREFETCH_TIMEOUT_SECONDS = 5.0
+
+_member_cache: Dict[tuple, tuple] = {}   # (guild_id, user_id) → (만료 시각, member)
+_roles_cache: Dict[int, tuple] = {}      # guild_id → (만료 시각, roles)
+_prefetch_tasks: Dict[tuple, asyncio.Task] = {}
+
+def _guild(guild_id: Optional[int]) -> int:
+    return int(guild_id or DISCORD_GUILD_ID or 0)
+
+def invalidate_member(guild_id: Optional[int], user_id: int):
+    _member_cache.pop((_guild(guild_id), user_id), None)
+
+def _prune_member_cache(now: float):
+    expired = [key for key, (exp, _) in _member_cache.items() if exp <= now]
+    for key in expired:
+        del _member_cache[key]
+
+def _expire_member(key: tuple):
+    cached = _member_cache.get(key)
+    if cached and cached[0] <= time.monotonic():
+        del _member_cache[key]
+
+async def _prefetch(guild_id: int, user_id: int):
+    member = await _fetch_guild_member(guild_id, user_id)
+    if member:
+        now = time.monotonic()
+        _prune_member_cache(now)
+        _member_cache[(guild_id, user_id)] = (now + MEMBER_CACHE_TTL_SECONDS, member)
+        # 체크인 없이 페이지를 떠나도 TTL 뒤에는 정리
+        asyncio.get_running_loop().call_later(MEMBER_CACHE_TTL_SECONDS + 1, _expire_member, (guild_id, user_id))
+    await _fetch_guild_roles(guild_id, use_cache=True)
+
+async def _prefetch_bounded(guild_id: int, user_id: int):
+    try:
+        await asyncio.wait_for(_prefetch(guild_id, user_id), timeout=PREFETCH_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"Member prefetch timeout: {guild_id}/{user_id}")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Member prefetch error: {e}")
+
+def start_member_prefetch(guild_id: Optional[int], user_id: int):
+    """멤버 + 역할 정보 미리 가져오기 (기다리지 않음)"""
+    key = (_guild(guild_id), user_id)
+    if not key[0] or key in _prefetch_tasks:
+        return
+    task = asyncio.create_task(_prefetch_bounded(*key))
+    _prefetch_tasks[key] = task
+    task.add_done_callback(lambda _: _prefetch_tasks.pop(key, None))
+
+def cancel_member_prefetch(user_id: int):
+    """필요 없어진 prefetch 취소 (로그아웃 등, 모든 서버)"""
+    for key in [k for k in _prefetch_tasks if k[1] == user_id]:
+        task = _prefetch_tasks.pop(key, None)
+        if task:
+            task.cancel()
+    for key in [k for k in _member_cache if k[1] == user_id]:
+        del _member_cache[key]
+
 # ----------------------------
 # 길드 멤버 정보
 # ----------------------------
-async def get_guild_member(user_id: int) -> Optional[dict]:
-    if not DISCORD_GUILD_ID:
+async def _fetch_guild_member(guild_id: Optional[int], user_id: int) -> Optional[dict]:
+    guild_id = _guild(guild_id)
+    if not guild_id:
         return None
-    r = await discord_api("GET", f"/guilds/{DISCORD_GUILD_ID}/members/{user_id}", bot=True)
+    r = await discord_api("GET", f"/guilds/{guild_id}/members/{user_id}", bot=True)
     if r.status_code == 200:
         return r.json()
     return None
 
+async def get_guild_member(guild_id: Optional[int], user_id: int, use_cache: bool = False) -> Optional[dict]:
+    key = (_guild(guild_id), user_id)
+    if use_cache:
+        # 미리 가져온 멤버는 한 번만 사용 (다시 체크인하면 새로 조회)
+        cached = _member_cache.pop(key, None)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        # prefetch가 진행 중이면 새로 요청하지 않고 합류
+        task = _prefetch_tasks.get(key)
+        if task:
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+            cached = _member_cache.pop(key, None)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+
+    return await _fetch_guild_member(*key)
+
 def member_display_name(member: dict) -> str:
     """서버 닉네임 또는 유저명 반환"""
     nick = member.get("nick")
@@ -56,81 +150,94 @@ def member_username(member: dict) -> str:
         return f"{username}#{disc}"
     return username or str(u.get("id") or "")
 
-async def get_member_role_ids(user_id: int) -> List[int]:
+async def get_member_role_ids(guild_id: Optional[int], user_id: int) -> List[int]:
     """유저의 역할 ID 리스트 반환"""
-    member = await get_guild_member(user_id)
+    member = await get_guild_member(guild_id, user_id)
     if not member:
         return []
     return [int(rid) for rid in (member.get("roles") or []) if str(rid).isdigit()]
 
-async def get_guild_roles() -> Dict[int, str]:
-    """길드의 모든 역할 반환 (id: name)"""
-    if not DISCORD_GUILD_ID:
-        return {}
-    r = await discord_api("GET", f"/guilds/{DISCORD_GUILD_ID}/roles", bot=True)
+async def _fetch_guild_roles(guild_id: Optional[int], use_cache: bool = False) -> Optional[list]:
+    """길드 역할 목록 (Discord role 객체 리스트). 실패시 None"""
+    guild_id = _guild(guild_id)
+    if not guild_id:
+        return None
+    cached = _roles_cache.get(guild_id)
+    if use_cache and cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    r = await discord_api("GET", f"/guilds/{guild_id}/roles", bot=True)
     if r.status_code != 200:
-        return {}
+        return None
     roles = r.json()
+    _roles_cache[guild_id] = (time.monotonic() + ROLES_CACHE_TTL_SECONDS, roles)
+    return roles
+
+async def get_guild_roles(guild_id: Optional[int], use_cache: bool = False) -> Dict[int, str]:
+    """길드의 모든 역할 반환 (id: name)"""
+    roles = await _fetch_guild_roles(guild_id, use_cache)
+    if not roles:
+        return {}
     return {int(x["id"]): x.get("name", "") for x in roles if x.get("id")}
 
-async def get_member_role_names(user_id: int) -> List[str]:
+async def get_member_role_names(guild_id: Optional[int], user_id: int, use_cache: bool = False) -> List[str]:
     """유저의 역할 이름 리스트 반환"""
-    member = await get_guild_member(user_id)
+    member = await get_guild_member(guild_id, user_id, use_cache)
     if not member:
         return []
-    
+
     role_ids = [int(rid) for rid in (member.get("roles") or []) if str(rid).isdigit()]
-    role_map = await get_guild_roles()
-    
+    role_map = await get_guild_roles(guild_id, use_cache)
+
     names = []
     for rid in role_ids:
-        if rid == DISCORD_GUILD_ID:  # @everyone 제외
+        if rid == _guild(guild_id):  # @everyone 제외
             continue
         name = role_map.get(rid)
         if name:
             names.append(name)
-    
+
     names.sort(key=lambda s: s.lower())
     return names
 
-async def check_user_has_role(user_id: int, role_id: int) -> bool:
+async def check_user_has_role(guild_id: Optional[int], user_id: int, role_id: int) -> bool:
     """유저가 특정 역할을 가지고 있는지 확인"""
-    role_ids = await get_member_role_ids(user_id)
+    role_ids = await get_member_role_ids(guild_id, user_id)
     return role_id in role_ids
 
-async def check_user_role_position(user_id: int, min_role_id: int) -> bool:
+async def check_user_role_position(guild_id: Optional[int], user_id: int, min_role_id: int, use_cache: bool = False) -> bool:
     """유저가 최소 역할 이상인지 확인 (역할 위치 기반)"""
-    member = await get_guild_member(user_id)
+    member = await get_guild_member(guild_id, user_id, use_cache)
     if not member:
         return False
-    
+
     user_role_ids = [int(rid) for rid in (member.get("roles") or []) if str(rid).isdigit()]
-    
+
     # 최소 역할이 유저 역할에 포함되어 있으면 True
     if min_role_id in user_role_ids:
         return True
-    
+
     # 역할 위치 확인 (더 높은 역할이 있는지)
-    r = await discord_api("GET", f"/guilds/{DISCORD_GUILD_ID}/roles", bot=True)
-    if r.status_code != 200:
+    roles = await _fetch_guild_roles(guild_id, use_cache)
+    if not roles:
         return False
-    
-    roles = r.json()
+
     role_positions = {int(x["id"]): x.get("position", 0) for x in roles}
-    
+
     min_role_position = role_positions.get(min_role_id, 0)
-    
+
     for rid in user_role_ids:
         if role_positions.get(rid, 0) >= min_role_position:
             return True
-    
+
     return False
 
-async def add_role_to_member(user_id: int, role_id: int) -> bool:
+async def add_role_to_member(guild_id: Optional[int], user_id: int, role_id: int) -> bool:
     """유저에게 역할 부여"""
-    if not DISCORD_GUILD_ID:
+    guild_id = _guild(guild_id)
+    if not guild_id:
         return False
-    r = await discord_api("PUT", f"/guilds/{DISCORD_GUILD_ID}/members/{user_id}/roles/{role_id}", bot=True)
+    r = await discord_api("PUT", f"/guilds/{guild_id}/members/{user_id}/roles/{role_id}", bot=True)
     return r.status_code in (200, 204)
 
 async def send_dm(user_id: int, content: str = None, embed: dict = None) -> bool:
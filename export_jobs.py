@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import secrets
+from typing import Optional, Dict, Any, Iterable, Iterator
+
+from config import EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_FILES, EXPORT_WORKERS, PDF_MAX_PAGES
+from database import iter_export_visits, count_export_visits, get_data_version, _now_kst
+from exports import iter_csv, write_visits_xlsx, export_filename
+from pdf_report import render_report_async, ReportTooLarge, ReportFontMissing, too_large_message, FONT_MISSING_MESSAGE
+
+# ----------------------------
+# 내보내기 작업 (백그라운드 생성 + 결과 파일 캐시)
+# ----------------------------
+# POST /api/exports가 작업을 만들면 워커가 CSV/XLSX/PDF 파일을 만들고, 대시보드는 진행률을 조회한다.
+# 결과 파일은 (형식, 필터, 데이터 버전) 해시를 이름으로 data/export_cache에 저장한다.
+# 데이터가 그대로면 같은 요청은 파일을 새로 만들지 않고 바로 완료된 작업으로 응답한다.
+# 작업 상태: pending → running → done / failed (작업 목록은 메모리에만, 파일 캐시는 재시작 후에도 유효)
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+EXPORT_JOB_KEEP_SECONDS = 3600
+ARTIFACT_VERSION = 1   # 파일 형식이 바뀌면 올려서 이전 캐시 무시
+
+_jobs: Dict[str, Dict[str, Any]] = {}
+_building: Dict[str, str] = {}   # 캐시 키 → 만들고 있는 작업 ID (같은 요청 중복 방지)
+_queue: Optional[asyncio.Queue] = None
+_workers: list = []
+
+os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+
+def artifact_key(fmt: str, filters: Dict[str, Any]) -> str:
+    data_version = get_data_version(filters.get("guild_id"), filters.get("store_code"))
+    raw = json.dumps({"v": ARTIFACT_VERSION, "format": fmt, "filters": filters, "data": data_version}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+def artifact_path(key: str, fmt: str) -> str:
+    return os.path.join(EXPORT_CACHE_DIR, f"{key}.{fmt}")
+
+def _prune_cache():
+    """오래 안 쓴 결과 파일부터 삭제 (EXPORT_CACHE_MAX_FILES 유지)"""
+    try:
+        entries = [e for e in os.scandir(EXPORT_CACHE_DIR) if e.is_file() and not e.name.endswith(".tmp")]
+    except OSError:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:max(0, len(entries) - EXPORT_CACHE_MAX_FILES)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def _cleanup_jobs():
+    cutoff = time.time() - EXPORT_JOB_KEEP_SECONDS
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job["status"] in ("done", "failed") and job["finished"] < cutoff
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+def create_export_job(fmt: str, filters: Dict[str, Any], user_id: Optional[int] = None) -> Dict[str, Any]:
+    """내보내기 작업 생성. 캐시에 있으면 바로 완료, 같은 파일을 만드는 중이면 그 작업 반환"""
+    _cleanup_jobs()
+    key = artifact_key(fmt, filters)
+    if key in _building and _building[key] in _jobs:
+        return _jobs[_building[key]]
+
+    now = _now_kst()
+    job_id = secrets.token_urlsafe(12)
+    job = {
+        "id": job_id,
+        "format": fmt,
+        "filters": filters,
+        "user_id": user_id,
+        "key": key,
+        "path": artifact_path(key, fmt),
+        "filename": export_filename(fmt, now, filters.get("start_date"), filters.get("end_date")),
+        "status": "pending",
+        "cached": False,
+        "total_rows": None,
+        "done_rows": 0,
+        "error": None,
+        "created_at": now.isoformat(),
+        "finished": 0.0,
+    }
+    _jobs[job_id] = job
+
+    if os.path.exists(job["path"]):
+        os.utime(job["path"])   # 최근 사용 표시 (캐시 정리 순서)
+        job.update(status="done", cached=True, finished=time.time())
+        return job
+
+    _building[key] = job_id
+    _queue.put_nowait(job_id)
+    return job
+
+def get_export_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return _jobs.get(job_id)
+
+def job_info(job: Dict[str, Any]) -> Dict[str, Any]:
+    """API 응답용 작업 상태"""
+    total = job["total_rows"]
+    progress = None
+    if job["status"] == "done":
+        progress = 1.0
+    elif total:
+        progress = round(min(job["done_rows"] / total, 1.0), 3)
+    elif total == 0:
+        progress = 0.0
+    return {
+        "job_id": job["id"],
+        "format": job["format"],
+        "status": job["status"],
+        "cached": job["cached"],
+        "total_rows": total,
+        "done_rows": job["done_rows"],
+        "progress": progress,
+        "error": job["error"],
+        "created_at": job["created_at"],
+    }
+
+def _counting(visits: Iterable[Dict[str, Any]], job: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """행을 넘길 때마다 진행률 갱신 (워커 스레드에서 실행)"""
+    for visit in visits:
+        job["done_rows"] += 1
+        yield visit
+
+def _write_csv(job: Dict[str, Any], path: str):
+    with open(path, "wb") as f:
+        for chunk in iter_csv(_counting(iter_export_visits(**job["filters"]), job)):
+            f.write(chunk)
+
+def _write_xlsx(job: Dict[str, Any], path: str):
+    write_visits_xlsx(_counting(iter_export_visits(**job["filters"]), job), path)
+
+async def _build(job: Dict[str, Any]):
+    filters = job["filters"]
+    job["total_rows"] = await asyncio.to_thread(count_export_visits, **filters)
+
+    tmp_path = f"{job['path']}.{job['id']}.tmp"
+    try:
+        if job["format"] == "csv":
+            await asyncio.to_thread(_write_csv, job, tmp_path)
+        elif job["format"] == "xlsx":
+            await asyncio.to_thread(_write_xlsx, job, tmp_path)
+        else:
+            # PDF는 프로세스 풀에서 만들어 중간 진행률이 없고, 끝나면 한 번에 100%
+            await render_report_async(tmp_path, filters, PDF_MAX_PAGES)
+            job["done_rows"] = job["total_rows"]
+        os.replace(tmp_path, job["path"])
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+async def _run_job(job_id: str):
+    job = _jobs.get(job_id)
+    if not job:
+        return
+
+    job["status"] = "running"
+    try:
+        await _build(job)
+        job["status"] = "done"
+        _prune_cache()
+    except ReportTooLarge as e:
+        job["status"] = "failed"
+        job["error"] = too_large_message(e.pages, e.max_pages)
+    except ReportFontMissing as e:
+        print(f"[ERROR] Export job {job_id}: {e}")
+        job["status"] = "failed"
+        job["error"] = FONT_MISSING_MESSAGE
+    except Exception as e:
+        print(f"Export job {job_id} ({job['format']}) 실패: {e}")
+        job["status"] = "failed"
+        job["error"] = "내보내기 파일을 만들지 못했습니다."
+    finally:
+        job["finished"] = time.time()
+        _building.pop(job["key"], None)
+
+async def _worker_loop():
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run_job(job_id)
+        finally:
+            _queue.task_done()
+
+def start_export_workers():
+    """워커 시작 (이벤트 루프 안에서 호출)"""
+    global _queue
+    _queue = asyncio.Queue()
+    for _ in range(max(1, EXPORT_WORKERS)):
+        _workers.append(asyncio.create_task(_worker_loop()))
+
+async def stop_export_workers():
+    for task in _workers:
+        task.cancel()
+    for task in _workers:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _workers.clear()
@@ -0,0 +1,127 @@
+import io
+import csv
+from typing import Dict, Any, Iterable, Iterator
+
+# ----------------------------
+# 방문 기록 내보내기 (CSV)
+# ----------------------------
+# 저장소에서 방문을 하나씩 읽어 일정 행 수마다 바이트 조각으로 내보낸다.
+# 전체 파일을 메모리에 만들지 않으므로 기록 수와 관계없이 메모리 사용량이 일정하고,
+# BOM과 헤더는 첫 조각으로 바로 전송된다.
+EXPORT_HEADERS = ["장소", "닉네임", "유저아이디", "방문시각"]
+CSV_CHUNK_ROWS = 1000
+CSV_BOM = b"\xef\xbb\xbf"  # Excel에서 UTF-8로 열리도록
+
+def export_row(visit: Dict[str, Any]) -> list:
+    return [
+        visit.get("store_name", ""),
+        visit.get("nickname", ""),
+        visit.get("user_id", ""),
+        visit.get("visit_datetime", ""),
+    ]
+
+def iter_csv(visits: Iterable[Dict[str, Any]], chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[bytes]:
+    """방문 기록 → CSV 바이트 조각 (BOM + 헤더가 첫 조각)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    yield CSV_BOM + buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for visit in visits:
+        writer.writerow(export_row(visit))
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if pending:
+        yield buffer.getvalue().encode("utf-8")
+
+def export_filename(ext: str, now, start_date: str = None, end_date: str = None) -> str:
+    """visits_[시작_끝_]생성시각.확장자"""
+    period = f"{start_date or ''}_{end_date or ''}_".replace("-", "") if (start_date or end_date) else ""
+    return f"visits_{period}{now.strftime('%Y%m%d_%H%M%S')}.{ext}"
+
+# ----------------------------
+# 방문 기록 내보내기 (XLSX)
+# ----------------------------
+# openpyxl write-only 모드: 행을 셀 객체로 들고 있지 않고 바로 임시 파일에 기록한다.
+# 방문 기록을 한 번 순회하면서 원본 시트를 쓰고, 같은 순회에서 매장별/방문자별 합계를 모아
+# 요약 시트 두 장을 마지막에 쓴다. (합계는 매장 수 + 방문자 수만큼만 메모리 사용)
+XLSX_HEADER_COLOR = "4472C4"
+STORE_SUMMARY_HEADERS = ["장소", "매장 코드", "방문 수", "순방문자", "첫 방문", "마지막 방문"]
+VISITOR_SUMMARY_HEADERS = ["닉네임", "유저아이디", "방문 수", "방문 매장 수", "첫 방문", "마지막 방문"]
+
+def _xlsx_sheet(wb, title: str, headers: list, widths: list):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    ws = wb.create_sheet(title)
+    for i, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.freeze_panes = "A2"
+
+    fill = PatternFill(start_color=XLSX_HEADER_COLOR, end_color=XLSX_HEADER_COLOR, fill_type="solid")
+    font = Font(bold=True, color="FFFFFF")
+    row = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = fill
+        cell.font = font
+        cell.alignment = Alignment(horizontal="center")
+        row.append(cell)
+    ws.append(row)
+    return ws
+
+def _track(summary: dict, visit_datetime: str):
+    summary["count"] += 1
+    if not summary["first"] or visit_datetime < summary["first"]:
+        summary["first"] = visit_datetime
+    if visit_datetime > summary["last"]:
+        summary["last"] = visit_datetime
+
+def write_visits_xlsx(visits: Iterable[Dict[str, Any]], path: str) -> int:
+    """방문 기록 → XLSX 파일 (방문 기록 / 매장별 요약 / 방문자별 요약 시트). 기록한 방문 수 반환"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    raw = _xlsx_sheet(wb, "방문 기록", EXPORT_HEADERS, [22, 20, 22, 20])
+    store_ws = _xlsx_sheet(wb, "매장별 요약", STORE_SUMMARY_HEADERS, [22, 12, 10, 10, 20, 20])
+    visitor_ws = _xlsx_sheet(wb, "방문자별 요약", VISITOR_SUMMARY_HEADERS, [20, 22, 10, 12, 20, 20])
+
+    stores: Dict[str, dict] = {}
+    visitors: Dict[str, dict] = {}
+    rows = 0
+    for visit in visits:
+        raw.append(export_row(visit))
+        rows += 1
+
+        when = visit.get("visit_datetime", "")
+        user_id = str(visit.get("user_id", ""))
+        code = visit.get("store_code", "")
+
+        store = stores.get(code)
+        if store is None:
+            store = stores[code] = {"name": visit.get("store_name", code), "count": 0, "first": "", "last": "", "users": set()}
+        _track(store, when)
+        store["users"].add(user_id)
+
+        visitor = visitors.get(user_id)
+        if visitor is None:
+            visitor = visitors[user_id] = {"nickname": visit.get("nickname", ""), "count": 0, "first": "", "last": "", "stores": set()}
+        _track(visitor, when)
+        visitor["stores"].add(code)
+
+    for code, s in sorted(stores.items(), key=lambda item: -item[1]["count"]):
+        store_ws.append([s["name"], code, s["count"], len(s["users"]), s["first"], s["last"]])
+    for user_id, v in sorted(visitors.items(), key=lambda item: -item[1]["count"]):
+        visitor_ws.append([v["nickname"], user_id, v["count"], len(v["stores"]), v["first"], v["last"]])
+
+    wb.save(path)
+    return rows
@@ -0,0 +1,181 @@
+import asyncio
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+from config import JOBS_FILE, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS
+from database import load_json, save_json, _now_kst
+
+# ----------------------------
+# 백그라운드 작업 큐 (파일 기반, 재시도 지원)
+# ----------------------------
+# 작업 상태: pending → running → done / failed
+# 프로세스가 재시작되어도 jobs.json에 남은 pending/running 작업은 다시 실행된다.
+_jobs: Dict[str, Any] = {}
+_handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+_wakeup: Optional[asyncio.Event] = None
+_worker_task: Optional[asyncio.Task] = None
+
+JOB_KEEP_HOURS = 24
+
+def load_jobs() -> Dict[str, Any]:
+    global _jobs
+    _jobs = load_json(JOBS_FILE)
+    return _jobs
+
+def save_jobs():
+    save_json(JOBS_FILE, _jobs)
+
+def register_handler(kind: str):
+    """작업 종류별 처리 함수 등록 (데코레이터)"""
+    def decorator(func: Callable[[dict], Awaitable[None]]):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+def enqueue_job(kind: str, payload: dict, delay_seconds: float = 0) -> str:
+    """작업 추가 후 작업 ID 반환 (delay_seconds 후 실행)"""
+    job_id = secrets.token_urlsafe(12)
+    now = _now_kst()
+    run_at = now + timedelta(seconds=delay_seconds)
+    _jobs[job_id] = {
+        "kind": kind,
+        "payload": payload,
+        "result": {},
+        "status": "pending",
+        "attempts": 0,
+        "last_error": None,
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+        "next_run_at": run_at.isoformat(),
+    }
+    save_jobs()
+    if _wakeup:
+        _wakeup.set()
+    return job_id
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return _jobs.get(job_id)
+
+def update_job_payload(job_id: str, updates: dict) -> bool:
+    """아직 실행 전인 작업의 payload 갱신. 이미 실행됐으면 False"""
+    job = _jobs.get(job_id)
+    if not job or job["status"] != "pending":
+        return False
+    job["payload"].update(updates)
+    job["updated_at"] = _now_kst().isoformat()
+    save_jobs()
+    return True
+
+def _due_jobs() -> list:
+    now = _now_kst()
+    due = []
+    for job_id, job in _jobs.items():
+        if job["status"] != "pending":
+            continue
+        try:
+            if datetime.fromisoformat(job["next_run_at"]) > now:
+                continue
+        except (ValueError, KeyError):
+            pass
+        due.append(job_id)
+    return sorted(due, key=lambda jid: _jobs[jid]["created_at"])
+
+def _next_wait_seconds() -> float:
+    """다음 재시도 예정 작업까지 대기 시간"""
+    now = _now_kst()
+    waits = []
+    for job in _jobs.values():
+        if job["status"] != "pending":
+            continue
+        try:
+            waits.append((datetime.fromisoformat(job["next_run_at"]) - now).total_seconds())
+        except (ValueError, KeyError):
+            waits.append(0)
+    return max(0.0, min(waits)) if waits else 60.0
+
+def cleanup_finished_jobs() -> int:
+    """완료/실패 후 오래된 작업 정리"""
+    cutoff = _now_kst() - timedelta(hours=JOB_KEEP_HOURS)
+    expired = []
+    for job_id, job in _jobs.items():
+        if job["status"] not in ("done", "failed"):
+            continue
+        try:
+            if datetime.fromisoformat(job["updated_at"]) < cutoff:
+                expired.append(job_id)
+        except (ValueError, KeyError):
+            expired.append(job_id)
+
+    for job_id in expired:
+        del _jobs[job_id]
+    if expired:
+        save_jobs()
+    return len(expired)
+
+async def _run_job(job_id: str):
+    job = _jobs[job_id]
+    handler = _handlers.get(job["kind"])
+    if not handler:
+        job["status"] = "failed"
+        job["last_error"] = f"unknown job kind: {job['kind']}"
+        job["updated_at"] = _now_kst().isoformat()
+        save_jobs()
+        return
+
+    job["status"] = "running"
+    job["attempts"] += 1
+    save_jobs()
+
+    try:
+        await handler(job)
+        job["status"] = "done"
+        job["last_error"] = None
+    except Exception as e:
+        print(f"Job {job_id} ({job['kind']}) 실패 [{job['attempts']}/{JOB_MAX_ATTEMPTS}]: {e}")
+        job["last_error"] = str(e)
+        if job["attempts"] >= JOB_MAX_ATTEMPTS:
+            job["status"] = "failed"
+        else:
+            # 지수 백오프: 2s, 4s, 8s, ...
+            delay = JOB_RETRY_BASE_SECONDS * (2 ** (job["attempts"] - 1))
+            job["status"] = "pending"
+            job["next_run_at"] = (_now_kst() + timedelta(seconds=delay)).isoformat()
+
+    job["updated_at"] = _now_kst().isoformat()
+    save_jobs()
+
+async def _worker_loop():
+    while True:
+        _wakeup.clear()
+        for job_id in _due_jobs():
+            await _run_job(job_id)
+        cleanup_finished_jobs()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=_next_wait_seconds())
+        except asyncio.TimeoutError:
+            pass
+
+def start_worker():
+    """워커 시작 (이벤트 루프 안에서 호출)"""
+    global _wakeup, _worker_task
+    load_jobs()
+
+    # 실행 중 종료된 작업은 다시 대기열로
+    for job in _jobs.values():
+        if job["status"] == "running":
+            job["status"] = "pending"
+    save_jobs()
+
+    _wakeup = asyncio.Event()
+    _worker_task = asyncio.create_task(_worker_loop())
+
+async def stop_worker():
+    global _worker_task
+    if _worker_task:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
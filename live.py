@@ -0,0 +1,179 @@
+import os
+import json
+import asyncio
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+from config import STREAM_MAX_CLIENTS, STREAM_CLIENT_BUFFER, STREAM_POLL_SECONDS
+from database import change_log_path, get_stores, get_dashboard_summary, _gid
+
+# ----------------------------
+# 대시보드 실시간 갱신 (SSE)
+# ----------------------------
+# 접속자가 있는 서버의 changes.log 끝을 STREAM_POLL_SECONDS마다 따라 읽어서
+# 새 방문(visit), 삭제(remove), 바뀐 요약 숫자(summary)를 이벤트로 보낸다.
+# 이벤트는 한 번만 직렬화해 모든 접속자 큐에 넣고, 큐는 STREAM_CLIENT_BUFFER개로 제한한다.
+# 큐가 넘친 (느린) 접속자는 밀린 이벤트를 버리고 resync 한 번으로 대신해 REST로 다시 불러오게 한다.
+_subscribers: Dict[str, Set["Subscriber"]] = {}   # 서버 ID → 접속자
+_tails: Dict[str, Tuple[int, int]] = {}           # 서버 ID → (changes.log inode, 읽은 위치)
+_task: Optional[asyncio.Task] = None
+
+class Subscriber:
+    def __init__(self, gid: str, store_code: Optional[str]):
+        self.gid = gid
+        self.store_code = store_code
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_CLIENT_BUFFER)
+        self.overflowed = False
+
+    def push(self, message: str):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # 밀린 이벤트 대신 resync 하나만 남긴다
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(sse_message("resync", {}))
+
+    async def next_message(self, timeout: float) -> Optional[str]:
+        """다음 이벤트 (timeout 동안 없으면 None)"""
+        try:
+            message = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        if self.queue.empty():
+            self.overflowed = False
+        return message
+
+def sse_message(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+def client_count() -> int:
+    return sum(len(subs) for subs in _subscribers.values())
+
+def subscribe(guild_id, store_code: Optional[str] = None) -> Optional[Subscriber]:
+    """접속자 등록. 최대 접속자 수를 넘으면 None"""
+    if client_count() >= STREAM_MAX_CLIENTS:
+        return None
+    gid = _gid(guild_id)
+    if gid not in _subscribers:
+        _subscribers[gid] = set()
+        _tails[gid] = _log_position(gid)   # 접속 이후 변경만 전달
+    sub = Subscriber(gid, store_code)
+    _subscribers[gid].add(sub)
+    return sub
+
+def unsubscribe(sub: Subscriber):
+    subs = _subscribers.get(sub.gid)
+    if subs is None:
+        return
+    subs.discard(sub)
+    if not subs:
+        del _subscribers[sub.gid]
+        _tails.pop(sub.gid, None)
+
+def _log_position(gid: str) -> Tuple[int, int]:
+    try:
+        st = os.stat(change_log_path(gid))
+        return st.st_ino, st.st_size
+    except OSError:
+        return 0, 0
+
+def _read_changes(gid: str) -> Tuple[List[dict], bool]:
+    """(새 변경 목록, 놓친 변경이 있을 수 있는지). 파일이 교체됐으면 새 파일 처음부터"""
+    path = change_log_path(gid)
+    inode, offset = _tails.get(gid, (0, 0))
+    try:
+        st = os.stat(path)
+    except OSError:
+        return [], False
+
+    missed = False
+    if st.st_ino != inode or st.st_size < offset:
+        missed = inode != 0   # 예전 파일 끝부분은 읽지 못함
+        inode, offset = st.st_ino, 0
+    if st.st_size == offset:
+        _tails[gid] = (inode, offset)
+        return [], missed
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read(st.st_size - offset)
+    end = chunk.rfind(b"\n") + 1   # 덜 쓰인 마지막 줄은 다음에
+    _tails[gid] = (inode, offset + end)
+
+    changes = []
+    for line in chunk[:end].splitlines():
+        try:
+            changes.append(json.loads(line))
+        except ValueError:
+            continue
+    return changes, missed
+
+def _publish(gid: str, changes: List[dict], missed: bool):
+    subs = list(_subscribers.get(gid, ()))
+    if missed:
+        message = sse_message("resync", {})
+        for sub in subs:
+            sub.push(message)
+    if not changes:
+        return
+
+    names = {code: s.get("store_name", code) for code, s in get_stores(gid).items()}
+    changed_stores = set()
+    for change in changes:
+        code = change.get("store_code")
+        changed_stores.add(code)
+        if change.get("type") == "visit":
+            v = change.get("visit", {})
+            message = sse_message("visit", {
+                "store_code": code,
+                "store_name": names.get(code, code),
+                "user_id": v.get("user_id", ""),
+                "username": v.get("username", ""),
+                "nickname": v.get("nickname", ""),
+                "visit_date": v.get("visit_date", ""),
+                "visit_time": v.get("visit_time", ""),
+                "created_at": v.get("created_at", ""),
+            })
+        else:
+            message = sse_message("remove", {"store_code": code})
+        for sub in subs:
+            if sub.store_code in (None, code):
+                sub.push(message)
+
+    # 요약 숫자는 보는 범위(전체 / 매장)마다 한 번만 계산
+    for scope in {sub.store_code for sub in subs}:
+        if scope is not None and scope not in changed_stores:
+            continue
+        message = sse_message("summary", get_dashboard_summary(gid, scope))
+        for sub in subs:
+            if sub.store_code == scope:
+                sub.push(message)
+
+async def _tail_loop():
+    while True:
+        await asyncio.sleep(STREAM_POLL_SECONDS)
+        for gid in list(_subscribers):
+            try:
+                changes, missed = _read_changes(gid)
+                if changes or missed:
+                    _publish(gid, changes, missed)
+            except Exception as e:
+                print(f"Live stream error ({gid}): {e}")
+
+def start_live():
+    """변경 기록 감시 시작 (이벤트 루프 안에서 호출)"""
+    global _task
+    _task = asyncio.create_task(_tail_loop())
+
+async def stop_live():
+    global _task
+    if _task:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -1,32 +1,39 @@
 import os
+import time
 import random
-from io import BytesIO
+import asyncio
+import hashlib
 from datetime import datetime
+from typing import Optional, Dict
 
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
-import qrcode
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
 from config import (
     SESSION_SECRET, HTTPS_ONLY, BASE_URL, 
-    WEB_SESSION_TTL_SECONDS, KST
+    WEB_SESSION_TTL_SECONDS, KST, JOB_MAX_ATTEMPTS, DEVELOPER_USER_ID
 )
 from database import (
     get_store, get_stores, add_visit, get_user_visit_count,
-    _now_kst
+    store_guild_id, _now_kst
 )
 from discord_api import (
     get_oauth_authorize_url, get_discord_authorize_url,
     exchange_oauth_code, fetch_oauth_user,
     get_guild_member, member_display_name, member_username,
     get_member_role_names, check_user_role_position, add_role_to_member,
-    send_dm
+    send_dm, start_member_prefetch, cancel_member_prefetch, invalidate_member
 )
+from jobs import register_handler, enqueue_job, get_job, update_job_payload, start_worker, stop_worker
+from metrics import record_since, get_summary
+from qr import render_qr_png_async
+from admission import get_controller, get_admission_stats
+from throttle import check_lockout, record_failure, record_success, ALERT_WINDOW_SECONDS
 
 # ----------------------------
 # App Setup
@@ -123,6 +130,11 @@ async def oauth_callback(request: Request, code: str = "", state: str = ""):
         request.session["login_ts"] = int(_now_kst().timestamp())
         request.session["loc"] = loc
         
+        # 체크인에 필요한 멤버/역할 정보를 미리 가져오기 (응답은 기다리지 않음)
+        store = get_store(loc) if loc else None
+        if store:
+            start_member_prefetch(store_guild_id(store), int(user.get("id")))
+        
     except Exception as e:
         print(f"OAuth error: {e}")
         request.session.clear()
@@ -134,13 +146,143 @@ async def oauth_callback(request: Request, code: str = "", state: str = ""):
 async def logout(request: Request):
     """로그아웃"""
     loc = (request.session.get("loc") or "").strip()
+    user = request.session.get("user")
+    if user and user.get("id"):
+        cancel_member_prefetch(int(user.get("id")))
     request.session.clear()
     return RedirectResponse(f"/?loc={loc}", status_code=302)
 
+# ----------------------------
+# Idempotency (재시도/중복 클릭 흡수)
+# ----------------------------
+# (user_id, loc, key) → (만료 시각, 요청 지문, status_code, 응답 body)
+IDEMPOTENCY_TTL_SECONDS = 120
+IDEMPOTENCY_MAX_ENTRIES = 10000
+_idem_results: Dict[tuple, tuple] = {}
+_idem_inflight: Dict[tuple, asyncio.Future] = {}
+
+def _prune_idempotency(now: float):
+    expired = [k for k, v in _idem_results.items() if v[0] <= now]
+    for k in expired:
+        del _idem_results[k]
+    # 그래도 넘치면 오래된 것부터 제거
+    while len(_idem_results) >= IDEMPOTENCY_MAX_ENTRIES:
+        _idem_results.pop(next(iter(_idem_results)))
+
+async def _idempotency_key(request: Request) -> Optional[tuple]:
+    user = request.session.get("user")
+    if not user:
+        return None
+    try:
+        body = await request.json()
+    except Exception:
+        return None
+    key = (body.get("idempotency_key") or request.headers.get("Idempotency-Key") or "").strip()
+    if not key or len(key) > 64:
+        return None
+    loc = (body.get("loc") or request.session.get("loc") or "").strip()
+    return (int(user.get("id")), loc, key)
+
+def _request_fingerprint(body: dict) -> str:
+    passphrase = (body.get("passphrase") or "").strip()
+    return hashlib.sha256(passphrase.encode()).hexdigest()
+
+def _replay(status_code: int, content: bytes) -> Response:
+    return Response(
+        content=content,
+        status_code=status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+def _checkin_rate_key(request: Request) -> str:
+    """로그인 유저는 유저 단위, 아니면 IP 단위 (매장 Wi-Fi 공유 대응)"""
+    user = request.session.get("user")
+    if user and user.get("id"):
+        return f"user:{user.get('id')}"
+    return get_remote_address(request)
+
 @app.post("/api/checkin")
-@limiter.limit("10/minute")
+@limiter.limit("30/minute", key_func=_checkin_rate_key)
 async def api_checkin(request: Request):
     """체크인 API"""
+    started = time.perf_counter()
+    try:
+        key = await _idempotency_key(request)
+        if not key:
+            return await _admitted_checkin(request)
+
+        fingerprint = _request_fingerprint(await request.json())
+        now = time.time()
+
+        # 같은 키로 이미 처리된 요청 → 저장된 결과 그대로 반환 (Discord/저장소 호출 없음)
+        cached = _idem_results.get(key)
+        if cached and cached[0] > now and cached[1] == fingerprint:
+            return _replay(cached[2], cached[3])
+
+        # 같은 키의 요청이 처리 중이면 그 결과를 기다림
+        inflight = _idem_inflight.get(key)
+        if inflight:
+            result = await asyncio.shield(inflight)
+            if result and result[0] == fingerprint:
+                return _replay(result[1], result[2])
+            return await _admitted_checkin(request)
+
+        fut = asyncio.get_running_loop().create_future()
+        _idem_inflight[key] = fut
+        result = None
+        try:
+            response = await _admitted_checkin(request)
+            # 대기/거절 응답은 결과가 아니므로 저장하지 않음
+            if response.status_code not in (401, 202, 503):
+                result = (fingerprint, response.status_code, bytes(response.body))
+                _prune_idempotency(now)
+                _idem_results[key] = (now + IDEMPOTENCY_TTL_SECONDS,) + result
+            return response
+        finally:
+            _idem_inflight.pop(key, None)
+            fut.set_result(result)
+    finally:
+        record_since("api_checkin", started)
+
+# ----------------------------
+# Admission Control (매장별 동시 처리 제한)
+# ----------------------------
+async def _admitted_checkin(request: Request):
+    """매장별 입장 제어를 거친 뒤 체크인 처리"""
+    user = request.session.get("user")
+    body = await request.json()
+    loc = (body.get("loc") or request.session.get("loc") or "").strip()
+    if not user or not loc or not get_store(loc):
+        return await _checkin(request)
+    
+    controller = get_controller(loc)
+    status, ticket, position = await controller.acquire(body.get("queue_ticket"))
+    
+    if status == "shed":
+        return JSONResponse({
+            "success": False,
+            "message": "지금 체크인 요청이 너무 많습니다. 잠시 후 다시 시도해주세요.",
+            "retry_after": 10
+        }, status_code=503, headers={"Retry-After": "10"})
+    
+    if status == "queued":
+        return JSONResponse({
+            "success": False,
+            "queued": True,
+            "queue_ticket": ticket,
+            "queue_position": position,
+            "eta_seconds": controller.eta_seconds(position),
+            "message": f"체크인 대기 중입니다. (현재 {position}번째)"
+        }, status_code=202)
+    
+    started = time.perf_counter()
+    try:
+        return await _checkin(request)
+    finally:
+        controller.release((time.perf_counter() - started) * 1000)
+
+async def _checkin(request: Request):
     user = request.session.get("user")
     if not user:
         return JSONResponse({"success": False, "message": "로그인이 필요합니다."}, status_code=401)
@@ -158,9 +300,19 @@ async def api_checkin(request: Request):
         return JSONResponse({"success": False, "message": "등록되지 않은 매장입니다."}, status_code=404)
     
     user_id = int(user.get("id"))
+    guild_id = store_guild_id(store)
+    
+    # 연속 실패로 잠긴 경우 Discord API 호출 전에 거절
+    locked_for = check_lockout(user_id, loc)
+    if locked_for:
+        return JSONResponse({
+            "success": False,
+            "message": f"입장 시도 실패가 반복되어 잠시 체크인이 제한됩니다. {locked_for}초 후 다시 시도해주세요.",
+            "retry_after": locked_for
+        }, status_code=429, headers={"Retry-After": str(locked_for)})
     
     # 서버 멤버 정보 가져오기
-    member = await get_guild_member(user_id)
+    member = await get_guild_member(guild_id, user_id, use_cache=True)
     if not member:
         return JSONResponse({
             "success": False, 
@@ -173,26 +325,12 @@ async def api_checkin(request: Request):
     # 역할 검증 (최소역할이 설정된 경우)
     min_role_id = store.get("min_role_id")
     if min_role_id:
-        has_role = await check_user_role_position(user_id, min_role_id)
+        has_role = await check_user_role_position(guild_id, user_id, min_role_id, use_cache=True)
         if not has_role:
-            role_names = await get_member_role_names(user_id)
+            role_names = await get_member_role_names(guild_id, user_id, use_cache=True)
             
-            # 매장주에게 입장 실패 알림
-            owner_id = store.get("owner_id")
-            if owner_id:
-                now = _now_kst()
-                embed = {
-                    "title": f"⚠️ [입장 실패] {nickname}님이 입장 시도",
-                    "color": 0xFFA500,  # Orange
-                    "description": "**실패 사유**: 입장 권한 부족 (최소 역할 미달)",
-                    "fields": [
-                        {"name": "장소", "value": store["store_name"], "inline": True},
-                        {"name": "시도자", "value": f"<@{user_id}>", "inline": True},
-                        {"name": "시도 시간", "value": f"{now.strftime('%H:%M')} (KST)", "inline": True},
-                        {"name": "현재 역할", "value": ", ".join(role_names) if role_names else "(없음)", "inline": False},
-                    ]
-                }
-                await send_dm(owner_id, embed=embed)
+            # 매장주에게 입장 실패 알림 (백그라운드, 연속 실패는 모아서)
+            _record_checkin_failure(loc, store, user_id, nickname, "role", role_names)
             
             return JSONResponse({
                 "success": False,
@@ -211,30 +349,16 @@ async def api_checkin(request: Request):
             }, status_code=400)
         
         if passphrase_input != store_passphrase:
-            # 매장주에게 암구호 오류 알림
-            owner_id = store.get("owner_id")
-            if owner_id:
-                now = _now_kst()
-                role_names = await get_member_role_names(user_id)
-                
-                embed = {
-                    "title": f"⚠️ [입장 실패] {nickname}님이 입장 시도",
-                    "color": 0xFF0000,  # Red
-                    "description": "**실패 사유**: 암구호 불일치",
-                    "fields": [
-                        {"name": "장소", "value": store["store_name"], "inline": True},
-                        {"name": "시도자", "value": f"<@{user_id}>", "inline": True},
-                        {"name": "시도 시간", "value": f"{now.strftime('%H:%M')} (KST)", "inline": True},
-                        {"name": "역할", "value": ", ".join(role_names) if role_names else "(없음)", "inline": False},
-                    ]
-                }
-                await send_dm(owner_id, embed=embed)
+            # 매장주에게 암구호 오류 알림 (백그라운드, 연속 실패는 모아서)
+            _record_checkin_failure(loc, store, user_id, nickname, "passphrase")
             
             return JSONResponse({
                 "success": False,
                 "message": "암구호가 일치하지 않습니다."
             }, status_code=403)
     
+    record_success(user_id, loc)
+    
     # 방문 기록 추가 (중복 체크)
     is_new_visit = add_visit(loc, user_id, username, nickname)
     
@@ -248,67 +372,202 @@ async def api_checkin(request: Request):
     # 방문 횟수
     visit_count = get_user_visit_count(loc, user_id)
     
-    # 역할 부여 (설정된 경우)
-    role_granted = False
+    # 역할 부여 + 매장주 DM은 기록 저장 후 백그라운드에서 처리
     grant_role_id = store.get("grant_role_id")
-    if grant_role_id:
-        role_granted = await add_role_to_member(user_id, grant_role_id)
+    job_id = None
+    if grant_role_id or store.get("owner_id"):
+        job_id = enqueue_job("checkin_followup", {
+            "store_code": loc,
+            "guild_id": guild_id,
+            "store_name": store["store_name"],
+            "owner_id": store.get("owner_id"),
+            "grant_role_id": grant_role_id,
+            "user_id": user_id,
+            "nickname": nickname,
+            "visit_count": visit_count,
+            "visited_at": _now_kst().isoformat(),
+        })
     
-    # 역할 목록 가져오기
-    role_names = await get_member_role_names(user_id)
+    return JSONResponse({
+        "success": True,
+        "message": f"{store['store_name']} 체크인 완료!",
+        "visit_count": visit_count,
+        "role_pending": bool(grant_role_id),
+        "job_id": job_id,
+        "nickname": nickname
+    })
+
+def _record_checkin_failure(loc: str, store: dict, user_id: int, nickname: str, reason: str, role_names: list = None):
+    """실패 횟수 기록 + 매장주 알림 예약
+
+    연속 실패의 첫 번째는 바로 알리고, 이후 실패는 ALERT_WINDOW_SECONDS 동안
+    하나의 "N회 실패" 알림으로 합친다.
+    """
+    state = record_failure(user_id, loc)
     
-    # 매장주에게 DM 알림 (성공)
     owner_id = store.get("owner_id")
-    if owner_id:
-        now = _now_kst()
+    if not owner_id:
+        return
+    
+    updates = {
+        "nickname": nickname,
+        "reason": reason,
+        "role_names": role_names,
+        "attempted_at": _now_kst().isoformat(),
+        "locked_until": datetime.fromtimestamp(state["locked_until"], tz=KST).isoformat() if state["locked_until"] else None,
+    }
+    
+    job_id = state.get("alert_job_id")
+    job = get_job(job_id) if job_id else None
+    if job and update_job_payload(job_id, dict(updates, count=job["payload"].get("count", 1) + 1)):
+        return
+    
+    payload = dict(updates, owner_id=owner_id, user_id=user_id, guild_id=store_guild_id(store), store_name=store["store_name"], count=1)
+    state["alert_job_id"] = enqueue_job(
+        "checkin_failed_dm",
+        payload,
+        delay_seconds=0 if state["count"] == 1 else ALERT_WINDOW_SECONDS,
+    )
+
+@app.get("/api/checkin/status/{job_id}")
+async def api_checkin_status(request: Request, job_id: str):
+    """체크인 후속 작업(역할 부여/알림) 상태 조회"""
+    user = request.session.get("user")
+    if not user:
+        return JSONResponse({"success": False, "message": "로그인이 필요합니다."}, status_code=401)
+    
+    job = get_job(job_id)
+    if not job or job["payload"].get("user_id") != int(user.get("id")):
+        return JSONResponse({"success": False, "message": "작업을 찾을 수 없습니다."}, status_code=404)
+    
+    return JSONResponse({
+        "success": True,
+        "status": job["status"],
+        "role_granted": bool(job["result"].get("role_granted")),
+    })
+
+# ----------------------------
+# Background Jobs
+# ----------------------------
+@register_handler("checkin_followup")
+async def handle_checkin_followup(job: dict):
+    """체크인 성공 후 역할 부여 + 매장주 DM"""
+    p = job["payload"]
+    result = job["result"]
+    user_id = p["user_id"]
+    guild_id = p.get("guild_id")  # 예전 작업은 guild_id 없음 → 기본 서버
+    
+    # 역할 부여 (설정된 경우) - 재시도 시 이미 부여됐으면 건너뜀
+    grant_role_id = p.get("grant_role_id")
+    if grant_role_id and not result.get("role_granted"):
+        result["role_granted"] = await add_role_to_member(guild_id, user_id, grant_role_id)
+        invalidate_member(guild_id, user_id)
+        if not result["role_granted"] and job["attempts"] < JOB_MAX_ATTEMPTS:
+            raise RuntimeError("역할 부여 실패")
+    
+    # 매장주에게 DM 알림 (성공)
+    owner_id = p.get("owner_id")
+    if owner_id and not result.get("dm_sent"):
+        role_names = await get_member_role_names(guild_id, user_id)
+        visit_count = p["visit_count"]
+        visited_at = datetime.fromisoformat(p["visited_at"])
         label = "오늘 첫 방문" if visit_count == 1 else f"누적 {visit_count}회차"
         
         embed = {
-            "title": f"✅ [입장 성공] {nickname}님이 체크인! ({label})",
+            "title": f"✅ [입장 성공] {p['nickname']}님이 체크인! ({label})",
             "color": 0x00FF00,  # Green
             "fields": [
-                {"name": "장소", "value": store["store_name"], "inline": True},
+                {"name": "장소", "value": p["store_name"], "inline": True},
                 {"name": "방문자", "value": f"<@{user_id}>", "inline": True},
-                {"name": "방문 시간", "value": f"{now.strftime('%H:%M')} (KST)", "inline": True},
+                {"name": "방문 시간", "value": f"{visited_at.strftime('%H:%M')} (KST)", "inline": True},
                 {"name": "방문 횟수", "value": f"{visit_count}번째 방문", "inline": True},
                 {"name": "역할", "value": ", ".join(role_names) if role_names else "(없음)", "inline": False},
             ]
         }
         
-        if role_granted:
+        if result.get("role_granted"):
             embed["fields"].append({
                 "name": "역할 부여", 
                 "value": "✅ 부여됨", 
                 "inline": True
             })
         
-        await send_dm(owner_id, embed=embed)
+        result["dm_sent"] = await send_dm(owner_id, embed=embed)
+        if not result["dm_sent"]:
+            raise RuntimeError("매장주 DM 전송 실패")
+
+@register_handler("checkin_failed_dm")
+async def handle_checkin_failed_dm(job: dict):
+    """입장 실패 매장주 DM (역할 미달 / 암구호 불일치)"""
+    p = job["payload"]
+    user_id = p["user_id"]
+    count = p.get("count", 1)
+    attempted_at = datetime.fromisoformat(p["attempted_at"])
     
-    return JSONResponse({
-        "success": True,
-        "message": f"{store['store_name']} 체크인 완료!",
-        "visit_count": visit_count,
-        "role_granted": role_granted,
-        "nickname": nickname
-    })
+    if p["reason"] == "role":
+        color, reason, role_label = 0xFFA500, "입장 권한 부족 (최소 역할 미달)", "현재 역할"  # Orange
+        role_names = p.get("role_names") or []
+    else:
+        color, reason, role_label = 0xFF0000, "암구호 불일치", "역할"  # Red
+        role_names = await get_member_role_names(p.get("guild_id"), user_id)
+    
+    title = f"⚠️ [입장 실패] {p['nickname']}님이 입장 시도"
+    description = f"**실패 사유**: {reason}"
+    if count > 1:
+        title += f" ({count}회)"
+        description += f"\n최근 {count}회 연속 실패"
+    
+    embed = {
+        "title": title,
+        "color": color,
+        "description": description,
+        "fields": [
+            {"name": "장소", "value": p["store_name"], "inline": True},
+            {"name": "시도자", "value": f"<@{user_id}>", "inline": True},
+            {"name": "시도 시간" if count == 1 else "마지막 시도", "value": f"{attempted_at.strftime('%H:%M')} (KST)", "inline": True},
+            {"name": role_label, "value": ", ".join(role_names) if role_names else "(없음)", "inline": False},
+        ]
+    }
+    if p.get("locked_until"):
+        locked_until = datetime.fromisoformat(p["locked_until"])
+        embed["fields"].append({
+            "name": "체크인 제한",
+            "value": f"{locked_until.strftime('%H:%M:%S')} (KST) 까지",
+            "inline": True
+        })
+    if not await send_dm(p["owner_id"], embed=embed):
+        raise RuntimeError("매장주 DM 전송 실패")
+
+@app.on_event("startup")
+async def on_startup():
+    start_worker()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_worker()
 
 # ----------------------------
 # QR Code Generation
 # ----------------------------
 @app.get("/qr/{store_code}.png")
 async def qr_image(request: Request, store_code: str):
-    """QR 코드 이미지 생성"""
+    """QR 코드 이미지 (캐시 + ETag)"""
+    if not get_store(store_code):
+        return JSONResponse({"success": False, "message": "등록되지 않은 매장입니다."}, status_code=404)
+
     url = f"{BASE_URL}/?loc={store_code}"
     
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
-    qr.add_data(url)
-    qr.make(fit=True)
+    png, etag = await render_qr_png_async(url)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=86400",
+    }
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    buf = BytesIO()
-    img.save(buf, format="PNG")
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
     
-    return Response(content=buf.getvalue(), media_type="image/png")
+    return Response(content=png, media_type="image/png", headers=headers)
 
 # ----------------------------
 # Health Check
@@ -316,3 +575,18 @@ async def qr_image(request: Request, store_code: str):
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+def can_view_metrics(request: Request) -> bool:
+    """같은 서버 안(loopback)에서 온 요청이거나 개발자로 로그인한 세션"""
+    host = request.client.host if request.client else ""
+    if host in ("127.0.0.1", "::1", "localhost"):
+        return True
+    user = request.session.get("user") or {}
+    return bool(DEVELOPER_USER_ID) and user.get("id") == DEVELOPER_USER_ID
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """응답 시간 통계 (p50/p99) + 매장별 대기열. 내부 또는 개발자만"""
+    if not can_view_metrics(request):
+        return JSONResponse({"success": False, "message": "권한이 없습니다."}, status_code=403)
+    return {"latency": get_summary(), "admission": get_admission_stats()}
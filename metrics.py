@@ -0,0 +1,97 @@
+import time
+import bisect
+from collections import deque
+from typing import Dict, Any, List, Tuple, Optional
+
+# ----------------------------
+# 응답 시간 측정 (p50/p99)
+# ----------------------------
+HISTOGRAM_BOUNDS_MS = (50, 100, 250, 500, 1000, 2000, 3000)
+
+class LatencyRecorder:
+    """최근 N개 측정값을 보관하고 백분위수를 계산"""
+
+    def __init__(self, maxlen: int = 2000):
+        self.samples = deque(maxlen=maxlen)
+        self.count = 0
+
+    def record(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def histogram(self, bounds=HISTOGRAM_BOUNDS_MS) -> List[Tuple[str, int]]:
+        """구간별 개수 [("<50ms", n), ..., (">=3000ms", n)]"""
+        counts = [0] * (len(bounds) + 1)
+        for ms in self.samples:
+            counts[bisect.bisect_right(bounds, ms)] += 1
+        labels = [f"<{b}ms" for b in bounds] + [f">={bounds[-1]}ms"]
+        return list(zip(labels, counts))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "window": len(self.samples),
+            "p50_ms": round(self.percentile(50), 1),
+            "p90_ms": round(self.percentile(90), 1),
+            "p99_ms": round(self.percentile(99), 1),
+            "max_ms": round(max(self.samples), 1) if self.samples else 0.0,
+        }
+
+_recorders: Dict[str, LatencyRecorder] = {}
+
+def get_recorder(name: str) -> LatencyRecorder:
+    if name not in _recorders:
+        _recorders[name] = LatencyRecorder()
+    return _recorders[name]
+
+def record_since(name: str, started: float):
+    """time.perf_counter() 기준 시작 시각부터의 경과 시간 기록"""
+    get_recorder(name).record((time.perf_counter() - started) * 1000)
+
+def get_summary(prefix: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        name: rec.summary() for name, rec in _recorders.items()
+        if prefix is None or name.startswith(prefix)
+    }
+
+# ----------------------------
+# 구간별 소요 시간 (요청 1건)
+# ----------------------------
+class SpanTrace:
+    """mark(stage)마다 직전 mark 이후 걸린 시간을 구간으로 기록.
+    finish()에서 "{name}.{stage}" / "{name}.total" 기록기로 집계"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.spans: List[Tuple[str, float]] = []
+        self.finished = False
+
+    def mark(self, stage: str) -> float:
+        now = time.perf_counter()
+        ms = (now - self.last) * 1000
+        self.spans.append((stage, ms))
+        self.last = now
+        return ms
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def breakdown(self) -> str:
+        return " ".join(f"{stage}={ms:.0f}ms" for stage, ms in self.spans)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        for stage, ms in self.spans:
+            get_recorder(f"{self.name}.{stage}").record(ms)
+        get_recorder(f"{self.name}.total").record(self.elapsed_ms())
@@ -0,0 +1,329 @@
+import os
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import PDF_FONT_PATH, PDF_MAX_PAGES, PDF_WORKERS
+
+# ----------------------------
+# 방문 기록 PDF 보고서
+# ----------------------------
+# 매장별 구역으로 나눠 필터에 맞는 방문 기록 전체를 여러 페이지에 그린다.
+# 행 높이가 고정이라 그리기 전에 페이지 수를 정확히 계산할 수 있고,
+# PDF_MAX_PAGES를 넘으면 렌더링하지 않고 거절한다. (기간을 줄이거나 CSV/XLSX 사용)
+# 렌더링은 프로세스 풀에서 실행되고, 방문 기록은 자식 프로세스가 저장소에서 직접 읽는다.
+# 한글은 PDF_FONT_PATH 글꼴(기본 fonts/NanumGothic.ttf, OFL)을 임베드해서만 그린다.
+# 임베드되지 않는 CID 글꼴은 한글 글꼴이 없는 뷰어에서 네모로 보이므로 대신 쓰지 않는다.
+REPORT_FONT = "ReportFont"          # PDF_FONT_PATH 글꼴을 등록하는 이름
+
+MARGIN = 36
+PAGE_HEADER_H = 34   # 제목 + 페이지 번호
+PAGE_FOOTER_H = 14
+SUMMARY_H = 48       # 첫 페이지 요약 (기간, 생성 시각, 매장 수, 방문 수)
+SECTION_H = 22       # 매장 구역 제목
+TABLE_HEAD_H = 16    # 표 머리글 (페이지가 넘어가면 반복)
+ROW_H = 13
+
+COLUMNS = [("닉네임", 0.34), ("유저아이디", 0.30), ("방문일", 0.20), ("시각", 0.16)]
+
+class ReportTooLarge(Exception):
+    def __init__(self, pages: int, max_pages: int):
+        super().__init__(pages, max_pages)   # args 그대로 두어야 프로세스 풀에서 pickle 왕복 가능
+        self.pages = pages
+        self.max_pages = max_pages
+
+    def __str__(self):
+        return f"{self.pages} pages > {self.max_pages}"
+
+def too_large_message(pages: int, max_pages: int = PDF_MAX_PAGES) -> str:
+    return f"PDF는 최대 {max_pages}페이지까지 만들 수 있습니다 (예상 {pages}페이지). 기간을 줄이거나 CSV/XLSX로 내보내 주세요."
+
+class ReportFontMissing(Exception):
+    def __init__(self, path: str, reason: str):
+        super().__init__(path, reason)   # 프로세스 풀에서 pickle 왕복 가능하게
+        self.path = path
+        self.reason = reason
+
+    def __str__(self):
+        return f"PDF font not available ({self.path}): {self.reason}"
+
+FONT_MISSING_MESSAGE = "PDF 한글 글꼴 파일을 읽을 수 없어 보고서를 만들 수 없습니다. 관리자에게 문의해 주세요."
+
+def register_report_font() -> str:
+    """보고서 글꼴 등록 후 이름 반환 (사용한 글자만 임베드). 글꼴을 읽을 수 없으면 ReportFontMissing"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if REPORT_FONT in pdfmetrics.getRegisteredFontNames():
+        return REPORT_FONT
+    if not PDF_FONT_PATH or not os.path.isfile(PDF_FONT_PATH):
+        raise ReportFontMissing(PDF_FONT_PATH, "file not found")
+    try:
+        pdfmetrics.registerFont(TTFont(REPORT_FONT, PDF_FONT_PATH))
+    except Exception as e:
+        raise ReportFontMissing(PDF_FONT_PATH, str(e)) from e
+    return REPORT_FONT
+
+# ----------------------------
+# 페이지 배치 (계산 / 그리기 공용)
+# ----------------------------
+class _Layout:
+    """canvas가 None이면 페이지 수만 계산"""
+
+    def __init__(self, canvas=None, font: str = None, title: str = "", total_pages: int = 0):
+        from reportlab.lib.pagesizes import A4
+
+        self.canvas = canvas
+        self.font = font
+        self.title = title
+        self.total_pages = total_pages
+        self.page_w, self.page_h = A4
+        self.top = self.page_h - MARGIN - PAGE_HEADER_H
+        self.bottom = MARGIN + PAGE_FOOTER_H
+        self.table_w = self.page_w - MARGIN * 2
+        self.col_x = []
+        x = MARGIN
+        for _, ratio in COLUMNS:
+            self.col_x.append(x + 4)
+            x += self.table_w * ratio
+        self.pages = 0
+        self.y = 0.0
+
+    def new_page(self):
+        if self.canvas and self.pages:
+            self.canvas.showPage()
+        self.pages += 1
+        self.y = self.top
+        if self.canvas:
+            c = self.canvas
+            c.setFont(self.font, 12)
+            c.setFillGray(0)
+            c.drawString(MARGIN, self.page_h - MARGIN - 12, self.title)
+            c.setFont(self.font, 9)
+            c.drawRightString(self.page_w - MARGIN, self.page_h - MARGIN - 12, f"{self.pages} / {self.total_pages}")
+            c.setStrokeGray(0.6)
+            c.line(MARGIN, self.page_h - MARGIN - 20, self.page_w - MARGIN, self.page_h - MARGIN - 20)
+
+    def summary(self, lines: List[str]):
+        if self.canvas:
+            self.canvas.setFont(self.font, 10)
+            for i, line in enumerate(lines[:3]):
+                self.canvas.drawString(MARGIN, self.y - 12 - i * 14, line)
+        self.y -= SUMMARY_H
+
+    def _section_title(self, text: str):
+        if self.canvas:
+            self.canvas.setFont(self.font, 11)
+            self.canvas.setFillGray(0)
+            self.canvas.drawString(MARGIN, self.y - 15, text)
+        self.y -= SECTION_H
+
+    def _table_head(self):
+        if self.canvas:
+            c = self.canvas
+            c.setFillColorRGB(0.267, 0.447, 0.769)
+            c.rect(MARGIN, self.y - TABLE_HEAD_H, self.table_w, TABLE_HEAD_H, stroke=0, fill=1)
+            c.setFillGray(1)
+            c.setFont(self.font, 9)
+            for (name, _), x in zip(COLUMNS, self.col_x):
+                c.drawString(x, self.y - 11, name)
+        self.y -= TABLE_HEAD_H
+
+    def _rows(self, rows: List[list]):
+        c = self.canvas
+        c.setFillGray(0.94)
+        for i in range(1, len(rows), 2):
+            c.rect(MARGIN, self.y - (i + 1) * ROW_H, self.table_w, ROW_H, stroke=0, fill=1)
+
+        # 셀마다 drawString 대신 텍스트 객체 하나에 모아 그리고, 다음 셀로는 상대 이동(Td)만 한다
+        # (셀마다 좌표 행렬 6개 숫자를 쓰는 setTextOrigin보다 PDF 숫자 변환이 1/3)
+        text = c.beginText(self.col_x[0], self.y - 9.5)
+        text.setFont(self.font, 8)
+        text.setFillGray(0)
+        steps = [b - a for a, b in zip(self.col_x, self.col_x[1:])]
+        back = self.col_x[0] - self.col_x[-1]
+        for i, row in enumerate(rows):
+            if i:
+                text.moveCursor(back, ROW_H)
+            text.textOut(row[0])
+            for value, dx in zip(row[1:], steps):
+                text.moveCursor(dx, 0)
+                text.textOut(value)
+        c.drawText(text)
+
+    def section(self, title: str, count: int, rows: Optional[Iterable[list]] = None):
+        """매장 구역 (제목 + 표). 페이지가 넘어가면 제목(계속)과 표 머리글을 다시 그린다"""
+        if self.y - (SECTION_H + TABLE_HEAD_H + ROW_H) < self.bottom:
+            self.new_page()
+        self._section_title(title)
+        self._table_head()
+
+        it = iter(rows) if rows is not None else None
+        remaining = count
+        while remaining > 0:
+            fit = int((self.y - self.bottom) // ROW_H)
+            if fit <= 0:
+                self.new_page()
+                self._section_title(f"{title} (계속)")
+                self._table_head()
+                continue
+            take = min(fit, remaining)
+            if it is not None:
+                batch = [row for _, row in zip(range(take), it)]
+                self._rows(batch)
+            self.y -= take * ROW_H
+            remaining -= take
+        self.y -= 8
+
+def _fit(text: str, limit: int) -> str:
+    """열 너비에 맞게 자르기 (글자 수 기준, 한글은 2칸으로 계산)"""
+    width = 0
+    for i, ch in enumerate(text):
+        width += 2 if ord(ch) > 0x2E80 else 1
+        if width > limit:
+            return text[:i] + "…"
+    return text
+
+def report_row(visit: Dict[str, Any]) -> list:
+    return [
+        _fit(str(visit.get("nickname", "")), 34),
+        str(visit.get("user_id", "")),
+        visit.get("visit_date", ""),
+        visit.get("visit_time", ""),
+    ]
+
+def count_pages(sections: List[tuple]) -> int:
+    """[(제목, 행 수, ...)] → 전체 페이지 수"""
+    layout = _Layout()
+    layout.new_page()
+    layout.summary([])
+    for section in sections:
+        layout.section(section[0], section[1])
+    return layout.pages
+
+def build_report_pdf(path: str, sections: List[tuple], title: str, summary_lines: List[str],
+                     max_pages: int = PDF_MAX_PAGES) -> Dict[str, int]:
+    """[(구역 제목, 행 수, 행 iterable을 만드는 함수)] → PDF 파일. {"pages", "rows"} 반환"""
+    from reportlab.pdfgen import canvas
+    from reportlab import rl_config
+
+    pages = count_pages(sections)
+    if max_pages and pages > max_pages:
+        raise ReportTooLarge(pages, max_pages)
+
+    font = register_report_font()
+    # 압축 스트림을 ASCII85 없이 바이너리로 (프로세스 전역 설정이라 끝나면 되돌림)
+    use_a85 = rl_config.useA85
+    rl_config.useA85 = 0
+    try:
+        c = canvas.Canvas(path, pageCompression=1)
+        c.setTitle(title)
+        layout = _Layout(c, font, title, pages)
+        layout.new_page()
+        layout.summary(summary_lines)
+
+        rows = 0
+        for section_title, count, make_rows in sections:
+            layout.section(section_title, count, make_rows())
+            rows += count
+
+        c.showPage()
+        c.save()
+    finally:
+        rl_config.useA85 = use_a85
+    return {"pages": layout.pages, "rows": rows}
+
+# ----------------------------
+# 저장소 → 보고서 (프로세스 풀에서 실행)
+# ----------------------------
+def plan_report(guild_id=None, store_code: str = None, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
+    """매장별 구역 [(코드, 매장명, 방문 수)]와 예상 페이지 수"""
+    from database import get_stores, count_export_visits_by_store
+
+    stores = get_stores(guild_id)
+    counts = count_export_visits_by_store(guild_id, store_code, start_date, end_date)
+    sections = [
+        (code, stores.get(code, {}).get("store_name", code), counts[code])
+        for code in sorted(counts)
+    ]
+
+    pages = count_pages([(section_title(*s), s[2]) for s in sections])
+    return {"sections": sections, "pages": pages, "rows": sum(s[2] for s in sections)}
+
+def section_title(code: str, name: str, count: int) -> str:
+    return f"{name} ({code}) · {count}건"
+
+def render_report(path: str, filters: Dict[str, Any], max_pages: int = PDF_MAX_PAGES) -> Dict[str, int]:
+    """필터에 맞는 방문 기록 보고서를 path에 저장 (프로세스 풀용 최상위 함수)"""
+    from database import iter_export_visits, _now_kst
+
+    plan = plan_report(**filters)
+    if max_pages and plan["pages"] > max_pages:
+        raise ReportTooLarge(plan["pages"], max_pages)
+
+    # 방문 기록을 한 번 훑어 매장별로 나눈다 (페이지 한도 안이므로 행 수가 제한됨)
+    rows_by_store: Dict[str, List[list]] = {code: [] for code, _, _ in plan["sections"]}
+    for visit in iter_export_visits(**filters):
+        bucket = rows_by_store.get(visit["store_code"])
+        if bucket is not None:
+            bucket.append(report_row(visit))
+
+    # 계획과 순회 사이에 방문이 추가됐으면 행 수를 계획에 맞춰 자른다 (페이지 번호 n / N 유지)
+    sections = [
+        (section_title(code, name, count), count, (lambda rows=rows_by_store[code][:count]: rows))
+        for code, name, count in plan["sections"]
+    ]
+    period = f"{filters.get('start_date') or '처음'} ~ {filters.get('end_date') or '오늘'}"
+    summary_lines = [
+        f"기간: {period}",
+        f"생성: {_now_kst().strftime('%Y-%m-%d %H:%M')} KST",
+        f"매장 {len(sections)}곳 · 방문 {plan['rows']}건",
+    ]
+    return build_report_pdf(path, sections, "방문 기록 보고서", summary_lines, max_pages)
+
+_pool = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, PDF_WORKERS))
+    return _pool
+
+async def render_report_async(path: str, filters: Dict[str, Any], max_pages: int = PDF_MAX_PAGES) -> Dict[str, int]:
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), render_report, path, filters, max_pages)
+    except BrokenProcessPool:
+        # 자식 프로세스가 죽으면 풀을 버리고 다음 요청에서 새로 만든다
+        _pool = None
+        raise
+
+# ----------------------------
+# 처리량 측정: python pdf_report.py [행 수] [매장 수]
+# ----------------------------
+def benchmark(rows: int = 100000, stores: int = 20, path: str = "report_benchmark.pdf") -> Dict[str, Any]:
+    """가짜 방문 기록으로 렌더링 속도(행/초) 측정. 저장소는 건드리지 않는다"""
+    per_store = [rows // stores + (1 if i < rows % stores else 0) for i in range(stores)]
+
+    def fake_rows(store: int, count: int):
+        return lambda: ([f"방문자{store}-{i % 977}", str(100000000000000000 + i), "2026-01-01", "12:00:00"] for i in range(count))
+
+    sections = [(section_title(f"{i:04d}", f"매장{i}", n), n, fake_rows(i, n)) for i, n in enumerate(per_store)]
+    started = time.perf_counter()
+    result = build_report_pdf(path, sections, "방문 기록 보고서 (벤치마크)", [f"행 {rows}"], max_pages=0)
+    elapsed = time.perf_counter() - started
+    result.update({
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": int(rows / elapsed) if elapsed else 0,
+        "bytes": os.path.getsize(path),
+    })
+    return result
+
+if __name__ == "__main__":
+    import sys
+
+    args = [int(a) for a in sys.argv[1:3]]
+    print(benchmark(*args))
@@ -0,0 +1,166 @@
+import os
+import asyncio
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from typing import Tuple, List, Dict
+from concurrent.futures import ProcessPoolExecutor
+
+import qrcode
+
+from config import QR_CACHE_DIR, QR_CACHE_MAX_ENTRIES
+
+# ----------------------------
+# QR 코드 PNG 렌더링 캐시
+# ----------------------------
+# (URL, box_size, border) → PNG bytes
+# 메모리 LRU + 디스크(data/qr_cache) 저장. 같은 QR은 한 번만 렌더링한다.
+# 디스크도 QR_CACHE_MAX_ENTRIES개까지만 두고, 오래 안 쓴 파일(mtime)부터 지운다.
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+_cache: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict()
+_lock = threading.Lock()  # 워커 스레드 렌더링과 동시 접근 보호
+
+os.makedirs(QR_CACHE_DIR, exist_ok=True)
+
+def _cache_key(url: str, box_size: int, border: int) -> tuple:
+    return (url, box_size, border)
+
+def _disk_path(key: tuple) -> str:
+    digest = hashlib.sha256(repr(key).encode()).hexdigest()
+    return os.path.join(QR_CACHE_DIR, f"{digest}.png")
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+def _remember(key: tuple, data: bytes) -> Tuple[bytes, str]:
+    entry = (data, _etag(data))
+    with _lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > QR_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return entry
+
+def _render(url: str, box_size: int, border: int) -> bytes:
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+def _render_key(key: tuple) -> bytes:
+    """프로세스 풀에서 실행 (pickle 가능한 최상위 함수)"""
+    return _render(*key)
+
+def _read_disk(key: tuple):
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)   # 최근 사용 표시 (디스크 정리 순서)
+        return data
+    except OSError:
+        return None
+
+def _write_disk(key: tuple, data: bytes):
+    path = _disk_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"QR cache write error: {e}")
+
+def _prune_disk():
+    """오래 안 쓴 PNG부터 삭제 (QR_CACHE_MAX_ENTRIES 유지)"""
+    try:
+        entries = [e for e in os.scandir(QR_CACHE_DIR) if e.is_file() and e.name.endswith(".png")]
+    except OSError:
+        return
+    if len(entries) <= QR_CACHE_MAX_ENTRIES:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - QR_CACHE_MAX_ENTRIES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def _load_or_render(key: tuple) -> Tuple[bytes, str]:
+    data = _read_disk(key)
+    if data is None:
+        data = _render(*key)
+        _write_disk(key, data)
+        _prune_disk()
+    return _remember(key, data)
+
+def get_cached_qr(url: str, box_size: int = QR_BOX_SIZE, border: int = QR_BORDER):
+    """메모리 캐시에 있으면 (PNG bytes, ETag), 없으면 None"""
+    key = _cache_key(url, box_size, border)
+    with _lock:
+        entry = _cache.get(key)
+        if entry:
+            _cache.move_to_end(key)
+    return entry
+
+def render_qr_png(url: str, box_size: int = QR_BOX_SIZE, border: int = QR_BORDER) -> Tuple[bytes, str]:
+    """QR 코드 PNG + ETag (동기)"""
+    return get_cached_qr(url, box_size, border) or _load_or_render(_cache_key(url, box_size, border))
+
+async def render_qr_png_async(url: str, box_size: int = QR_BOX_SIZE, border: int = QR_BORDER) -> Tuple[bytes, str]:
+    """QR 코드 PNG + ETag. 캐시에 없으면 워커 스레드에서 렌더링"""
+    entry = get_cached_qr(url, box_size, border)
+    if entry:
+        return entry
+    return await asyncio.to_thread(_load_or_render, _cache_key(url, box_size, border))
+
+# ----------------------------
+# 여러 QR 일괄 렌더링 (프로세스 풀)
+# ----------------------------
+PROCESS_POOL_MIN_ITEMS = 16   # 이보다 적으면 프로세스 풀 없이 렌더링
+_pool = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2)
+    return _pool
+
+def render_qr_batch(urls: List[str], box_size: int = QR_BOX_SIZE, border: int = QR_BORDER) -> List[bytes]:
+    """여러 URL의 QR PNG를 순서대로 반환. 캐시에 없는 것만 병렬 렌더링"""
+    keys = [_cache_key(url, box_size, border) for url in urls]
+    results: Dict[tuple, bytes] = {}
+    missing = []
+
+    for key in dict.fromkeys(keys):
+        entry = get_cached_qr(*key)
+        data = entry[0] if entry else _read_disk(key)
+        if data is None:
+            missing.append(key)
+        else:
+            results[key] = data
+
+    if missing:
+        if len(missing) >= PROCESS_POOL_MIN_ITEMS:
+            workers = os.cpu_count() or 2
+            chunksize = max(1, len(missing) // (workers * 4))
+            rendered = list(_get_pool().map(_render_key, missing, chunksize=chunksize))
+        else:
+            rendered = [_render(*key) for key in missing]
+
+        for key, data in zip(missing, rendered):
+            _write_disk(key, data)
+            _remember(key, data)
+            results[key] = data
+        _prune_disk()
+
+    return [results[key] for key in keys]
+
+async def render_qr_batch_async(urls: List[str], box_size: int = QR_BOX_SIZE, border: int = QR_BORDER) -> List[bytes]:
+    return await asyncio.to_thread(render_qr_batch, urls, box_size, border)
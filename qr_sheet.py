@@ -0,0 +1,136 @@
+import re
+import asyncio
+import zipfile
+from io import BytesIO
+from typing import Dict, Any, List, Optional
+
+from qr import render_qr_batch_async
+from database import _now_kst
+from pdf_report import register_report_font
+
+# ----------------------------
+# 매장 QR 일괄 출력 (PDF 시트 / PNG ZIP)
+# ----------------------------
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+
+def store_channel_url(store: dict) -> Optional[str]:
+    """체크인 채널 URL (QR에 들어가는 주소)"""
+    guild_id = store.get("guild_id")
+    channel_id = store.get("channel_id")
+    if not guild_id or not channel_id:
+        return None
+    return f"https://discord.com/channels/{guild_id}/{channel_id}"
+
+def filter_stores(stores: Dict[str, Any], codes: Optional[List[str]] = None, owner_id: Optional[int] = None) -> List[tuple]:
+    """(코드, 매장) 목록. 코드/소유자 필터, QR 주소가 없는 매장 제외"""
+    result = []
+    for code, store in sorted(stores.items()):
+        if codes and code not in codes:
+            continue
+        if owner_id is not None and store.get("owner_id") != owner_id:
+            continue
+        if not store_channel_url(store):
+            continue
+        result.append((code, store))
+    return result
+
+def parse_codes(raw: Optional[str]) -> List[str]:
+    """쉼표/공백 구분 매장 코드 문자열을 리스트로"""
+    return [c for c in re.split(r"[,\s]+", raw or "") if c]
+
+def _safe_filename(name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("_") or "store"
+
+def _fit_text(text: str, font: str, size: int, width: float) -> str:
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + "…", font, size) > width:
+        text = text[:-1]
+    return text + "…"
+
+def build_qr_pdf(items: List[tuple]) -> bytes:
+    """[(코드, 매장명, PNG bytes)] → A4 다중 페이지 PDF"""
+    from reportlab import rl_config
+
+    # 이미지 스트림을 ASCII85 대신 바이너리로 (순수 파이썬 인코더가 가장 느린 구간).
+    # 프로세스 전역 설정이므로 이 문서를 만드는 동안만 바꾸고 되돌린다.
+    use_a85 = rl_config.useA85
+    rl_config.useA85 = 0
+    try:
+        return _draw_qr_pdf(items)
+    finally:
+        rl_config.useA85 = use_a85
+
+def _draw_qr_pdf(items: List[tuple]) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+    from PIL import Image
+
+    # 매장명 한글은 PDF 보고서와 같은 임베드 글꼴(나눔고딕)로 그린다
+    font = register_report_font()
+
+    output = BytesIO()
+    c = canvas.Canvas(output, pagesize=A4)
+    page_w, page_h = A4
+    margin = 36
+    header_h = 28
+    cell_w = (page_w - margin * 2) / SHEET_COLUMNS
+    cell_h = (page_h - margin * 2 - header_h) / SHEET_ROWS
+    qr_size = min(cell_w, cell_h) - 44
+
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+    total_pages = max(1, (len(items) + per_page - 1) // per_page)
+    printed_at = _now_kst().strftime("%Y-%m-%d %H:%M")
+
+    for page in range(total_pages):
+        c.setFont(font, 12)
+        c.drawString(margin, page_h - margin - 12, f"매장 체크인 QR 코드  ({printed_at} KST)")
+        c.drawRightString(page_w - margin, page_h - margin - 12, f"{page + 1} / {total_pages}")
+
+        for i, (code, name, png) in enumerate(items[page * per_page:(page + 1) * per_page]):
+            col = i % SHEET_COLUMNS
+            row = i // SHEET_COLUMNS
+            x = margin + col * cell_w
+            top = page_h - margin - header_h - row * cell_h
+
+            c.setStrokeGray(0.8)
+            c.rect(x + 4, top - cell_h + 4, cell_w - 8, cell_h - 8)
+
+            qr_x = x + (cell_w - qr_size) / 2
+            qr_y = top - 10 - qr_size
+            # 흑백 QR은 그레이스케일로 넣어 RGB 대비 이미지 데이터 1/3
+            c.drawImage(ImageReader(Image.open(BytesIO(png)).convert("L")), qr_x, qr_y, qr_size, qr_size)
+
+            c.setFont(font, 11)
+            c.drawCentredString(x + cell_w / 2, qr_y - 14, _fit_text(name, font, 11, cell_w - 20))
+            c.setFont(font, 9)
+            c.drawCentredString(x + cell_w / 2, qr_y - 27, f"코드 {code}")
+
+        c.showPage()
+
+    c.save()
+    return output.getvalue()
+
+def build_qr_zip(items: List[tuple]) -> bytes:
+    """[(코드, 매장명, PNG bytes)] → PNG 묶음 ZIP"""
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as zf:
+        for code, name, png in items:
+            zf.writestr(f"qr_{code}_{_safe_filename(name)}.png", png)
+    return output.getvalue()
+
+async def build_store_qr_sheet(store_items: List[tuple], fmt: str = "pdf") -> bytes:
+    """[(코드, 매장)] → PDF 또는 ZIP bytes. 렌더링은 프로세스 풀, 조립은 워커 스레드"""
+    urls = [store_channel_url(store) for _, store in store_items]
+    pngs = await render_qr_batch_async(urls)
+    items = [
+        (code, store.get("store_name", code), png)
+        for (code, store), png in zip(store_items, pngs)
+    ]
+
+    if fmt == "zip":
+        return await asyncio.to_thread(build_qr_zip, items)
+    return await asyncio.to_thread(build_qr_pdf, items)
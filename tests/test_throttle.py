@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import throttle
+
+
+def setup_function():
+    throttle._failures.clear()
+
+
+def test_free_attempts_are_not_locked():
+    for _ in range(throttle.FREE_ATTEMPTS):
+        throttle.record_failure(1, "0001")
+    assert throttle.check_lockout(1, "0001") == 0
+
+
+def test_lockout_starts_after_free_attempts_and_doubles():
+    for _ in range(throttle.FREE_ATTEMPTS + 1):
+        state = throttle.record_failure(1, "0001")
+    first = state["locked_until"] - state["last"]
+    assert first == throttle.LOCKOUT_BASE_SECONDS
+    assert throttle.check_lockout(1, "0001") > 0
+
+    state = throttle.record_failure(1, "0001")
+    assert state["locked_until"] - state["last"] == throttle.LOCKOUT_BASE_SECONDS * 2
+
+
+def test_success_clears_failures():
+    for _ in range(throttle.FREE_ATTEMPTS + 1):
+        throttle.record_failure(1, "0001")
+    throttle.record_success(1, "0001")
+    assert throttle.check_lockout(1, "0001") == 0
@@ -0,0 +1,55 @@
+import time
+from typing import Dict, Any, Optional
+
+# ----------------------------
+# 체크인 실패 제한 (유저 + 매장 단위)
+# ----------------------------
+# 무료 시도 횟수(FREE_ATTEMPTS)를 넘긴 뒤부터 실패할 때마다 잠금 시간이 두 배로 늘어난다.
+# 30s → 60s → 120s → ... (최대 LOCKOUT_MAX_SECONDS)
+# 잠금 중인 요청은 Discord API를 호출하기 전에 거절한다.
+FREE_ATTEMPTS = 3
+LOCKOUT_BASE_SECONDS = 30
+LOCKOUT_MAX_SECONDS = 3600
+FAILURE_RESET_SECONDS = 3600   # 마지막 실패 후 이 시간이 지나면 카운터 초기화
+ALERT_WINDOW_SECONDS = 60      # 연속 실패 알림은 이 간격으로 모아서 전송
+
+_failures: Dict[tuple, Dict[str, Any]] = {}
+
+def _prune(now: float):
+    expired = [k for k, v in _failures.items() if now - v["last"] > FAILURE_RESET_SECONDS]
+    for k in expired:
+        del _failures[k]
+
+def get_failure_state(user_id: int, store_code: str) -> Optional[Dict[str, Any]]:
+    return _failures.get((user_id, store_code))
+
+def check_lockout(user_id: int, store_code: str) -> int:
+    """잠금 남은 시간(초). 잠금이 아니면 0"""
+    state = _failures.get((user_id, store_code))
+    if not state:
+        return 0
+    remaining = state["locked_until"] - time.time()
+    return int(remaining) + 1 if remaining > 0 else 0
+
+def record_failure(user_id: int, store_code: str) -> Dict[str, Any]:
+    """실패 기록 후 상태 반환 (count, locked_until, alert_job_id)"""
+    now = time.time()
+    _prune(now)
+
+    key = (user_id, store_code)
+    state = _failures.get(key)
+    if not state:
+        state = {"count": 0, "last": now, "locked_until": 0.0, "alert_job_id": None}
+        _failures[key] = state
+
+    state["count"] += 1
+    state["last"] = now
+
+    over = state["count"] - FREE_ATTEMPTS
+    if over > 0:
+        lockout = min(LOCKOUT_MAX_SECONDS, LOCKOUT_BASE_SECONDS * (2 ** min(over - 1, 20)))
+        state["locked_until"] = now + lockout
+    return state
+
+def record_success(user_id: int, store_code: str):
+    _failures.pop((user_id, store_code), None)
@@ -1,19 +1,40 @@
 import os
+import json
+import base64
+import hashlib
+import asyncio
+import tempfile
 from io import BytesIO
-from datetime import datetime
+from datetime import datetime, date
+from typing import Optional, Callable, Any
+from collections import OrderedDict
 
 from fastapi import FastAPI, Request, Query, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, FileResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from starlette.background import BackgroundTask
 
+from config import PDF_MAX_PAGES, STREAM_MAX_CLIENTS
 from database import (
-    verify_token, get_stores, get_store, get_store_visits,
-    get_all_visits_for_export, get_daily_stats, get_store_stats, _now_kst
+    verify_token, get_stores, get_store,
+    get_daily_stats, get_visitor_stats, store_guild_id,
+    get_visits_page, get_dashboard_summary, get_store_overview, iter_export_visits, get_data_version, _now_kst
 )
+from exports import iter_csv, write_visits_xlsx, export_filename
+from export_jobs import (
+    EXPORT_FORMATS, create_export_job, get_export_job, job_info, start_export_workers, stop_export_workers
+)
+from analytics import get_hourly_heatmap, get_peak_hours, get_period_comparison, PeriodError
+from live import subscribe, unsubscribe, client_count, start_live, stop_live
+from pdf_report import (
+    plan_report, render_report_async, register_report_font, ReportTooLarge, ReportFontMissing,
+    too_large_message, FONT_MISSING_MESSAGE
+)
+from qr_sheet import build_store_qr_sheet, filter_stores, parse_codes
 
 # ----------------------------
 # App Setup
@@ -25,6 +46,20 @@ limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+@app.on_event("startup")
+async def on_startup():
+    start_export_workers()
+    start_live()
+    try:
+        register_report_font()
+    except ReportFontMissing as e:
+        print(f"[ERROR] {e} - PDF 보고서를 만들 수 없습니다. PDF_FONT_PATH를 확인하세요.")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_export_workers()
+    await stop_live()
+
 # ----------------------------
 # 토큰 검증 헬퍼
 # ----------------------------
@@ -38,6 +73,59 @@ def check_token(token: str):
 
     return token_data
 
+def check_store(token_data: dict, store_code: str) -> dict:
+    """토큰의 서버에 속한 매장만 허용 (다른 서버 매장은 404)"""
+    store = get_store(store_code)
+    guild_id = token_data.get("guild_id")
+    if not store or (guild_id and store_guild_id(store) != int(guild_id)):
+        raise HTTPException(status_code=404, detail="매장을 찾을 수 없습니다.")
+    return store
+
+# ----------------------------
+# 응답 캐시 (ETag + LRU)
+# ----------------------------
+# 데이터 버전(get_data_version)이 같으면 응답도 같으므로 (엔드포인트, 서버, 파라미터, 버전)을 키로
+# 직렬화한 JSON을 LRU에 보관하고, 같은 키의 ETag로 If-None-Match에 304 응답한다.
+# 오늘 날짜가 들어가는 응답(요약, 일별 통계, 매장 목록)은 날짜도 버전에 포함한다.
+API_CACHE_MAX_ENTRIES = 256
+_api_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def _json_body(compute: Callable[[], Any]) -> bytes:
+    return json.dumps(compute(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+async def cached_json(request: Request, endpoint: str, token_data: dict, params: dict,
+                      compute: Callable[[], Any], store_code: str = None, dated: bool = False) -> Response:
+    """데이터 버전이 바뀌지 않았으면 304 또는 저장해 둔 응답, 바뀌었으면 compute() 결과.
+    버전 확인과 compute()는 파일 읽기/집계 재계산이 있을 수 있어 워커 스레드에서 실행 (SSE 등 다른 요청을 막지 않도록)"""
+    guild_id = token_data.get("guild_id")
+    version = await asyncio.to_thread(get_data_version, guild_id, store_code)
+    if dated:
+        version += "@" + _now_kst().date().isoformat()
+
+    key = json.dumps([endpoint, guild_id, sorted(params.items()), version], default=str)
+    etag = '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = _api_cache.get(key)
+    if body is None:
+        body = await asyncio.to_thread(_json_body, compute)
+        _api_cache[key] = body
+        while len(_api_cache) > API_CACHE_MAX_ENTRIES:
+            _api_cache.popitem(last=False)
+    else:
+        _api_cache.move_to_end(key)
+    return Response(body, media_type="application/json", headers=headers)
+
 # ----------------------------
 # 대시보드 페이지
 # ----------------------------
@@ -46,7 +134,7 @@ def check_token(token: str):
 async def dashboard(request: Request, token: str = Query(None)):
     token_data = check_token(token)
 
-    stores = get_stores()
+    stores = get_stores(token_data.get("guild_id"))
 
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
@@ -61,48 +149,124 @@ async def dashboard(request: Request, token: str = Query(None)):
 @app.get("/api/stores")
 @limiter.limit("60/minute")
 async def api_stores(request: Request, token: str = Query(None)):
-    check_token(token)
+    token_data = check_token(token)
+
+    return await cached_json(
+        request, "stores", token_data, {},
+        lambda: {"stores": get_store_overview(token_data.get("guild_id"))},
+        dated=True,
+    )
 
-    stores = get_stores()
-    result = []
+# ----------------------------
+# API: 방문 기록 (커서 페이지)
+# ----------------------------
+VISITS_PAGE_DEFAULT = 50
+VISITS_PAGE_MAX = 500
 
-    for code, store in stores.items():
-        visits = get_store_visits(code)
-        result.append({
-            "code": code,
-            "name": store.get("store_name", ""),
-            "visit_count": len(visits)
-        })
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, store_code, user_id = json.loads(raw)
+        return (str(created_at), str(store_code), int(user_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="잘못된 cursor입니다.")
 
-    return {"stores": result}
+@app.get("/api/visits")
+@limiter.limit("60/minute")
+async def api_visits(
+    request: Request,
+    token: str = Query(None),
+    store_code: str = Query(None),
+    cursor: str = Query(None),
+    limit: int = Query(VISITS_PAGE_DEFAULT, ge=1, le=VISITS_PAGE_MAX),
+    order: str = Query("desc")
+):
+    """방문 기록 페이지. 다음 페이지는 next_cursor로 요청"""
+    token_data = check_token(token)
+
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order는 asc 또는 desc만 가능합니다.")
+    if store_code:
+        check_store(token_data, store_code)
+
+    after = decode_cursor(cursor) if cursor else None
+
+    def compute():
+        page = get_visits_page(
+            guild_id=token_data.get("guild_id"),
+            store_code=store_code,
+            after=after,
+            limit=limit,
+            descending=order == "desc",
+        )
+        return {
+            "visits": page["visits"],
+            "next_cursor": encode_cursor(page["next"]) if page["next"] else None,
+            "total": page["total"],
+        }
+
+    params = {"store_code": store_code, "cursor": cursor, "limit": limit, "order": order}
+    return await cached_json(request, "visits", token_data, params, compute, store_code)
 
 # ----------------------------
-# API: 방문 기록
+# API: 요약 (대시보드 첫 화면)
 # ----------------------------
-@app.get("/api/visits")
+@app.get("/api/summary")
 @limiter.limit("60/minute")
-async def api_visits(request: Request, token: str = Query(None), store_code: str = Query(None)):
-    check_token(token)
+async def api_summary(request: Request, token: str = Query(None), store_code: str = Query(None)):
+    """방문 기록을 읽지 않고 집계 카운터만으로 응답"""
+    token_data = check_token(token)
+    if store_code:
+        check_store(token_data, store_code)
 
+    return await cached_json(
+        request, "summary", token_data, {"store_code": store_code},
+        lambda: get_dashboard_summary(token_data.get("guild_id"), store_code),
+        store_code, dated=True,
+    )
+
+# ----------------------------
+# API: 실시간 갱신 (SSE)
+# ----------------------------
+STREAM_HEARTBEAT_SECONDS = 15
+
+@app.get("/api/stream")
+@limiter.limit("30/minute")
+async def api_stream(request: Request, token: str = Query(None), store_code: str = Query(None)):
+    """새 방문(visit), 삭제(remove), 요약 숫자(summary), 다시 불러오기(resync) 이벤트"""
+    token_data = check_token(token)
     if store_code:
-        store = get_store(store_code)
-        if not store:
-            raise HTTPException(status_code=404, detail="매장을 찾을 수 없습니다.")
-
-        visits = get_store_visits(store_code)
-        visits_data = []
-        for v in visits:
-            visits_data.append({
-                "store_name": store.get("store_name", ""),
-                "username": v.get("username", ""),
-                "nickname": v.get("nickname", ""),
-                "visit_date": v.get("visit_date", ""),
-                "visit_time": v.get("visit_time", "")
-            })
-    else:
-        visits_data = get_all_visits_for_export()
+        check_store(token_data, store_code)
+
+    if client_count() >= STREAM_MAX_CLIENTS:
+        raise HTTPException(status_code=503, detail="실시간 접속자가 너무 많습니다. 잠시 후 다시 시도해 주세요.")
+    expires_at = datetime.fromisoformat(token_data["expires_at"])
+
+    async def events():
+        # 응답 본문이 시작될 때 등록해야 본문 전에 끊긴 접속도 finally에서 정리된다
+        sub = subscribe(token_data.get("guild_id"), store_code or None)
+        if sub is None:
+            return
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                message = await sub.next_message(STREAM_HEARTBEAT_SECONDS)
+                # 이벤트를 보내기 전에도 끊긴 접속과 만료된 토큰을 확인 (이벤트가 계속 와도 만료 시 종료)
+                if _now_kst() > expires_at or await request.is_disconnected():
+                    break
+                # 조용할 때는 연결 유지용 주석
+                yield message if message is not None else ": ping\n\n"
+        finally:
+            unsubscribe(sub)
 
-    return {"visits": visits_data}
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # ----------------------------
 # API: 일별 통계
@@ -110,10 +274,15 @@ async def api_visits(request: Request, token: str = Query(None), store_code: str
 @app.get("/api/stats/daily")
 @limiter.limit("60/minute")
 async def api_daily_stats(request: Request, token: str = Query(None), store_code: str = Query(None), days: int = Query(30)):
-    check_token(token)
+    token_data = check_token(token)
+    if store_code:
+        check_store(token_data, store_code)
 
-    stats = get_daily_stats(store_code, days)
-    return {"stats": stats}
+    return await cached_json(
+        request, "stats/daily", token_data, {"store_code": store_code, "days": days},
+        lambda: {"stats": get_daily_stats(store_code, days, token_data.get("guild_id"))},
+        store_code, dated=True,
+    )
 
 # ----------------------------
 # API: 방문자별 통계
@@ -121,77 +290,97 @@ async def api_daily_stats(request: Request, token: str = Query(None), store_code
 @app.get("/api/stats/visitors")
 @limiter.limit("60/minute")
 async def api_visitor_stats(request: Request, token: str = Query(None), store_code: str = Query(None)):
-    check_token(token)
+    token_data = check_token(token)
 
     if store_code:
-        stats = get_store_stats(store_code)
-    else:
-        # 전체 매장 통계
-        all_stats = {}
-        for code in get_stores().keys():
-            for stat in get_store_stats(code):
-                uid = stat["user_id"]
-                if uid not in all_stats:
-                    all_stats[uid] = stat.copy()
-                else:
-                    all_stats[uid]["count"] += stat["count"]
-        stats = sorted(all_stats.values(), key=lambda x: x["count"], reverse=True)
+        check_store(token_data, store_code)
 
-    return {"stats": stats}
+    return await cached_json(
+        request, "stats/visitors", token_data, {"store_code": store_code},
+        lambda: {"stats": get_visitor_stats(token_data.get("guild_id"), store_code)},
+        store_code,
+    )
 
 # ----------------------------
-# 내보내기: CSV
+# API: 시간대 분석 (히트맵, 피크 시간, 기간 비교)
 # ----------------------------
-@app.get("/api/export/csv")
-@limiter.limit("5/minute")
-async def export_csv(request: Request, token: str = Query(None), store_code: str = Query(None)):
-    check_token(token)
-
-    if store_code:
-        store = get_store(store_code)
-        visits = get_store_visits(store_code)
-        visits_data = []
-        store_name = store.get("store_name", store_code) if store else store_code
-        for v in visits:
-            vd = v.get("visit_date", "")
-            vt = v.get("visit_time", "")
-            visits_data.append({
-                "store_name": store_name,
-                "nickname": v.get("nickname", ""),
-                "user_id": v.get("user_id", ""),
-                "visit_datetime": f"{vd} {vt}".strip(),
-            })
-        visits_data.sort(key=lambda x: x["visit_datetime"], reverse=True)
-    else:
-        visits_data = get_all_visits_for_export()
+# 기간을 안 주면 히트맵/피크는 최근 28일, 비교는 최근 7일 vs 그 전 7일 (최대 366일)
+async def stats_period_response(request: Request, endpoint: str, token: str, store_code: Optional[str],
+                                start_date: Optional[str], end_date: Optional[str], compute: Callable[..., Any]) -> Response:
+    token_data = check_token(token)
+    filters = export_filters(token_data, store_code, start_date, end_date)
+    params = {k: v for k, v in filters.items() if k != "guild_id"}
+    try:
+        return await cached_json(request, endpoint, token_data, params, lambda: compute(**filters), filters["store_code"], dated=True)
+    except PeriodError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # CSV 생성
-    import csv
-    output = BytesIO()
+@app.get("/api/stats/heatmap")
+@limiter.limit("60/minute")
+async def api_stats_heatmap(request: Request, token: str = Query(None), store_code: str = Query(None),
+                            start_date: str = Query(None), end_date: str = Query(None)):
+    """요일 × 시간 방문 수 (7 × 24)와 요일별 평균"""
+    return await stats_period_response(request, "stats/heatmap", token, store_code, start_date, end_date, get_hourly_heatmap)
 
-    # UTF-8 BOM for Excel
-    output.write(b'\xef\xbb\xbf')
+@app.get("/api/stats/peaks")
+@limiter.limit("60/minute")
+async def api_stats_peaks(request: Request, token: str = Query(None), store_code: str = Query(None),
+                          start_date: str = Query(None), end_date: str = Query(None)):
+    """붐비는 시간 (상위 시간, 연속 3시간 구간, 요일별 피크)"""
+    return await stats_period_response(request, "stats/peaks", token, store_code, start_date, end_date, get_peak_hours)
 
-    import io
-    text_output = io.StringIO()
-    writer = csv.writer(text_output)
-    writer.writerow(["장소", "닉네임", "유저아이디", "방문시각"])
+@app.get("/api/stats/compare")
+@limiter.limit("60/minute")
+async def api_stats_compare(request: Request, token: str = Query(None), store_code: str = Query(None),
+                            start_date: str = Query(None), end_date: str = Query(None)):
+    """기간과 바로 앞 같은 길이 기간의 방문 수, 방문자 수, 시간대별 차이"""
+    return await stats_period_response(request, "stats/compare", token, store_code, start_date, end_date, get_period_comparison)
 
-    for v in visits_data:
-        writer.writerow([
-            v.get("store_name", ""),
-            v.get("nickname", ""),
-            v.get("user_id", ""),
-            v.get("visit_datetime", ""),
-        ])
+# ----------------------------
+# 내보내기: 공통 필터 (매장, 기간)
+# ----------------------------
+def parse_date_param(value: Optional[str], name: str) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name}은 YYYY-MM-DD 형식이어야 합니다.")
 
-    output.write(text_output.getvalue().encode('utf-8'))
-    output.seek(0)
+def export_filters(token_data: dict, store_code: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> dict:
+    """토큰 서버 + 매장 + 기간 필터 (iter_export_visits 인자)"""
+    if store_code:
+        check_store(token_data, store_code)
+    start_date = parse_date_param(start_date, "start_date")
+    end_date = parse_date_param(end_date, "end_date")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date가 end_date보다 늦습니다.")
+    return {
+        "guild_id": token_data.get("guild_id"),
+        "store_code": store_code or None,
+        "start_date": start_date,
+        "end_date": end_date,
+    }
 
-    filename = f"visits_{_now_kst().strftime('%Y%m%d_%H%M%S')}.csv"
+# ----------------------------
+# 내보내기: CSV
+# ----------------------------
+@app.get("/api/export/csv")
+@limiter.limit("5/minute")
+async def export_csv(
+    request: Request,
+    token: str = Query(None),
+    store_code: str = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+):
+    token_data = check_token(token)
+    filters = export_filters(token_data, store_code, start_date, end_date)
 
+    # 동기 제너레이터는 스레드풀에서 순회되므로 이벤트 루프를 막지 않는다
+    filename = export_filename("csv", _now_kst(), filters["start_date"], filters["end_date"])
     return StreamingResponse(
-        output,
+        iter_csv(iter_export_visits(**filters)),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -199,143 +388,175 @@ async def export_csv(request: Request, token: str = Query(None), store_code: str
 # ----------------------------
 # 내보내기: Excel
 # ----------------------------
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 @app.get("/api/export/xlsx")
 @limiter.limit("5/minute")
-async def export_xlsx(request: Request, token: str = Query(None), store_code: str = Query(None)):
-    check_token(token)
+async def export_xlsx(
+    request: Request,
+    token: str = Query(None),
+    store_code: str = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+):
+    token_data = check_token(token)
 
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill
+        import openpyxl  # noqa: F401
     except ImportError:
         raise HTTPException(status_code=500, detail="openpyxl 패키지가 설치되지 않았습니다.")
 
-    if store_code:
-        store = get_store(store_code)
-        visits = get_store_visits(store_code)
-        visits_data = []
-        store_name = store.get("store_name", store_code) if store else store_code
-        for v in visits:
-            vd = v.get("visit_date", "")
-            vt = v.get("visit_time", "")
-            visits_data.append({
-                "store_name": store_name,
-                "nickname": v.get("nickname", ""),
-                "user_id": v.get("user_id", ""),
-                "visit_datetime": f"{vd} {vt}".strip(),
-            })
-        visits_data.sort(key=lambda x: x["visit_datetime"], reverse=True)
-    else:
-        visits_data = get_all_visits_for_export()
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "방문 기록"
-
-    # 헤더
-    headers = ["장소", "닉네임", "유저아이디", "방문시각"]
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center")
-
-    # 데이터
-    for row, v in enumerate(visits_data, 2):
-        ws.cell(row=row, column=1, value=v.get("store_name", ""))
-        ws.cell(row=row, column=2, value=v.get("nickname", ""))
-        ws.cell(row=row, column=3, value=v.get("user_id", ""))
-        ws.cell(row=row, column=4, value=v.get("visit_datetime", ""))
-
-    # 열 너비
-    ws.column_dimensions['A'].width = 22
-    ws.column_dimensions['B'].width = 20
-    ws.column_dimensions['C'].width = 22
-    ws.column_dimensions['D'].width = 20
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    filename = f"visits_{_now_kst().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    filters = export_filters(token_data, store_code, start_date, end_date)
 
-    return StreamingResponse(
-        output,
+    # write-only 통합문서를 임시 파일에 쓰고 (워커 스레드) 파일로 응답한 뒤 삭제
+    fd, path = tempfile.mkstemp(suffix=".xlsx", prefix="export_")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(write_visits_xlsx, iter_export_visits(**filters), path)
+    except Exception:
+        _remove_file(path)
+        raise
+
+    return FileResponse(
+        path,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        filename=export_filename("xlsx", _now_kst(), filters["start_date"], filters["end_date"]),
+        background=BackgroundTask(_remove_file, path),
     )
 
 # ----------------------------
 # 내보내기: PDF
 # ----------------------------
+def report_too_large(pages: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=too_large_message(pages))
+
 @app.get("/api/export/pdf")
 @limiter.limit("3/minute")
-async def export_pdf(request: Request, token: str = Query(None), store_code: str = Query(None)):
-    check_token(token)
+async def export_pdf(
+    request: Request,
+    token: str = Query(None),
+    store_code: str = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+):
+    token_data = check_token(token)
 
     try:
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import A4
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.ttfonts import TTFont
+        import reportlab  # noqa: F401
     except ImportError:
         raise HTTPException(status_code=500, detail="reportlab 패키지가 설치되지 않았습니다.")
 
-    if store_code:
-        store = get_store(store_code)
-        visits = get_store_visits(store_code)
-        visits_data = []
-        store_name = store.get("store_name", store_code) if store else store_code
-        for v in visits:
-            vd = v.get("visit_date", "")
-            vt = v.get("visit_time", "")
-            visits_data.append({
-                "store_name": store_name,
-                "nickname": v.get("nickname", ""),
-                "user_id": v.get("user_id", ""),
-                "visit_datetime": f"{vd} {vt}".strip(),
-            })
-        visits_data.sort(key=lambda x: x["visit_datetime"], reverse=True)
-    else:
-        visits_data = get_all_visits_for_export()
-
-    output = BytesIO()
-    doc = SimpleDocTemplate(output, pagesize=A4)
-
-    # 테이블 데이터
-    table_data = [["장소", "닉네임", "유저아이디", "방문시각"]]
-    for v in visits_data[:100]:  # 최대 100건
-        table_data.append([
-            v.get("store_name", "")[:15],
-            v.get("nickname", "")[:15],
-            str(v.get("user_id", "")),
-            v.get("visit_datetime", ""),
-        ])
-
-    table = Table(table_data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.blue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-
-    doc.build([table])
-    output.seek(0)
-
-    filename = f"visits_{_now_kst().strftime('%Y%m%d_%H%M%S')}.pdf"
+    filters = export_filters(token_data, store_code, start_date, end_date)
 
-    return StreamingResponse(
-        output,
+    # 페이지 수를 먼저 계산해 한도를 넘으면 렌더링 없이 거절
+    plan = await asyncio.to_thread(plan_report, **filters)
+    if plan["pages"] > PDF_MAX_PAGES:
+        raise report_too_large(plan["pages"])
+
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="export_")
+    os.close(fd)
+    try:
+        await render_report_async(path, filters)
+    except ReportTooLarge as e:
+        _remove_file(path)
+        raise report_too_large(e.pages)
+    except ReportFontMissing as e:
+        _remove_file(path)
+        print(f"[ERROR] {e}")
+        raise HTTPException(status_code=503, detail=FONT_MISSING_MESSAGE)
+    except Exception:
+        _remove_file(path)
+        raise
+
+    return FileResponse(
+        path,
         media_type="application/pdf",
+        filename=export_filename("pdf", _now_kst(), filters["start_date"], filters["end_date"]),
+        background=BackgroundTask(_remove_file, path),
+    )
+
+# ----------------------------
+# 내보내기 작업 (백그라운드 생성 + 진행률 조회 + 캐시된 파일 다운로드)
+# ----------------------------
+
+def check_export_job(token_data: dict, job_id: str) -> dict:
+    """토큰과 같은 서버의 작업만 허용"""
+    job = get_export_job(job_id)
+    if not job or str(job["filters"].get("guild_id")) != str(token_data.get("guild_id")):
+        raise HTTPException(status_code=404, detail="내보내기 작업을 찾을 수 없습니다.")
+    return job
+
+def export_job_response(job: dict, token: str) -> dict:
+    info = job_info(job)
+    if job["status"] == "done":
+        info["download_url"] = f"/api/exports/{job['id']}/download?token={token}"
+    return info
+
+@app.post("/api/exports", status_code=202)
+@limiter.limit("20/minute")
+async def create_export(
+    request: Request,
+    token: str = Query(None),
+    format: str = Query("csv"),
+    store_code: str = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+):
+    token_data = check_token(token)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format은 csv, xlsx, pdf만 가능합니다.")
+
+    filters = export_filters(token_data, store_code, start_date, end_date)
+    job = create_export_job(format, filters, token_data.get("user_id"))
+    return export_job_response(job, token)
+
+@app.get("/api/exports/{job_id}")
+@limiter.limit("120/minute")
+async def export_status(request: Request, job_id: str, token: str = Query(None)):
+    token_data = check_token(token)
+    return export_job_response(check_export_job(token_data, job_id), token)
+
+@app.get("/api/exports/{job_id}/download")
+@limiter.limit("30/minute")
+async def export_download(request: Request, job_id: str, token: str = Query(None)):
+    token_data = check_token(token)
+    job = check_export_job(token_data, job_id)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail="아직 내보내기 파일을 만드는 중입니다.")
+    if not os.path.exists(job["path"]):
+        raise HTTPException(status_code=410, detail="내보내기 파일이 만료되었습니다. 다시 요청해 주세요.")
+
+    return FileResponse(job["path"], media_type=EXPORT_FORMATS[job["format"]], filename=job["filename"])
+
+# ----------------------------
+# 내보내기: 매장 QR 일괄 (PDF / ZIP)
+# ----------------------------
+@app.get("/api/export/qr")
+@limiter.limit("5/minute")
+async def export_qr(request: Request, token: str = Query(None), format: str = Query("pdf"), store_codes: str = Query(None)):
+    token_data = check_token(token)
+
+    if format not in ("pdf", "zip"):
+        raise HTTPException(status_code=400, detail="format은 pdf 또는 zip만 가능합니다.")
+
+    items = filter_stores(get_stores(token_data.get("guild_id")), parse_codes(store_codes))
+    if not items:
+        raise HTTPException(status_code=404, detail="출력할 매장이 없습니다.")
+
+    try:
+        data = await build_store_qr_sheet(items, format)
+    except ReportFontMissing as e:
+        print(f"[ERROR] {e}")
+        raise HTTPException(status_code=503, detail=FONT_MISSING_MESSAGE)
+    filename = f"store_qr_{_now_kst().strftime('%Y%m%d_%H%M%S')}.{format}"
+
+    return StreamingResponse(
+        BytesIO(data),
+        media_type="application/pdf" if format == "pdf" else "application/zip",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 